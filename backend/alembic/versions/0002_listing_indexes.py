@@ -0,0 +1,33 @@
+"""composite indexes for keyset-paginated listings
+
+Revision ID: 0002_listing_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_listing_indexes"
+down_revision: Union[str, Sequence[str], None] = "0001_initial_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-patient history: equality on patient_id, then (created_at, id) order
+    # and keyset comparison, all served by one index range scan.
+    op.create_index("ix_reports_patient_created", "reports", ["patient_id", "created_at", "id"])
+    op.create_index("ix_analyses_patient_created", "analyses", ["patient_id", "created_at", "id"])
+    # Global report listing, newest first
+    op.create_index("ix_reports_created", "reports", ["created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reports_created", table_name="reports")
+    op.drop_index("ix_analyses_patient_created", table_name="analyses")
+    op.drop_index("ix_reports_patient_created", table_name="reports")
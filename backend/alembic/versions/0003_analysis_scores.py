@@ -0,0 +1,102 @@
+"""structured analysis scores
+
+Revision ID: 0003_analysis_scores
+Revises: 0002_listing_indexes
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+import ast
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_analysis_scores"
+down_revision: Union[str, Sequence[str], None] = "0002_listing_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 1000
+
+
+def parse_scores(findings):
+    # Same rules as app.core.findings.parse_scores, frozen for this migration
+    if not findings:
+        return None
+    try:
+        value = json.loads(findings)
+    except ValueError:
+        try:
+            value = ast.literal_eval(findings)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    if not isinstance(value, dict) or not value:
+        return None
+    try:
+        return {str(name): float(score) for name, score in value.items()}
+    except (TypeError, ValueError):
+        return None
+
+
+def upgrade() -> None:
+    op.add_column("analyses", sa.Column("scores", sa.JSON().with_variant(postgresql.JSONB(), "postgresql"), nullable=True))
+    op.create_table(
+        "pathologies",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index("ix_pathologies_id", "pathologies", ["id"])
+    op.create_table(
+        "analysis_scores",
+        sa.Column("analysis_id", sa.Integer(), nullable=False),
+        sa.Column("pathology_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["analysis_id"], ["analyses.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["pathology_id"], ["pathologies.id"]),
+        sa.PrimaryKeyConstraint("analysis_id", "pathology_id"),
+    )
+    op.create_index("ix_analysis_scores_pathology_score", "analysis_scores", ["pathology_id", "score", "analysis_id"])
+
+    # Backfill existing analyses from their findings text, in id-ordered batches
+    bind = op.get_bind()
+    analyses = sa.table("analyses", sa.column("id", sa.Integer), sa.column("findings", sa.Text),
+                        sa.column("scores", sa.JSON))
+    pathologies = sa.table("pathologies", sa.column("id", sa.Integer), sa.column("name", sa.String))
+    analysis_scores = sa.table("analysis_scores", sa.column("analysis_id", sa.Integer),
+                               sa.column("pathology_id", sa.Integer), sa.column("score", sa.Float))
+    ids = {}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(analyses.c.id, analyses.c.findings)
+            .where(analyses.c.id > last_id).order_by(analyses.c.id).limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        score_rows = []
+        for analysis_id, findings in rows:
+            scores = parse_scores(findings)
+            if not scores:
+                continue
+            bind.execute(analyses.update().where(analyses.c.id == analysis_id).values(scores=scores))
+            for name, score in scores.items():
+                if name not in ids:
+                    ids[name] = bind.execute(pathologies.insert().values(name=name).returning(pathologies.c.id)).scalar_one()
+                score_rows.append({"analysis_id": analysis_id, "pathology_id": ids[name], "score": score})
+        if score_rows:
+            bind.execute(analysis_scores.insert(), score_rows)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_analysis_scores_pathology_score", table_name="analysis_scores")
+    op.drop_table("analysis_scores")
+    op.drop_index("ix_pathologies_id", table_name="pathologies")
+    op.drop_table("pathologies")
+    op.drop_column("analyses", "scores")
@@ -0,0 +1,65 @@
+"""full-text search index over reports and analyses
+
+Revision ID: 0004_search_index
+Revises: 0003_analysis_scores
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_search_index"
+down_revision: Union[str, Sequence[str], None] = "0003_analysis_scores"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of app/db/search_index.py at this revision
+SOURCES = [("reports", "content"), ("analyses", "findings")]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, column in SOURCES:
+        if dialect == "postgresql":
+            # Generated column: PostgreSQL keeps it current on every write
+            op.execute(
+                f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('english', coalesce({column}, ''))) STORED"
+            )
+            op.execute(f"CREATE INDEX ix_{table}_search ON {table} USING gin (search_vector)")
+        elif dialect == "sqlite":
+            fts = f"{table}_fts"
+            op.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', "
+                f"content_rowid='id', tokenize='porter unicode61')"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF {column} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+                f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            )
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, _ in SOURCES:
+        if dialect == "postgresql":
+            op.execute(f"DROP INDEX IF EXISTS ix_{table}_search")
+            op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+        elif dialect == "sqlite":
+            for trigger in ("insert", "delete", "update"):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{trigger}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
@@ -0,0 +1,28 @@
+"""link analyses to stored images
+
+Revision ID: 0005_analysis_image
+Revises: 0004_search_index
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_analysis_image"
+down_revision: Union[str, Sequence[str], None] = "0004_search_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("analyses", sa.Column("image_sha256", sa.String(length=64), nullable=True))
+    op.create_index("ix_analyses_image_sha256", "analyses", ["image_sha256"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_analyses_image_sha256", table_name="analyses")
+    op.drop_column("analyses", "image_sha256")
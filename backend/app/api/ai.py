@@ -1,74 +1,406 @@
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import JSONResponse
-from PIL import Image
-import torchxrayvision as xrv
-import torch
-import io
-import numpy as np
-import requests
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
+import asyncio
+import json
+from app.core.blobstore import BLOB_STORE_ENABLED, blob_store
+from app.core.deps import db_slot, get_db, get_current_user
+from app.core.findings import attach_scores
+from app.core.llm import llm_client, report_completions
+from app.core.metrics import metrics, stage
+from app.core.responses import ORJSONResponse
+from app.core.security import decode_access_token
+from app.db.session import SessionLocal
+from app.inference import models
+from app.inference.backends import active_backend
+from app.inference.batching import AI_DETECTOR_MAX_BATCH_SIZE, AI_STUDY_CONCURRENCY, MicroBatcher
+from app.inference.cache import cache_key, result_cache
+from app.inference.detection import (
+    AI_DETECT_MAX_SIDE, AI_DETECT_NMS_IOU, AI_DETECT_TILE_OVERLAP, AI_DETECT_TILE_SIZE,
+    AI_DETECT_TILED_MAX_SIDE, make_tiles, merge_tiles, to_annotations,
+)
+from app.inference.ingest import SpooledUpload, ingest_stats, spool_archive, spool_upload
+from app.inference.jobs import Job, JobQueue, check_single_worker
+from app.inference.preprocess import decode_for_classifier, decode_for_detector
+from app.inference.pyramid import pyramid
+from app.inference.registry import registry, warmup_names
+from app.inference.workers import inference_pool
+from app.models.analysis import Analysis
+from app.models.patient import Patient
+from app.models.user import User
 
-router = APIRouter(prefix="/api/ai", tags=["ai"])
+# Payloads here are built by hand (no response_model), so orjson does the encoding
+router = APIRouter(prefix="/api/ai", tags=["ai"], default_response_class=ORJSONResponse)
 
-# Load the model once at startup
-model = xrv.models.DenseNet(weights="densenet121-res224-all")
-model.eval()
+classifier_batcher = MicroBatcher(
+    models.classify_batch,
+    executor=inference_pool,
+    concurrency=inference_pool.workers,
+    name="classifier",
+)
+detector_batcher = MicroBatcher(
+    models.detect_batch,
+    max_batch_size=AI_DETECTOR_MAX_BATCH_SIZE,
+    executor=inference_pool,
+    concurrency=inference_pool.workers,
+    name="detector",
+)
 
-# Load object detection model once at startup
-import torchvision
-import torchvision.transforms as T
+# Preprocessing parameters are part of the cache key
+CLASSIFIER_PARAMS = {"mode": "L", "size": 224, "normalize": 255, "decode": "reduced"}
+DETECTOR_PARAMS = {"mode": "RGB", "max_side": AI_DETECT_MAX_SIDE}
+TILED_DETECTOR_PARAMS = {
+    "mode": "RGB", "max_side": AI_DETECT_TILED_MAX_SIDE, "tile_size": AI_DETECT_TILE_SIZE,
+    "tile_overlap": AI_DETECT_TILE_OVERLAP, "nms_iou": AI_DETECT_NMS_IOU,
+}
 
-detection_model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=True)
-detection_model.eval()
+def cache_lookup(digest: str, model_name: str, params: dict):
+    with stage("cache_lookup"):
+        key = cache_key(digest, models.model_version(model_name), params)
+        return key, result_cache.get(key)
 
-OPENROUTER_API_KEY = "YOUR_OPENROUTER_API_KEY"
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+async def store_upload(upload: SpooledUpload) -> Optional[str]:
+    # Keeps the original of an analysis being saved, for /api/images; returns its
+    # key, or None when storage is off. Unsaved uploads are never kept.
+    if not BLOB_STORE_ENABLED:
+        return None
+    with stage("blob_store"):
+        await run_in_threadpool(blob_store.put, upload.digest, upload.file)
+    return upload.digest
+
+async def classify_upload(upload: SpooledUpload):
+    key, findings = await run_in_threadpool(cache_lookup, upload.digest, "classifier", CLASSIFIER_PARAMS)
+    if findings is not None:
+        return findings, "hit"
+    # Preprocess off the event loop, then run inference batched with any concurrent requests
+    img_array = await run_in_threadpool(decode_for_classifier, upload.file)
+    findings = await classifier_batcher.submit(img_array)
+    await run_in_threadpool(result_cache.put, key, findings)
+    return findings, "miss"
+
+async def detect_upload(upload: SpooledUpload, score_threshold: float = 0.5, top_k: int = 100, tile: bool = False):
+    params = dict(TILED_DETECTOR_PARAMS if tile else DETECTOR_PARAMS, score_threshold=score_threshold, top_k=top_k)
+    key, annotations = await run_in_threadpool(cache_lookup, upload.digest, "detector", params)
+    if annotations is not None:
+        return annotations, "hit"
+    img_np, scale = await run_in_threadpool(decode_for_detector, upload.file, params["max_side"])
+    if tile:
+        # Tiles go through the batcher individually, so they share batches with other requests
+        tiles = make_tiles(img_np, AI_DETECT_TILE_SIZE, AI_DETECT_TILE_OVERLAP)
+        outputs = await asyncio.gather(*(
+            detector_batcher.submit((view, score_threshold, top_k)) for _, view in tiles
+        ))
+        outputs = merge_tiles(outputs, [origin for origin, _ in tiles], top_k, AI_DETECT_NMS_IOU)
+    else:
+        outputs = await detector_batcher.submit((img_np, score_threshold, top_k))
+    annotations = to_annotations(outputs, scale)
+    await run_in_threadpool(result_cache.put, key, annotations)
+    return annotations, "miss"
 
 @router.post("/analyze-image")
 async def analyze_image(file: UploadFile = File(...)):
-    # Read and preprocess the image
-    image_bytes = await file.read()
-    img = Image.open(io.BytesIO(image_bytes)).convert("L")  # Grayscale
-    img = img.resize((224, 224))
-    img_np = np.array(img)
-    img_tensor = torch.from_numpy(xrv.datasets.normalize(img_np, 255)).unsqueeze(0).unsqueeze(0).float()
-
-    # Run inference
-    with torch.no_grad():
-        outputs = model(img_tensor)
-        findings = {k: float(outputs[0, i]) for i, k in enumerate(model.pathologies)}
+    upload = await spool_upload(file)
+    try:
+        findings, cache_status = await classify_upload(upload)
+    finally:
+        upload.close()
 
     # Return findings (no bounding boxes, just predictions)
-    return JSONResponse({
-        "findings": str(findings),
-        "annotation": []  # No bounding boxes with this model
-    })
+    with stage("serialize"):
+        return ORJSONResponse({
+            "findings": str(findings),
+            "scores": findings,
+            "annotation": [],  # No bounding boxes with this model
+            "backend": active_backend("classifier"),
+        }, headers={"X-Inference-Cache": cache_status})
 
 @router.post("/detect-objects")
-async def detect_objects(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    transform = T.Compose([T.ToTensor()])
-    img_tensor = transform(img)
-    with torch.no_grad():
-        outputs = detection_model([img_tensor])[0]
-    boxes = outputs['boxes'].cpu().numpy()
-    scores = outputs['scores'].cpu().numpy()
-    labels = outputs['labels'].cpu().numpy()
-    annotations = []
-    for box, score, label in zip(boxes, scores, labels):
-        if score > 0.5:
-            annotations.append({
-                "label": str(label),
-                "bbox": [float(box[0]), float(box[1]), float(box[2]), float(box[3])],
-                "score": float(score)
-            })
-    return JSONResponse({
-        "findings": f"Detected {len(annotations)} objects.",
-        "annotation": annotations
-    })
+async def detect_objects(
+    file: UploadFile = File(...),
+    score_threshold: float = Query(0.5, ge=0.0, le=1.0),
+    top_k: int = Query(100, ge=1, le=100),
+    tile: bool = Query(False, description="Detect on overlapping tiles of a larger image and merge them with NMS"),
+):
+    upload = await spool_upload(file)
+    try:
+        annotations, cache_status = await detect_upload(upload, score_threshold, top_k, tile)
+    finally:
+        upload.close()
+    with stage("serialize"):
+        return ORJSONResponse({
+            "findings": f"Detected {len(annotations)} objects.",
+            "annotation": annotations,
+            "backend": active_backend("detector"),
+        }, headers={"X-Inference-Cache": cache_status})
 
-@router.post("/generate-report")
-def generate_report(patient_id: int = None, findings: str = None):
+def bulk_insert_analyses(db: Session, rows: List[dict]) -> List[int]:
+    # One transaction and one batched INSERT for the whole study
+    analyses = [Analysis(**row) for row in rows]
+    attach_scores(db, analyses)
+    db.add_all(analyses)
+    db.commit()
+    return [analysis.id for analysis in analyses]
+
+def insert_analyses_in_new_session(rows: List[dict]) -> List[int]:
+    db = SessionLocal()
+    try:
+        return bulk_insert_analyses(db, rows)
+    finally:
+        db.close()
+
+async def insert_analyses(rows: List[dict]) -> List[int]:
+    # For work that outlives its request (jobs): takes a pool slot like get_db does
+    async with db_slot():
+        return await run_in_threadpool(insert_analyses_in_new_session, rows)
+
+@router.post("/analyze-study")
+async def analyze_study(
+    patient_id: int = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    classify: bool = Form(True),
+    detect: bool = Form(False),
+    persist: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if not classify and not detect:
+        raise HTTPException(status_code=400, detail="Nothing to do: enable classify and/or detect")
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="Upload images as files or as a zip archive")
+    if persist and not db.query(Patient.id).filter(Patient.id == patient_id).first():
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Spool every image before the response starts, since the request body is
+    # not available once streaming begins.
+    uploads: List[SpooledUpload] = []
+    try:
+        for file in files or []:
+            uploads.append(await spool_upload(file))
+        if archive is not None:
+            archive_upload = await spool_upload(archive)
+            try:
+                uploads.extend(await run_in_threadpool(spool_archive, archive_upload.file))
+            finally:
+                archive_upload.close()
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+
+    # Caps how many images of this study are decoded and waiting on a model at once
+    in_flight = asyncio.Semaphore(AI_STUDY_CONCURRENCY)
+
+    async def process(index: int, upload: SpooledUpload) -> dict:
+        result = {"index": index, "filename": upload.filename, "sha256": upload.digest}
+        async with in_flight:
+            try:
+                # Sequential per image (both decoders read the same spool file),
+                # concurrent across images so the batchers can group them.
+                if classify:
+                    result["findings"], result["classifier_cache"] = await classify_upload(upload)
+                if detect:
+                    result["annotation"], result["detector_cache"] = await detect_upload(upload)
+                if persist:
+                    result["image_sha256"] = await store_upload(upload)
+            except HTTPException as exc:
+                result["error"] = exc.detail
+            except Exception as exc:
+                result["error"] = str(exc)
+        return result
+
+    async def results():
+        tasks = [asyncio.ensure_future(process(i, upload)) for i, upload in enumerate(uploads)]
+        rows = []
+        errors = 0
+        try:
+            # Lines are emitted in completion order; "index" ties them back to the upload
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                if "error" in result:
+                    errors += 1
+                elif persist:
+                    rows.append({
+                        "patient_id": patient_id,
+                        "findings": str(result["findings"]) if classify else f"Detected {len(result['annotation'])} objects.",
+                        "scores": result.get("findings"),
+                        "annotation": json.dumps(result.get("annotation", [])),
+                        "image_sha256": result["image_sha256"],
+                    })
+                yield json.dumps(result) + "\n"
+            summary = {"done": True, "images": len(uploads), "errors": errors}
+            if classify:
+                summary["classifier_backend"] = active_backend("classifier")
+            if detect:
+                summary["detector_backend"] = active_backend("detector")
+            if persist:
+                # The request's session is still open while the body streams
+                summary["analysis_ids"] = await run_in_threadpool(bulk_insert_analyses, db, rows) if rows else []
+            yield json.dumps(summary) + "\n"
+        finally:
+            # Client went away or we finished: stop outstanding work before closing the spools
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for upload in uploads:
+                upload.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+async def run_analysis_job(job: Job) -> dict:
+    # Runs on a job worker: inference through the shared batchers, then the Analysis row
+    upload = job.payload
+    try:
+        with job.stage("inference"):
+            if job.kind == "classify":
+                findings, cache_status = await classify_upload(upload)
+                row = {"findings": str(findings), "scores": findings, "annotation": json.dumps([])}
+                result = {"findings": findings}
+            else:
+                annotations, cache_status = await detect_upload(
+                    upload, job.params["score_threshold"], job.params["top_k"], job.params["tile"])
+                row = {"findings": f"Detected {len(annotations)} objects.", "annotation": json.dumps(annotations)}
+                result = {"annotation": annotations}
+        with job.stage("persist"):
+            image_sha256 = await store_upload(upload)
+            row = dict(row, patient_id=job.params["patient_id"], image_sha256=image_sha256)
+            analysis_ids = await insert_analyses([row])
+    finally:
+        upload.close()
+    return dict(result, analysis_id=analysis_ids[0], image_sha256=image_sha256, inference_cache=cache_status)
+
+analysis_jobs = JobQueue(run_analysis_job, on_discard=lambda job: job.payload.close(), name="analysis")
+
+# Read at scrape time from the same counters /stats reports
+metrics.gauge("ai_batch_pending", "Items waiting to be collected into a batch.", ["model"],
+              lambda: {(b.name,): b.pending for b in (classifier_batcher, detector_batcher)})
+metrics.gauge("ai_batches_running", "Batches currently running on the inference pool.", ["model"],
+              lambda: {(b.name,): b.running for b in (classifier_batcher, detector_batcher)})
+metrics.gauge("ai_jobs", "Analysis jobs by state.", ["status"],
+              lambda: {(status,): analysis_jobs.stats()[status] for status in ("queued", "running")})
+metrics.gauge("ai_model_load_seconds", "Time taken to load each model, per inference worker.", ["model", "worker"],
+              lambda: {(name, worker): seconds for worker, load_seconds in inference_pool.load_seconds().items()
+                       for name, seconds in load_seconds.items()})
+metrics.gauge("ai_backend_info", "Inference backend each model is configured to run on (always 1).", ["model", "backend"],
+              lambda: {(name, active_backend(name)): 1 for name in registry.names})
+
+def job_response(request: Request, job: Job) -> dict:
+    return dict(
+        job.to_dict(),
+        status_url=str(request.url_for("get_analysis_job", job_id=job.id)),
+        websocket_url=request.app.url_path_for("watch_analysis_job", job_id=job.id),
+    )
+
+@router.post("/jobs", status_code=202)
+async def submit_analysis_job(
+    request: Request,
+    patient_id: int = Form(...),
+    file: UploadFile = File(...),
+    kind: Literal["classify", "detect"] = Form("classify"),
+    score_threshold: float = Form(0.5, ge=0.0, le=1.0),
+    top_k: int = Form(100, ge=1, le=100),
+    tile: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    # Returns at once; a worker runs the model and writes the Analysis row
+    if not db.query(Patient.id).filter(Patient.id == patient_id).first():
+        raise HTTPException(status_code=404, detail="Patient not found")
+    upload = await spool_upload(file)
+    params = {"patient_id": patient_id}
+    if kind == "detect":
+        params.update(score_threshold=score_threshold, top_k=top_k, tile=tile)
+    try:
+        job = analysis_jobs.submit(Job(kind, upload, params, owner_id=current_user.id))
+    except BaseException:
+        upload.close()
+        raise
+    body = job_response(request, job)
+    return ORJSONResponse(body, status_code=202, headers={"Location": body["status_url"]})
+
+@router.get("/jobs/{job_id}")
+def get_analysis_job(job_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    # Another user's job is reported as missing, so job ids reveal nothing
+    job = analysis_jobs.get(job_id)
+    if job is None or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(request, job)
+
+def token_user_id(token: Optional[str]) -> Optional[int]:
+    payload = decode_access_token(token) if token else None
+    if payload is None or "sub" not in payload:
+        return None
+    db = SessionLocal()
+    try:
+        return db.query(User.id).filter(User.email == payload["sub"]).scalar()
+    finally:
+        db.close()
+
+@router.websocket("/jobs/{job_id}/ws")
+async def watch_analysis_job(websocket: WebSocket, job_id: str, token: Optional[str] = None):
+    # Browsers cannot set headers on WebSockets, so the bearer token comes as ?token=
+    async with db_slot():
+        user_id = await run_in_threadpool(token_user_id, token)
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+    job = analysis_jobs.get(job_id)
+    if job is None or job.owner_id != user_id:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    try:
+        async for state in job.watch():
+            await websocket.send_json(state)
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+@router.on_event("startup")
+def check_job_queue():
+    # Fails startup rather than losing jobs between worker processes
+    check_single_worker(analysis_jobs.name)
+
+@router.on_event("startup")
+async def warm_up_models():
+    # Models load lazily on first use unless AI_WARMUP asks for them up front
+    names = warmup_names()
+    if not names:
+        return
+    if inference_pool.mode == "thread":
+        await run_in_threadpool(registry.warm_up, names)
+    else:
+        # Starting the pool runs the worker initializer, which loads the models
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(inference_pool, models.warm_up, names)
+
+@router.on_event("shutdown")
+async def shutdown_clients():
+    await analysis_jobs.shutdown()
+    inference_pool.shutdown(wait=False, cancel_futures=True)
+    await llm_client.aclose()
+
+@router.get("/stats")
+def inference_stats():
+    return {
+        "classifier_batching": classifier_batcher.stats(),
+        "detector_batching": detector_batcher.stats(),
+        "worker_pool": inference_pool.stats(),
+        "models": dict(inference_pool.model_stats(), backends={name: active_backend(name) for name in registry.names}),
+        "result_cache": result_cache.stats(),
+        "ingest": ingest_stats.stats(),
+        "blob_store": blob_store.stats(),
+        "pyramid": pyramid.stats(),
+        "jobs": analysis_jobs.stats(),
+        "llm": llm_client.stats(),
+        "report_cache": report_completions.stats(),
+    }
+
+REPORT_MODEL = "mistralai/mistral-7b-instruct"  # You can change to another available model
+
+def report_payload(findings: str) -> dict:
     # Compose the prompt for the LLM
     prompt = f"""
 You are a clinical radiology assistant. Given the following AI findings for a patient, generate a concise, professional draft radiology report. Use standard medical terminology and structure.
@@ -77,23 +409,49 @@ Findings: {findings}
 
 Draft Report:
 """
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "mistralai/mistral-7b-instruct",  # You can change to another available model
+    return {
+        "model": REPORT_MODEL,
         "messages": [
             {"role": "system", "content": "You are a helpful medical report assistant."},
             {"role": "user", "content": prompt}
         ],
         "max_tokens": 512
     }
-    try:
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        report = result["choices"][0]["message"]["content"]
-        return {"report": report}
-    except Exception as e:
-        return {"error": str(e)}
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@router.post("/generate-report")
+async def generate_report(
+    response: Response,
+    patient_id: int = None,
+    findings: str = None,
+    stream: bool = False,
+    cache: bool = Query(True, description="Reuse a cached or in-flight identical report; false always calls the LLM"),
+    refresh: bool = Query(False, description="Skip the cached report but store the new one"),
+):
+    payload = report_payload(findings)
+    if not stream:
+        try:
+            report, cache_status = await report_completions.complete(payload, cache=cache, refresh=refresh)
+            response.headers["X-Report-Cache"] = cache_status
+            return {"report": report}
+        except Exception as e:
+            return {"error": str(e)}
+
+    cache_status, tokens = report_completions.stream(payload, cache=cache, refresh=refresh)
+
+    async def events():
+        # Tokens are forwarded as they arrive; the final event carries the whole report
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+            yield sse_event({"report": "".join(parts)}, event="done")
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Report-Cache": cache_status})
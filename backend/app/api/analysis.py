@@ -1,21 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from app.schemas.analysis import AnalysisCreate, AnalysisRead
+from typing import Callable, List, Optional, Tuple
+from app.schemas.analysis import AnalysisCreate, AnalysisRead, AnalysisScoreHit
 from app.models.analysis import Analysis
-from app.core.deps import get_db, get_current_user
+from app.core.deps import get_db, get_current_user, run_db
+from app.core.blobstore import blob_store
+from app.core.findings import SCORE_ORDER, attach_scores, parse_condition, pathology_ids, score_search
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_filter, keyset_page, set_next_cursor, split_page
+from app.core.responses import model_response
 from app.models.user import User
 
-router = APIRouter(prefix="/api/analyses", tags=["analyses"])
+# Route bodies take a sync Session; run_db gives them one in either DB mode
 
-@router.post("/", response_model=AnalysisRead)
-def create_analysis(analysis_in: AnalysisCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def add_analysis(db: Session, analysis_in: AnalysisCreate) -> Analysis:
     analysis = Analysis(**analysis_in.dict())
+    attach_scores(db, [analysis])
     db.add(analysis)
     db.commit()
     db.refresh(analysis)
     return analysis
 
-@router.get("/patient/{patient_id}", response_model=List[AnalysisRead])
-def list_analyses_for_patient(patient_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Analysis).filter(Analysis.patient_id == patient_id).all()
+def analysis_page(db: Session, patient_id: int, cursor: Optional[str], limit: int):
+    # Newest first
+    query = db.query(Analysis).filter(Analysis.patient_id == patient_id)
+    return keyset_page(query, [Analysis.created_at, Analysis.id], cursor, limit)
+
+def score_page(db: Session, pathology: str, min_score: float, max_score: Optional[float], conditions: List[Tuple[str, float]],
+               patient_id: Optional[int], cursor: Optional[str], limit: int) -> Tuple[List[Analysis], Optional[str]]:
+    # Highest score first
+    ids = pathology_ids(db, [pathology] + [name for name, _ in conditions], create=False)
+    if pathology not in ids or any(name not in ids for name, _ in conditions):
+        return [], None
+    statement = score_search(ids, pathology, min_score, max_score, conditions, patient_id)
+    rows = db.execute(keyset_filter(statement, SCORE_ORDER, cursor, limit)).all()
+    rows, next_cursor = split_page(rows, SCORE_ORDER, limit)
+    for analysis, score, _ in rows:
+        analysis.score = score
+    return [analysis for analysis, _, _ in rows], next_cursor
+
+def build_router(get_session: Callable, get_user: Callable) -> APIRouter:
+    router = APIRouter(prefix="/api/analyses", tags=["analyses"])
+
+    @router.post("/", response_model=AnalysisRead)
+    async def create_analysis(analysis_in: AnalysisCreate, db=Depends(get_session), current_user: User = Depends(get_user)):
+        if analysis_in.image_sha256 is not None and not blob_store.exists(analysis_in.image_sha256):
+            raise HTTPException(status_code=400, detail="Unknown image_sha256; only images of analyses saved through /api/ai are stored")
+        return await run_db(db, add_analysis, analysis_in)
+
+    @router.get("/patient/{patient_id}", response_model=List[AnalysisRead])
+    async def list_analyses_for_patient(patient_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db=Depends(get_session), current_user: User = Depends(get_user)):
+        analyses, next_cursor = await run_db(db, analysis_page, patient_id, cursor, limit)
+        set_next_cursor(request, response, next_cursor)
+        return model_response(AnalysisRead, analyses, response)
+
+    @router.get("/search", response_model=List[AnalysisScoreHit])
+    async def search_analyses_by_score(
+        request: Request,
+        response: Response,
+        pathology: str,
+        min_score: float = 0.5,
+        max_score: Optional[float] = None,
+        require: Optional[List[str]] = Query(None, description="Additional 'Pathology:min_score' conditions, all of which must hold"),
+        patient_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        db=Depends(get_session),
+        current_user: User = Depends(get_user),
+    ):
+        conditions = [parse_condition(c) for c in require or []]
+        analyses, next_cursor = await run_db(db, score_page, pathology, min_score, max_score, conditions, patient_id, cursor, limit)
+        set_next_cursor(request, response, next_cursor)
+        return model_response(AnalysisScoreHit, analyses, response)
+
+    return router
+
+router = build_router(get_db, get_current_user)
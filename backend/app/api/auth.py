@@ -8,7 +8,7 @@ from app.models.user import User
 from app.core.security import get_password_hash, verify_password, create_access_token
 from app.core.deps import get_db, get_current_user
 from app.core.oauth import oauth
-from app.db.session import SessionLocal
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -46,8 +46,17 @@ async def github_login(request: Request):
     redirect_uri = request.url_for('github_callback')
     return await oauth.github.authorize_redirect(request, redirect_uri)
 
+def github_user(db: Session, email: str, full_name: str) -> User:
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        user = User(email=email, hashed_password="", full_name=full_name, role="student")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    return user
+
 @router.get("/github/callback")
-async def github_callback(request: Request):
+async def github_callback(request: Request, db: Session = Depends(get_db)):
     token = await oauth.github.authorize_access_token(request)
     resp = await oauth.github.get('user', token=token)
     user_data = resp.json()
@@ -62,13 +71,7 @@ async def github_callback(request: Request):
                 break
     if not email:
         raise HTTPException(status_code=400, detail="Email not found from GitHub")
-    db = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        user = User(email=email, hashed_password="", full_name=user_data.get('name'), role="student")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    user = await run_in_threadpool(github_user, db, email, user_data.get('name'))
     access_token = create_access_token({"sub": user.email, "role": user.role})
     response = RedirectResponse(url=f"http://localhost:5173/oauth-success?token={access_token}")
     return response
\ No newline at end of file
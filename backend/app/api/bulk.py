@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
+
+from app.core.bulk import FORMATS, detect_format, import_patients, stream_rows
+from app.core.deps import db_session, get_current_user, get_db
+from app.inference.ingest import AI_MAX_UPLOAD_BYTES
+from app.models.analysis import Analysis
+from app.models.patient import Patient
+from app.models.report import Report
+
+router = APIRouter(prefix="/api/bulk", tags=["bulk"], dependencies=[Depends(get_current_user)])
+
+Format = Literal["csv", "ndjson"]
+
+
+@router.post("/patients")
+def bulk_import_patients(file: UploadFile = File(...), format: Optional[Format] = None, atomic: bool = False, db: Session = Depends(get_db)):
+    # Upserts on medical_record_number; returns {rows, inserted, updated, invalid, errors}
+    if file.size is not None and file.size > AI_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {AI_MAX_UPLOAD_BYTES} bytes")
+    fmt = format or detect_format(file.filename, file.content_type)
+    return import_patients(db, file.file, fmt, atomic)
+
+
+async def _stream(statement: Select, fmt: str):
+    # The body opens its own session rather than borrowing get_db's, whose
+    # lifetime relative to a streaming response depends on the FastAPI version
+    async with db_session() as db:
+        async for chunk in iterate_in_threadpool(stream_rows(db, statement, fmt)):
+            yield chunk
+
+
+def export(statement: Select, table: str, fmt: str) -> StreamingResponse:
+    return StreamingResponse(
+        _stream(statement, fmt), media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"},
+    )
+
+
+@router.get("/patients")
+def export_patients(format: Format = "ndjson"):
+    statement = select(Patient.id, Patient.name, Patient.dob, Patient.gender, Patient.medical_record_number)
+    return export(statement.order_by(Patient.id), "patients", format)
+
+
+@router.get("/reports")
+def export_reports(format: Format = "ndjson", patient_id: Optional[int] = None, created_after: Optional[datetime] = None, created_before: Optional[datetime] = None):
+    statement = select(
+        Report.id, Report.patient_id, Report.author_id, Report.content, Report.created_at, Report.updated_at
+    )
+    if patient_id is not None:
+        statement = statement.where(Report.patient_id == patient_id)
+    if created_after is not None:
+        statement = statement.where(Report.created_at >= created_after)
+    if created_before is not None:
+        statement = statement.where(Report.created_at < created_before)
+    return export(statement.order_by(Report.id), "reports", format)
+
+
+@router.get("/analyses")
+def export_analyses(format: Format = "ndjson", patient_id: Optional[int] = None, created_after: Optional[datetime] = None, created_before: Optional[datetime] = None):
+    statement = select(
+        Analysis.id, Analysis.patient_id, Analysis.findings, Analysis.annotation, Analysis.scores,
+        Analysis.image_sha256, Analysis.created_at,
+    )
+    if patient_id is not None:
+        statement = statement.where(Analysis.patient_id == patient_id)
+    if created_after is not None:
+        statement = statement.where(Analysis.created_at >= created_after)
+    if created_before is not None:
+        statement = statement.where(Analysis.created_at < created_before)
+    return export(statement.order_by(Analysis.id), "analyses", format)
@@ -0,0 +1,117 @@
+import asyncio
+from typing import List, Optional, Set
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from PIL import Image
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.core.blobstore import BLOB_GC_INTERVAL, blob_store, is_digest
+from app.core.deps import db_slot, get_current_user
+from app.core.responses import etag_matches
+from app.db.session import SessionLocal
+from app.inference.ingest import open_image
+from app.inference.pyramid import pyramid
+from app.models.analysis import Analysis
+
+# Original uploads are patient data: the viewer fetches images and tiles with its
+# bearer token (fetch() into object URLs), like every other /api route.
+router = APIRouter(prefix="/api/images", tags=["images"], dependencies=[Depends(get_current_user)])
+
+# Content-addressed responses never change, so caches may keep them forever
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+Digest = Path(..., min_length=64, max_length=64)
+
+
+def check_digest(sha256: str):
+    if not is_digest(sha256) or not blob_store.exists(sha256):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": IMMUTABLE}
+
+
+@router.get("/{sha256}")
+def get_image(request: Request, sha256: str = Digest):
+    check_digest(sha256)
+    etag = f'"{sha256}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    path = blob_store.path(sha256)
+    with open(path, "rb") as fp:
+        media_type = Image.MIME.get(open_image(fp).format, "application/octet-stream")
+    # FileResponse answers Range / If-Range requests with 206 partial content
+    return FileResponse(path, media_type=media_type, headers=cache_headers(etag))
+
+
+@router.get("/{sha256}/info")
+def get_image_info(request: Request, sha256: str = Digest):
+    check_digest(sha256)
+    etag = pyramid.etag(sha256, "info")
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    base = request.app.url_path_for("get_image", sha256=sha256)
+    info = dict(
+        pyramid.info(sha256),
+        thumbnail_url=f"{base}/thumbnail",
+        tile_url=f"{base}/tiles/{{level}}/{{x}}/{{y}}",
+    )
+    return JSONResponse(info, headers=cache_headers(etag))
+
+
+@router.get("/{sha256}/thumbnail")
+def get_image_thumbnail(request: Request, sha256: str = Digest):
+    check_digest(sha256)
+    etag = pyramid.etag(sha256, "thumbnail", pyramid.thumbnail_size)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return FileResponse(pyramid.thumbnail(sha256), media_type=pyramid.media_type, headers=cache_headers(etag))
+
+
+@router.get("/{sha256}/tiles/{level}/{x}/{y}")
+def get_image_tile(request: Request, level: int, x: int, y: int, sha256: str = Digest):
+    # Level 0 is full resolution; x and y count tiles from the top left
+    check_digest(sha256)
+    etag = pyramid.etag(sha256, level, x, y)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return FileResponse(pyramid.tile(sha256, level, x, y), media_type=pyramid.media_type, headers=cache_headers(etag))
+
+
+def referenced_blobs(digests: List[str]) -> Set[str]:
+    db = SessionLocal()
+    try:
+        return set(db.scalars(select(Analysis.image_sha256).where(Analysis.image_sha256.in_(digests))))
+    finally:
+        db.close()
+
+
+_sweeper: Optional[asyncio.Task] = None
+
+
+async def sweep_blobs_forever():
+    # Blobs are only kept for saved analyses; this removes those whose analysis is gone
+    while True:
+        await asyncio.sleep(BLOB_GC_INTERVAL)
+        try:
+            async with db_slot():
+                await run_in_threadpool(blob_store.sweep, referenced_blobs)
+        except Exception as exc:
+            blob_store.last_sweep_error = str(exc) or type(exc).__name__
+
+
+@router.on_event("startup")
+async def start_blob_sweeper():
+    global _sweeper
+    # Startup hooks of included routers can fire more than once; keep a single sweeper
+    if BLOB_GC_INTERVAL > 0 and (_sweeper is None or _sweeper.done()):
+        _sweeper = asyncio.get_running_loop().create_task(sweep_blobs_forever())
+
+
+@router.on_event("shutdown")
+async def stop_blob_sweeper():
+    if _sweeper is not None:
+        _sweeper.cancel()
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.core.deps import get_current_user
+from app.core.metrics import metrics
+from app.core.profiler import profiler
+from app.models.user import User
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # Scraped by Prometheus; exposes no patient data, so it is not behind auth
+    return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get("/metrics/profiler")
+def profiler_status(current_user: User = Depends(get_current_user)):
+    return profiler.stats()
+
+@router.post("/metrics/profiler/start")
+def start_profiler(
+    interval_ms: Optional[float] = Query(None, ge=1, le=1000),
+    reset: bool = True,
+    current_user: User = Depends(get_current_user),
+):
+    if reset and not profiler.running:
+        profiler.reset()
+    profiler.start(interval_ms)
+    return profiler.stats()
+
+@router.post("/metrics/profiler/stop")
+def stop_profiler(current_user: User = Depends(get_current_user)):
+    profiler.stop()
+    return profiler.stats()
+
+@router.get("/metrics/profiler/collapsed", response_class=PlainTextResponse)
+def profiler_stacks(current_user: User = Depends(get_current_user)):
+    # Collapsed stacks: feed to flamegraph.pl or open in speedscope
+    return PlainTextResponse(profiler.collapsed())
@@ -1,48 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Callable, List, Optional
 from app.schemas.patient import PatientCreate, PatientRead
+from app.schemas.timeline import PatientTimeline
 from app.models.patient import Patient
-from app.core.deps import get_db, get_current_user
+from app.core.deps import get_db, get_current_user, run_db
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.core.responses import check_etag, model_response, row_etag
+from app.core.timeline import merge_timeline, timeline_statements
 from app.models.user import User
 
-router = APIRouter(prefix="/api/patients", tags=["patients"])
+# Route bodies take a sync Session; run_db gives them one in either DB mode
 
-@router.post("/", response_model=PatientRead)
-def create_patient(patient_in: PatientCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def find_patient(db: Session, patient_id: int) -> Patient:
+    patient = db.get(Patient, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return patient
+
+def add_patient(db: Session, patient_in: PatientCreate) -> Patient:
     patient = Patient(**patient_in.dict())
     db.add(patient)
     db.commit()
     db.refresh(patient)
     return patient
 
-@router.get("/", response_model=List[PatientRead])
-def list_patients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Patient).offset(skip).limit(limit).all()
+def patient_page(db: Session, cursor: Optional[str], limit: int):
+    return keyset_page(db.query(Patient), [Patient.id], cursor, limit, descending=False)
 
-@router.get("/{patient_id}", response_model=PatientRead)
-def get_patient(patient_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    return patient
+def patient_timeline(db: Session, patient_id: int, cursor: Optional[str], limit: int) -> dict:
+    # Patient, analyses and reports (with authors) in three statements, newest first
+    patient = find_patient(db, patient_id)
+    analyses, reports = timeline_statements(patient_id, cursor, limit)
+    events, next_cursor = merge_timeline(db.scalars(analyses).all(), db.scalars(reports).unique().all(), limit)
+    return {"patient": patient, "events": events, "next_cursor": next_cursor}
 
-@router.put("/{patient_id}", response_model=PatientRead)
-def update_patient(patient_id: int, patient_in: PatientCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
+def replace_patient(db: Session, patient_id: int, patient_in: PatientCreate) -> Patient:
+    patient = find_patient(db, patient_id)
     for key, value in patient_in.dict().items():
         setattr(patient, key, value)
     db.commit()
     db.refresh(patient)
     return patient
 
-@router.delete("/{patient_id}")
-def delete_patient(patient_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
-    db.delete(patient)
+def remove_patient(db: Session, patient_id: int) -> dict:
+    db.delete(find_patient(db, patient_id))
     db.commit()
-    return {"ok": True} 
\ No newline at end of file
+    return {"ok": True}
+
+def patient_etag(patient: Patient) -> str:
+    return row_etag(patient.id, patient.name, patient.dob, patient.gender, patient.medical_record_number)
+
+def build_router(get_session: Callable, get_user: Callable) -> APIRouter:
+    router = APIRouter(prefix="/api/patients", tags=["patients"])
+
+    @router.post("/", response_model=PatientRead)
+    async def create_patient(patient_in: PatientCreate, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, add_patient, patient_in)
+
+    @router.get("/", response_model=List[PatientRead])
+    async def list_patients(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db=Depends(get_session), current_user: User = Depends(get_user)):
+        patients, next_cursor = await run_db(db, patient_page, cursor, limit)
+        set_next_cursor(request, response, next_cursor)
+        return model_response(PatientRead, patients, response)
+
+    @router.get("/{patient_id}", response_model=PatientRead)
+    async def get_patient(patient_id: int, request: Request, response: Response, db=Depends(get_session), current_user: User = Depends(get_user)):
+        patient = await run_db(db, find_patient, patient_id)
+        return check_etag(request, response, patient_etag(patient)) or model_response(PatientRead, patient, response)
+
+    @router.get("/{patient_id}/timeline", response_model=PatientTimeline)
+    async def get_patient_timeline(patient_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db=Depends(get_session), current_user: User = Depends(get_user)):
+        timeline = await run_db(db, patient_timeline, patient_id, cursor, limit)
+        set_next_cursor(request, response, timeline["next_cursor"])
+        return timeline
+
+    @router.put("/{patient_id}", response_model=PatientRead)
+    async def update_patient(patient_id: int, patient_in: PatientCreate, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, replace_patient, patient_id, patient_in)
+
+    @router.delete("/{patient_id}")
+    async def delete_patient(patient_id: int, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, remove_patient, patient_id)
+
+    return router
+
+router = build_router(get_db, get_current_user)
@@ -0,0 +1,5 @@
+from app.api.patient import build_router
+from app.core.async_deps import get_async_db, get_current_user_async
+
+# Same routes as app.api.patient, served on the event loop with an AsyncSession (DB_ASYNC=true)
+router = build_router(get_async_db, get_current_user_async)
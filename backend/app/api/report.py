@@ -1,52 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Callable, List, Optional
 from app.schemas.report import ReportCreate, ReportRead
 from app.models.report import Report
-from app.core.deps import get_db, get_current_user
+from app.core.deps import get_db, get_current_user, run_db
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.core.responses import check_etag, model_response, row_etag
 from app.models.user import User
 
-router = APIRouter(prefix="/api/reports", tags=["reports"])
+# Route bodies take a sync Session; run_db gives them one in either DB mode
 
-@router.post("/", response_model=ReportRead)
-def create_report(report_in: ReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def find_report(db: Session, report_id: int) -> Report:
+    report = db.get(Report, report_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report
+
+def add_report(db: Session, report_in: ReportCreate) -> Report:
     report = Report(**report_in.dict())
     db.add(report)
     db.commit()
     db.refresh(report)
     return report
 
-@router.get("/", response_model=List[ReportRead])
-def list_reports(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Report).offset(skip).limit(limit).all()
-
-@router.get("/patient/{patient_id}", response_model=List[ReportRead])
-def list_reports_for_patient(patient_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(Report).filter(Report.patient_id == patient_id).all()
-
-@router.get("/{report_id}", response_model=ReportRead)
-def get_report(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    report = db.query(Report).filter(Report.id == report_id).first()
-    if not report:
-        raise HTTPException(status_code=404, detail="Report not found")
-    return report
+def report_page(db: Session, patient_id: Optional[int], cursor: Optional[str], limit: int):
+    # Newest first
+    query = db.query(Report)
+    if patient_id is not None:
+        query = query.filter(Report.patient_id == patient_id)
+    return keyset_page(query, [Report.created_at, Report.id], cursor, limit)
 
-@router.put("/{report_id}", response_model=ReportRead)
-def update_report(report_id: int, report_in: ReportCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    report = db.query(Report).filter(Report.id == report_id).first()
-    if not report:
-        raise HTTPException(status_code=404, detail="Report not found")
+def replace_report(db: Session, report_id: int, report_in: ReportCreate) -> Report:
+    report = find_report(db, report_id)
     for key, value in report_in.dict().items():
         setattr(report, key, value)
     db.commit()
     db.refresh(report)
     return report
 
-@router.delete("/{report_id}")
-def delete_report(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    report = db.query(Report).filter(Report.id == report_id).first()
-    if not report:
-        raise HTTPException(status_code=404, detail="Report not found")
-    db.delete(report)
+def remove_report(db: Session, report_id: int) -> dict:
+    db.delete(find_report(db, report_id))
     db.commit()
-    return {"ok": True} 
\ No newline at end of file
+    return {"ok": True}
+
+def report_etag(report: Report) -> str:
+    # updated_at moves on every change to the row
+    return row_etag(report.id, report.updated_at)
+
+def build_router(get_session: Callable, get_user: Callable) -> APIRouter:
+    router = APIRouter(prefix="/api/reports", tags=["reports"])
+
+    @router.post("/", response_model=ReportRead)
+    async def create_report(report_in: ReportCreate, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, add_report, report_in)
+
+    @router.get("/", response_model=List[ReportRead])
+    async def list_reports(request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db=Depends(get_session), current_user: User = Depends(get_user)):
+        reports, next_cursor = await run_db(db, report_page, None, cursor, limit)
+        set_next_cursor(request, response, next_cursor)
+        return model_response(ReportRead, reports, response)
+
+    @router.get("/patient/{patient_id}", response_model=List[ReportRead])
+    async def list_reports_for_patient(patient_id: int, request: Request, response: Response, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), db=Depends(get_session), current_user: User = Depends(get_user)):
+        reports, next_cursor = await run_db(db, report_page, patient_id, cursor, limit)
+        set_next_cursor(request, response, next_cursor)
+        return model_response(ReportRead, reports, response)
+
+    @router.get("/{report_id}", response_model=ReportRead)
+    async def get_report(report_id: int, request: Request, response: Response, db=Depends(get_session), current_user: User = Depends(get_user)):
+        report = await run_db(db, find_report, report_id)
+        return check_etag(request, response, report_etag(report)) or model_response(ReportRead, report, response)
+
+    @router.put("/{report_id}", response_model=ReportRead)
+    async def update_report(report_id: int, report_in: ReportCreate, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, replace_report, report_id, report_in)
+
+    @router.delete("/{report_id}")
+    async def delete_report(report_id: int, db=Depends(get_session), current_user: User = Depends(get_user)):
+        return await run_db(db, remove_report, report_id)
+
+    return router
+
+router = build_router(get_db, get_current_user)
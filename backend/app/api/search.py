@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.orm import Session
+from typing import List, Literal, Optional
+from app.schemas.search import SearchHit
+from app.core.deps import get_db, get_current_user
+from app.core.pagination import MAX_PAGE_SIZE, set_next_cursor
+from app.core.search import SEARCH_KINDS, search
+from app.models.user import User
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+@router.get("/", response_model=List[SearchHit])
+def search_records(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, description="Words to find in report content and analysis findings"),
+    kind: Optional[Literal["report", "analysis"]] = None,
+    patient_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    # Best match first
+    kinds = [kind] if kind else list(SEARCH_KINDS)
+    hits, next_cursor = search(db, q, kinds, patient_id, cursor, limit)
+    set_next_cursor(request, response, next_cursor)
+    return hits
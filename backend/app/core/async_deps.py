@@ -0,0 +1,29 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.deps import db_slot, oauth2_scheme
+from app.core.security import decode_access_token
+from app.db.session import AsyncSessionLocal
+from app.models.user import User
+
+# Dependencies for the DB_ASYNC=true routers; see app.core.deps for the sync ones
+
+async def get_async_db():
+    # Same backpressure as get_db: wait for a slot, not inside the pool
+    async with db_slot():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = decode_access_token(token)
+    if payload is None or "sub" not in payload:
+        raise credentials_exception
+    user = (await db.execute(select(User).where(User.email == payload["sub"]))).scalars().first()
+    if user is None:
+        raise credentials_exception
+    return user
@@ -0,0 +1,155 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import IO, Callable, Iterator, List, Optional, Set, Tuple
+
+BLOB_DIR = os.getenv("BLOB_DIR", "blob_store")
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "true").lower() not in ("0", "false", "no")  # keep images of saved analyses
+BLOB_GC_INTERVAL = int(os.getenv("BLOB_GC_INTERVAL", 3600))  # seconds between sweeps for unreferenced blobs; 0 disables
+BLOB_GC_GRACE = int(os.getenv("BLOB_GC_GRACE", 3600))  # blobs younger than this are never swept
+
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_digest(value: str) -> bool:
+    return bool(SHA256_HEX.match(value or ""))
+
+
+class BlobStore:
+    """Content-addressed files on the local filesystem.
+
+    A blob lives at ``objects/<first two hex digits>/<sha256>``, so identical
+    uploads are stored once. Files derived from a blob (thumbnails, tiles) go
+    under ``derived/<first two hex digits>/<sha256>/``. Every write goes to a
+    temporary file first and is renamed into place, so readers never see a
+    partial file and concurrent writers of the same content are harmless.
+    """
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self.puts = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.deleted = 0
+        self.sweeps = 0
+        self.last_sweep_error: Optional[str] = None
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def derived_path(self, digest: str, *parts: str) -> str:
+        return os.path.join(self.root, "derived", digest[:2], digest, *parts)
+
+    def exists(self, digest: str) -> bool:
+        return is_digest(digest) and os.path.exists(self.path(digest))
+
+    def write_atomic(self, path: str, fp: IO[bytes]) -> int:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(fp, out)
+                size = out.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return size
+
+    def put(self, digest: str, fp: IO[bytes]) -> bool:
+        # ``digest`` must be the sha256 of ``fp``'s content (spooled uploads
+        # carry it already). Returns False when the blob was already stored.
+        path = self.path(digest)
+        if os.path.exists(path):
+            try:
+                # A fresh mtime keeps the sweep from removing it before its analysis is saved
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                with self._lock:
+                    self.deduplicated += 1
+                return False
+        fp.seek(0)
+        size = self.write_atomic(path, fp)
+        fp.seek(0)
+        with self._lock:
+            self.puts += 1
+            self.bytes_written += size
+        return True
+
+    def digests(self) -> Iterator[Tuple[str, float]]:
+        # (digest, mtime) of every stored blob
+        objects = os.path.join(self.root, "objects")
+        if not os.path.isdir(objects):
+            return
+        for prefix in os.scandir(objects):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if is_digest(entry.name):
+                    try:
+                        yield entry.name, entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+
+    def delete(self, digest: str) -> bool:
+        # Removes the blob and everything derived from it
+        shutil.rmtree(self.derived_path(digest), ignore_errors=True)
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self.deleted += 1
+        return True
+
+    def _touched_since(self, digest: str, cutoff: float) -> bool:
+        # Re-uploaded while the sweep was checking references
+        try:
+            return os.stat(self.path(digest)).st_mtime >= cutoff
+        except FileNotFoundError:
+            return True
+
+    def sweep(self, referenced: Callable[[List[str]], Set[str]], grace: float = BLOB_GC_GRACE,
+              batch_size: int = 500) -> int:
+        """Deletes blobs older than ``grace`` seconds that nothing refers to.
+
+        ``referenced`` gets a batch of digests and returns those still in use.
+        Returns how many blobs were deleted.
+        """
+        cutoff = time.time() - grace
+        deleted = 0
+        candidates = [digest for digest, mtime in self.digests() if mtime < cutoff]
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            in_use = referenced(batch)
+            for digest in batch:
+                if digest in in_use or self._touched_since(digest, cutoff):
+                    continue
+                if self.delete(digest):
+                    deleted += 1
+        with self._lock:
+            self.sweeps += 1
+            self.last_sweep_error = None
+        return deleted
+
+    def stats(self) -> dict:
+        return {
+            "enabled": BLOB_STORE_ENABLED,
+            "root": os.path.abspath(self.root),
+            "puts": self.puts,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+            "deleted": self.deleted,
+            "sweeps": self.sweeps,
+            "last_sweep_error": self.last_sweep_error,
+        }
+
+
+blob_store = BlobStore()
@@ -0,0 +1,247 @@
+"""Bulk patient import and streaming table export.
+
+Imports are read from a CSV or NDJSON file one chunk of ``BULK_CHUNK_SIZE``
+rows at a time. Each chunk is validated with the same ``PatientCreate``
+schema as ``POST /api/patients/`` and written in one statement: an
+``INSERT ... ON CONFLICT (medical_record_number) DO UPDATE``, fed by ``COPY``
+on PostgreSQL with psycopg2, or as a batched executemany elsewhere. Rows with
+a known medical record number update that patient, the rest are inserted.
+
+Exports stream rows in id order with ``yield_per``, which opens a server-side
+cursor on PostgreSQL. Memory therefore stays at one batch however large the
+table is.
+"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import Select, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.patient import Patient
+from app.schemas.patient import PatientCreate
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))  # rows validated and written per statement
+BULK_EXPORT_BATCH = int(os.getenv("BULK_EXPORT_BATCH", 1000))  # rows fetched from the cursor at a time
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", 100))  # invalid rows listed in the import summary
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+PATIENT_FIELDS = ["name", "dob", "gender", "medical_record_number"]
+UPDATED_FIELDS = ["name", "dob", "gender"]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or (content_type or "").startswith("text/csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or (content_type or "") in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    raise HTTPException(status_code=400, detail="Cannot tell the file format; pass format=csv or format=ndjson")
+
+
+def read_records(fp: IO[bytes], fmt: str) -> Iterator[Tuple[int, object]]:
+    # Yields (line number, record); malformed rows and lines come back as the exception
+    text = io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            try:
+                reader.fieldnames
+            except csv.Error as exc:
+                raise HTTPException(status_code=400, detail=f"Malformed CSV header: {exc}")
+            while True:
+                start = reader.line_num + 1
+                try:
+                    record = next(reader)
+                except StopIteration:
+                    break
+                except csv.Error as exc:
+                    # An oversized field, say: skip that row, like a bad NDJSON line
+                    yield start, exc
+                    continue
+                # Empty cells mean "not given", as they do for the optional fields of the JSON API
+                yield reader.line_num, {key: value for key, value in record.items() if key and value != ""}
+        else:
+            for line_number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as exc:
+                    yield line_number, exc
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File is not UTF-8 text")
+    finally:
+        text.detach()
+
+
+def validate_chunk(records: List[Tuple[int, object]]) -> Tuple[List[dict], List[dict]]:
+    rows: Dict[object, dict] = {}
+    errors = []
+    for line, record in records:
+        if isinstance(record, csv.Error):
+            errors.append({"line": line, "error": f"Malformed CSV row: {record}"})
+            continue
+        if isinstance(record, Exception):
+            errors.append({"line": line, "error": f"Invalid JSON: {record}"})
+            continue
+        if not isinstance(record, dict):
+            errors.append({"line": line, "error": "Expected an object"})
+            continue
+        try:
+            row = PatientCreate(**record).dict()
+        except ValidationError as exc:
+            detail = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+            errors.append({"line": line, "error": detail})
+            continue
+        # A record number repeated within the chunk: the last row wins, as it would across chunks
+        rows[row["medical_record_number"] or ("line", line)] = row
+    return list(rows.values()), errors
+
+
+def _copy_text(value) -> str:
+    # One field of COPY's text format
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_upsert(db: Session, rows: List[dict]) -> int:
+    # COPY into a session-scoped staging table, then one INSERT ... SELECT
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS patient_import "
+            "(name text, dob date, gender text, medical_record_number text)"
+        )
+        buf = io.StringIO("".join(
+            "\t".join(_copy_text(row[field]) for field in PATIENT_FIELDS) + "\n" for row in rows
+        ))
+        cursor.copy_expert(f"COPY patient_import ({', '.join(PATIENT_FIELDS)}) FROM STDIN", buf)
+        cursor.execute(
+            f"INSERT INTO patients ({', '.join(PATIENT_FIELDS)}) "
+            f"SELECT {', '.join(PATIENT_FIELDS)} FROM patient_import "
+            f"ON CONFLICT (medical_record_number) DO UPDATE SET "
+            + ", ".join(f"{field} = EXCLUDED.{field}" for field in UPDATED_FIELDS)
+            + " RETURNING (xmax = 0)"
+        )
+        inserted = sum(1 for (is_new,) in cursor.fetchall() if is_new)
+        cursor.execute("DELETE FROM patient_import")
+        return inserted
+    finally:
+        cursor.close()
+
+
+def _executemany_upsert(db: Session, rows: List[dict]) -> int:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f"Bulk import is not available on {dialect}")
+    numbers = [row["medical_record_number"] for row in rows if row["medical_record_number"] is not None]
+    known = set(db.scalars(
+        select(Patient.medical_record_number).where(Patient.medical_record_number.in_(numbers))
+    )) if numbers else set()
+    statement = insert(Patient.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Patient.medical_record_number],
+        set_={field: statement.excluded[field] for field in UPDATED_FIELDS},
+    )
+    db.execute(statement, rows)
+    return len(rows) - sum(1 for number in numbers if number in known)
+
+
+def upsert_patients(db: Session, rows: List[dict]) -> int:
+    # Returns how many of ``rows`` were new patients
+    if not rows:
+        return 0
+    if db.get_bind().dialect.driver == "psycopg2":
+        return _copy_upsert(db, rows)
+    return _executemany_upsert(db, rows)
+
+
+def chunks(records: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_patients(db: Session, fp: IO[bytes], fmt: str, atomic: bool = False,
+                    chunk_size: int = BULK_CHUNK_SIZE) -> dict:
+    """Validates and upserts every row of ``fp``.
+
+    By default each chunk is committed on its own and invalid rows are skipped
+    and reported. With ``atomic`` nothing is committed unless every row is
+    valid.
+    """
+    summary = {"rows": 0, "inserted": 0, "updated": 0, "invalid": 0, "errors": []}
+    try:
+        for chunk in chunks(read_records(fp, fmt), chunk_size):
+            rows, errors = validate_chunk(chunk)
+            summary["rows"] += len(chunk)
+            summary["invalid"] += len(errors)
+            summary["errors"].extend(errors[:max(0, BULK_MAX_ERRORS - len(summary["errors"]))])
+            if atomic and summary["invalid"]:
+                raise HTTPException(status_code=422, detail=dict(summary, inserted=0, updated=0))
+            inserted = upsert_patients(db, rows)
+            summary["inserted"] += inserted
+            summary["updated"] += len(rows) - inserted
+            if not atomic:
+                db.commit()
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return summary
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def stream_rows(db: Session, statement: Select, fmt: str, batch_size: int = BULK_EXPORT_BATCH) -> Iterator[str]:
+    """Yields ``statement``'s rows as CSV or NDJSON text, one chunk per batch.
+
+    The caller owns ``db``; close it once the iterator is exhausted or dropped.
+    """
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for partition in result.partitions():
+            writer.writerows([_csv_value(value) for value in row] for row in partition)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    else:
+        for partition in result.partitions():
+            yield "".join(
+                json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in partition
+            )
@@ -0,0 +1,157 @@
+"""Response compression: Brotli when the client accepts it, gzip otherwise.
+
+Bodies under ``COMPRESSION_MINIMUM_SIZE`` bytes, partial (206) responses and
+already-compressed media types are sent as they are. Streamed bodies (NDJSON
+exports, study results) are compressed chunk by chunk and flushed after each
+one, so clients still see rows as they are produced.
+"""
+import os
+import zlib
+from typing import Optional
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # listed in requirements.txt; without it every client gets gzip
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() not in ("0", "false", "no")
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))  # bytes; smaller bodies are sent as is
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))  # 1-9
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))  # 0-11; 4 is about gzip -6 speed at a smaller size
+
+# Chunks at least this large are compressed on a worker thread, off the event loop
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+# Already compressed, or (event streams) meant to reach the client unbuffered. Originals
+# in the image store are either compressed formats or large DICOM files.
+EXCLUDED_CONTENT_TYPES = {
+    "application/dicom", "application/gzip", "application/octet-stream", "application/x-gzip",
+    "application/zip", "font/woff", "font/woff2", "text/event-stream",
+}
+EXCLUDED_MAJOR_TYPES = {"audio", "image", "video"}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    # "br" or "gzip", whichever the client accepts (preferring Brotli), or None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compressible(headers: Headers) -> bool:
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return (
+        "content-encoding" not in headers
+        and media_type not in EXCLUDED_CONTENT_TYPES
+        and media_type.partition("/")[0] not in EXCLUDED_MAJOR_TYPES
+    )
+
+
+class Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        # A partial chunk is flushed, so it can be decoded before the rest arrives
+        if self.encoding == "br":
+            return self._brotli.process(body) + (self._brotli.flush() if more_body else self._brotli.finish())
+        return self._zlib.compress(body) + self._zlib.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+    async def compress_async(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            return await anyio.to_thread.run_sync(self.compress, body, more_body)
+        return self.compress(body, more_body)
+
+
+class CompressionMiddleware:
+    """Plain ASGI middleware that wraps ``send`` and compresses the body."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+                 gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, compressor, passthrough
+            kind = message["type"]
+            if kind == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                headers = Headers(raw=message["headers"])
+                passthrough = message["status"] in (204, 206, 304) or not compressible(headers)
+                if passthrough:
+                    await send(message)
+                return
+            if passthrough or kind != "http.response.body":
+                # Trailers, pathsend (zero-copy files) and anything else go out untouched
+                if start is not None and not passthrough and compressor is None:
+                    passthrough = True
+                    await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # The compressed bytes differ from the identity ones
+                    headers["ETag"] = f"W/{etag}"
+                compressed = await compressor.compress_async(body, more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start)
+            else:
+                compressed = await compressor.compress_async(body, more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
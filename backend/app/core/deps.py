@@ -1,19 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+import anyio
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
 from app.core.security import decode_access_token
-from app.db.session import SessionLocal
+from app.db.session import DB_MAX_OVERFLOW, DB_POOL_SIZE, DB_POOL_TIMEOUT, SessionLocal
 from app.models.user import User
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-def get_db():
-    db = SessionLocal()
+_db_slots: Optional[asyncio.Semaphore] = None
+_db_slots_loop: Optional[asyncio.AbstractEventLoop] = None
+_close_limiter: Optional[anyio.CapacityLimiter] = None
+
+def db_slots() -> asyncio.Semaphore:
+    global _db_slots, _db_slots_loop, _close_limiter
+    loop = asyncio.get_running_loop()
+    if _db_slots is None or _db_slots_loop is not loop:
+        _db_slots_loop = loop
+        _db_slots = asyncio.Semaphore(max(1, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+        # One thread per session that can be open, apart from the shared threadpool
+        _close_limiter = anyio.CapacityLimiter(max(1, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+    return _db_slots
+
+@asynccontextmanager
+async def db_slot():
+    # Requests wait for a pooled connection here, on the event loop. Waiting
+    # in the pool itself would park threadpool workers, and once every worker
+    # is parked the requests holding connections have no thread to finish on.
+    # Everything that opens a SessionLocal() goes through here.
+    slots = db_slots()
     try:
-        yield db
+        await asyncio.wait_for(slots.acquire(), timeout=DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, try again")
+    try:
+        yield
     finally:
-        db.close()
+        slots.release()
+
+@asynccontextmanager
+async def db_session():
+    # A SessionLocal() for code that outlives the request's dependencies,
+    # such as a streaming response body
+    async with db_slot():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            # Closing never queues behind request work in the shared threadpool
+            await anyio.to_thread.run_sync(db.close, limiter=_close_limiter)
+
+async def get_db():
+    async with db_session() as db:
+        yield db
+
+async def run_db(db, fn, *args):
+    # fn(session, *args) with a sync Session either way: an AsyncSession runs it
+    # on the event loop through run_sync, a sync Session on the threadpool
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     credentials_exception = HTTPException(
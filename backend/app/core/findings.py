@@ -0,0 +1,100 @@
+import ast
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, exists, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app.models.analysis import Analysis
+from app.models.pathology import AnalysisScore, Pathology
+
+# Keyset order of score searches: highest score first
+SCORE_ORDER = [AnalysisScore.score, AnalysisScore.analysis_id]
+
+
+def parse_scores(findings) -> Optional[Dict[str, float]]:
+    # Classifier findings reach the API as the str() of a {pathology: score}
+    # dict (that is what the frontend posts back); anything else has no scores.
+    if isinstance(findings, dict):
+        value = findings
+    elif isinstance(findings, str):
+        try:
+            value = json.loads(findings)
+        except ValueError:
+            try:
+                value = ast.literal_eval(findings)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                return None
+    else:
+        return None
+    if not isinstance(value, dict) or not value:
+        return None
+    try:
+        return {str(name): float(score) for name, score in value.items()}
+    except (TypeError, ValueError):
+        return None
+
+
+def pathology_ids(db: Session, names: Iterable[str], create: bool = True) -> Dict[str, int]:
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.query(Pathology.name, Pathology.id).filter(Pathology.name.in_(names)).all())
+    if create:
+        for name in names - ids.keys():
+            try:
+                # Savepoint, so a concurrent insert of the same name only loses this row
+                with db.begin_nested():
+                    pathology = Pathology(name=name)
+                    db.add(pathology)
+                ids[name] = pathology.id
+            except IntegrityError:
+                ids[name] = db.query(Pathology.id).filter(Pathology.name == name).scalar()
+    return ids
+
+
+def attach_scores(db: Session, analyses: Iterable):
+    """Fill ``scores`` (from the findings text if not set) and the indexed score rows."""
+    analyses = list(analyses)
+    for analysis in analyses:
+        if analysis.scores is None:
+            analysis.scores = parse_scores(analysis.findings)
+    ids = pathology_ids(db, (name for analysis in analyses for name in analysis.scores or {}))
+    for analysis in analyses:
+        analysis.score_rows = [
+            AnalysisScore(pathology_id=ids[name], score=score)
+            for name, score in (analysis.scores or {}).items()
+        ]
+
+
+def parse_condition(condition: str) -> Tuple[str, float]:
+    name, sep, threshold = condition.rpartition(":")
+    try:
+        if not sep or not name:
+            raise ValueError
+        return name, float(threshold)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid condition {condition!r}, expected 'Pathology:min_score'")
+
+
+def score_search(ids: Dict[str, int], pathology: str, min_score: float, max_score: Optional[float],
+                 conditions: List[Tuple[str, float]], patient_id: Optional[int]):
+    # Filtering and ranking both run in the database on the
+    # (pathology_id, score, analysis_id) index; page with SCORE_ORDER.
+    statement = (
+        select(Analysis, AnalysisScore.score, AnalysisScore.analysis_id)
+        .join(AnalysisScore, AnalysisScore.analysis_id == Analysis.id)
+        .where(AnalysisScore.pathology_id == ids[pathology], AnalysisScore.score >= min_score)
+    )
+    if max_score is not None:
+        statement = statement.where(AnalysisScore.score <= max_score)
+    if patient_id is not None:
+        statement = statement.where(Analysis.patient_id == patient_id)
+    for name, threshold in conditions:
+        other = aliased(AnalysisScore)
+        statement = statement.where(exists().where(and_(
+            other.analysis_id == Analysis.id, other.pathology_id == ids[name], other.score >= threshold,
+        )))
+    return statement
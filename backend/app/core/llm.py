@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "YOUR_OPENROUTER_API_KEY")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # upstream calls in flight at once
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", 0.5))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))  # seconds a completed report is reused, 0 disables
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 512))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMClient:
+    """Async client for an OpenAI-compatible chat completions endpoint.
+
+    One pooled httpx.AsyncClient is shared by all requests, a semaphore caps
+    concurrent upstream calls, and transient failures (connection errors,
+    429 and 5xx) are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, url: str = OPENROUTER_URL, api_key: str = OPENROUTER_API_KEY,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 backoff: float = LLM_BACKOFF_SECONDS, timeout: float = LLM_TIMEOUT,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.api_key = api_key
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.transport = transport  # None for the network; tests pass an httpx.ASGITransport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.upstream_seconds = 0.0
+        self.first_token_seconds = 0.0
+        self.streams = 0
+
+    async def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Connections belong to the loop that opened them; rebind if it changed
+            old_client, old_loop = self._client, self._loop
+            self._loop = loop
+            if old_client is not None:
+                await self._close_on(old_client, old_loop)
+            self._client = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0)),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @staticmethod
+    async def _close_on(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]):
+        # Closes a client left behind by another event loop, on that loop if it still runs
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        try:
+            await client.aclose()
+        except Exception:
+            # Its loop is gone, so its sockets cannot be shut down cleanly; the
+            # pool is closed all the same and the sockets go with it
+            pass
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.timeout)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def complete(self, payload: dict) -> str:
+        client = await self._ensure_client()
+        async with self._slots:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    response = None
+                    try:
+                        self.requests += 1
+                        response = await client.post(self.url, json=dict(payload, stream=False))
+                        if response.status_code not in RETRY_STATUS_CODES:
+                            response.raise_for_status()
+                            return response.json()["choices"][0]["message"]["content"]
+                    except httpx.TransportError:
+                        if attempt == self.max_retries:
+                            raise
+                    if attempt == self.max_retries:
+                        response.raise_for_status()
+                    self.retries += 1
+                    await asyncio.sleep(self._delay(attempt, response))
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.upstream_seconds += time.perf_counter() - started
+
+    async def stream(self, payload: dict) -> AsyncIterator[str]:
+        # Yields content deltas as they arrive. Retries only happen before the
+        # first token, since a partial answer cannot be taken back.
+        client = await self._ensure_client()
+        async with self._slots:
+            self.in_flight += 1
+            self.streams += 1
+            started = time.perf_counter()
+            first_token = True
+            try:
+                for attempt in range(self.max_retries + 1):
+                    self.requests += 1
+                    try:
+                        async with client.stream("POST", self.url, json=dict(payload, stream=True)) as response:
+                            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                                self.retries += 1
+                                await asyncio.sleep(self._delay(attempt, response))
+                                continue
+                            if response.is_error:
+                                await response.aread()
+                                response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                # Server-sent events; lines starting with ":" are keep-alive comments
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                choice = json.loads(data)["choices"][0]
+                                token = (choice.get("delta") or {}).get("content")
+                                if token:
+                                    if first_token:
+                                        first_token = False
+                                        self.first_token_seconds += time.perf_counter() - started
+                                    yield token
+                            return
+                    except httpx.TransportError:
+                        if not first_token or attempt == self.max_retries:
+                            raise
+                        self.retries += 1
+                        await asyncio.sleep(self._delay(attempt))
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.upstream_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "streams": self.streams,
+            "upstream_seconds": self.upstream_seconds,
+            "mean_time_to_first_token_ms": 1000.0 * self.first_token_seconds / self.streams if self.streams else 0.0,
+        }
+
+
+def prompt_key(url: str, payload: dict) -> str:
+    # Same endpoint, model, messages and parameters means the same completion;
+    # whether the caller streams it does not matter.
+    body = {k: v for k, v in payload.items() if k != "stream"}
+    return hashlib.sha256(json.dumps([url, body], sort_keys=True).encode()).hexdigest()
+
+
+class _Flight:
+    # One upstream call that any number of identical requests follow. An
+    # exclusive flight has a single follower and is cancelled when it leaves.
+    def __init__(self, exclusive: bool = False):
+        self.tokens: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.followers = 0
+        self.exclusive = exclusive
+        self.task: Optional[asyncio.Task] = None
+        self.started = time.perf_counter()
+        self.changed = asyncio.Condition()
+
+    async def push(self, token: str):
+        async with self.changed:
+            self.tokens.append(token)
+            self.changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None):
+        async with self.changed:
+            self.error = error
+            self.finished = True
+            self.changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        seen = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: len(self.tokens) > seen or self.finished)
+                    new, finished = self.tokens[seen:], self.finished
+                for token in new:
+                    yield token
+                seen += len(new)
+                if finished and seen == len(self.tokens):
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            # Nobody else wants the answer, so stop paying for it
+            if self.exclusive and not self.finished and self.task is not None:
+                self.task.cancel()
+
+
+class CoalescingCompletions:
+    """Deduplicates identical completions on top of an LLMClient.
+
+    Concurrent identical prompts share one upstream call, driven by a
+    background task so it survives any single caller disconnecting, and
+    finished reports are kept in a TTL-bounded LRU cache. ``cache=False``
+    bypasses both, and its call is cancelled if the caller goes away;
+    ``refresh=True`` skips the cache read but stores the new result.
+    """
+
+    def __init__(self, client: LLMClient, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()  # key -> (text, expires, upstream seconds)
+        self._flights: Dict[str, _Flight] = {}
+        # The loop only holds tasks weakly; this keeps running flights alive
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.refreshed = 0
+        self.expired = 0
+        self.abandoned = 0
+        self.saved_upstream_seconds = 0.0
+
+    def _cached(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        text, expires, upstream_seconds = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            self.expired += 1
+            return None
+        self._cache.move_to_end(key)
+        self.saved_upstream_seconds += upstream_seconds
+        return text
+
+    def _store(self, key: str, text: str, upstream_seconds: float):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._cache[key] = (text, time.monotonic() + self.ttl, upstream_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _drive(self, key: str, flight: _Flight, payload: dict, stream: bool):
+        try:
+            if stream:
+                async for token in self.client.stream(payload):
+                    await flight.push(token)
+            else:
+                await flight.push(await self.client.complete(payload))
+        except asyncio.CancelledError:
+            self.abandoned += 1
+            raise
+        except Exception as exc:
+            await flight.finish(exc)
+        else:
+            elapsed = time.perf_counter() - flight.started
+            self.saved_upstream_seconds += elapsed * flight.followers
+            if key is not None:
+                self._store(key, "".join(flight.tokens), elapsed)
+            await flight.finish()
+        finally:
+            if key is not None:
+                self._flights.pop(key, None)
+
+    def _start(self, key: Optional[str], flight: _Flight, payload: dict, stream: bool):
+        flight.task = asyncio.ensure_future(self._drive(key, flight, payload, stream))
+        self._tasks.add(flight.task)
+        flight.task.add_done_callback(self._tasks.discard)
+
+    def _open(self, payload: dict, stream: bool, cache: bool, refresh: bool) -> Tuple[str, object]:
+        # Returns ("hit", text), ("coalesced", flight), ("miss", flight) or ("bypass", flight)
+        if not cache:
+            self.bypassed += 1
+            flight = _Flight(exclusive=True)
+            self._start(None, flight, payload, stream)
+            return "bypass", flight
+        key = prompt_key(self.client.url, payload)
+        if refresh:
+            self.refreshed += 1
+        else:
+            text = self._cached(key)
+            if text is not None:
+                self.hits += 1
+                return "hit", text
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            flight.followers += 1
+            return "coalesced", flight
+        self.misses += 1
+        flight = self._flights[key] = _Flight()
+        self._start(key, flight, payload, stream)
+        return "miss", flight
+
+    async def complete(self, payload: dict, cache: bool = True, refresh: bool = False) -> Tuple[str, str]:
+        status, found = self._open(payload, stream=False, cache=cache, refresh=refresh)
+        if status == "hit":
+            return found, status
+        return "".join([token async for token in found.follow()]), status
+
+    def stream(self, payload: dict, cache: bool = True, refresh: bool = False) -> Tuple[str, AsyncIterator[str]]:
+        status, found = self._open(payload, stream=True, cache=cache, refresh=refresh)
+        if status == "hit":
+            async def replay():
+                yield found
+            return status, replay()
+        return status, found.follow()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "ttl_seconds": self.ttl,
+            "entries": len(self._cache),
+            "in_flight": len(self._flights),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "refreshed": self.refreshed,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "saved_upstream_seconds": self.saved_upstream_seconds,
+        }
+
+
+llm_client = LLMClient()
+report_completions = CoalescingCompletions(llm_client)
@@ -0,0 +1,331 @@
+"""In-process metrics in the Prometheus text format.
+
+Histograms carry the usual cumulative buckets (for ``histogram_quantile`` in
+PromQL) and, alongside, a ``<name>_recent`` summary with p50/p95/p99 over the
+last ``METRICS_WINDOW`` observations of each series, for reading ``/metrics``
+directly. Everything is kept per process: with several uvicorn workers, scrape
+each one.
+"""
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 1024))  # recent observations per series used for p50/p95/p99
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self, name: Optional[str] = None, kind: Optional[str] = None) -> List[str]:
+        name = name or self.name
+        return [f"# HELP {name} {self.documentation}", f"# TYPE {name} {kind or self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    """A settable gauge, or one read at scrape time from ``function``, which
+    returns ``{label values tuple: value}``."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], Dict[LabelKey, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            values = sorted(self.function().items())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, tuple(map(str, key)))} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class _Series:
+    __slots__ = ("counts", "total", "count", "recent")
+
+    def __init__(self, buckets: int, window: int):
+        self.counts = [0] * (buckets + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, window: int = METRICS_WINDOW):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.window = max(1, window)
+        self._series: Dict[LabelKey, _Series] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets), self.window)
+            series.counts[bisect_left(self.buckets, value)] += 1
+            series.total += value
+            series.count += 1
+            series.recent.append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            recent = sorted(series.recent) if series is not None else []
+        return {q: quantile(recent, q) for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [
+                (key, list(series.counts), series.total, series.count, sorted(series.recent))
+                for key, series in sorted(self._series.items())
+            ]
+        lines = self.header()
+        for key, counts, total, count, _ in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        recent_name = f"{self.name}_recent"
+        lines += self.header(recent_name, "summary")
+        for key, _, _, _, recent in snapshot:
+            for q in QUANTILES:
+                labels = _format_labels(self.labelnames, key, ("quantile", str(q)))
+                lines.append(f"{recent_name}{labels} {_format_value(quantile(recent, q))}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              function: Optional[Callable[[], Dict[LabelKey, float]]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route and status.", ["method", "route", "status"])
+http_duration = metrics.histogram("http_request_duration_seconds", "Time from request start until the response body was sent.", ["method", "route"])
+http_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+request_db_seconds = metrics.histogram("http_request_db_seconds", "Time one request spent executing SQL.", ["route"])
+request_db_queries = metrics.histogram("http_request_db_queries", "SQL statements executed by one request.", ["route"], COUNT_BUCKETS)
+db_query_duration = metrics.histogram("db_query_duration_seconds", "Time to execute one SQL statement.", ["operation"])
+stage_duration = metrics.histogram("ai_stage_duration_seconds", "Time spent in one stage of the inference pipeline.", ["stage"])
+
+
+class RequestTiming:
+    __slots__ = ("db_seconds", "db_queries")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+
+
+# Set by the middleware. Threadpool calls run in a copy of the request's
+# context, so SQL executed there still adds to the same RequestTiming.
+current_request: ContextVar[Optional[RequestTiming]] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    with stage_duration.time(stage=name):
+        yield
+
+
+def route_label(scope: dict) -> str:
+    # The route template, not the raw path, keeps the number of series bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        timing = RequestTiming()
+        token = current_request.set(timing)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            current_request.reset(token)
+            route = route_label(scope)
+            http_requests.inc(method=scope["method"], route=route, status=str(status))
+            http_duration.observe(elapsed, method=scope["method"], route=route)
+            request_db_seconds.observe(timing.db_seconds, route=route)
+            request_db_queries.observe(timing.db_queries, route=route)
+
+
+SQL_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def instrument_engine(engine: Engine):
+    # For an AsyncEngine pass ``async_engine.sync_engine``
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        words = statement.lstrip().split(None, 1)
+        operation = words[0].upper() if words else ""
+        db_query_duration.observe(elapsed, operation=operation if operation in SQL_OPERATIONS else "OTHER")
+        timing = current_request.get()
+        if timing is not None:
+            timing.db_seconds += elapsed
+            timing.db_queries += 1
+
+    @event.listens_for(engine, "handle_error")
+    def _failed_query(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
@@ -0,0 +1,66 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if getattr(column.type, "python_type", None) is datetime else v
+            for v, column in zip(values, columns)
+        ]
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(query, columns: Sequence, cursor: Optional[str], limit: int, descending: bool = True):
+    # Works on both ORM Query objects and select() statements
+    if cursor:
+        position = tuple(decode_cursor(cursor, columns))
+        key = tuple_(*columns)
+        query = query.filter(key < position if descending else key > position)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows: List, columns: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    # keyset_filter fetches one extra row to tell whether a next page exists
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+def keyset_page(query, columns: Sequence, cursor: Optional[str], limit: int, descending: bool = True) -> Tuple[List, Optional[str]]:
+    """Return one page of ``query`` ordered by ``columns`` and the cursor for the next page.
+
+    The position is carried in the cursor as the last row's sort key, so every
+    page is an index range scan no matter how deep it is, unlike OFFSET.
+    """
+    rows = keyset_filter(query, columns, cursor, limit, descending).all()
+    return split_page(rows, columns, limit)
+
+
+def set_next_cursor(request: Request, response: Response, next_cursor: Optional[str]):
+    # Pages keep returning a plain list; the next cursor travels in headers
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
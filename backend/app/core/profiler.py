@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")  # sample from startup
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for every thread of the process.
+
+    A background thread reads the stack of each other thread every
+    ``interval_ms`` and counts identical stacks. The result is in the
+    "collapsed" format (``outer;inner;leaf count`` per line) that flamegraph.pl
+    and speedscope read. Idle threads are sampled too, so look for the request
+    handlers and inference workers rather than the total.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = max(1.0, interval_ms) / 1000.0
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.sampled_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None):
+        if self.running:
+            return
+        if interval_ms is not None:
+            self.interval = max(1.0, interval_ms) / 1000.0
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.sampled_seconds = 0.0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            now = time.perf_counter()
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+                self.sampled_seconds += now - last
+            last = now
+
+    def collapsed(self) -> str:
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000.0,
+            "started_at": self.started_at,
+            "samples": self.samples,
+            "sampled_seconds": self.sampled_seconds,
+            "distinct_stacks": len(self._stacks),
+        }
+
+
+profiler = SamplingProfiler()
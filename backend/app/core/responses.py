@@ -0,0 +1,75 @@
+"""Fast JSON responses and conditional GETs.
+
+Routes with a ``response_model`` already get their output serialized to JSON
+bytes by Pydantic's Rust core; what remains is the validation pass that reads
+every attribute of every ORM row back through the schema. ``model_response``
+skips it when ``RESPONSE_VALIDATION`` is off and builds the body with orjson
+straight from the row's attributes, which gives the same bytes. Routes that
+build their payload by hand use ``ORJSONResponse``.
+"""
+import hashlib
+import os
+from typing import Optional, Type
+
+import orjson
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Set to false to skip re-validating ORM rows against the response model on hot routes
+RESPONSE_VALIDATION = os.getenv("RESPONSE_VALIDATION", "true").lower() not in ("0", "false", "no")
+
+# Authenticated data: caches keep it but must revalidate with the ETag each time
+REVALIDATE = "private, no-cache"
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # numpy scores serialize natively; anything else orjson can't handle goes through FastAPI's encoder
+        return orjson.dumps(
+            content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
+def model_response(schema: Type[BaseModel], content, response: Response):
+    """Returns ``content`` (an ORM object or a list of them) for ``schema``.
+
+    Only for flat schemas whose fields are all attributes of the row. With
+    validation on this is ``content`` itself, for FastAPI to validate.
+    """
+    if RESPONSE_VALIDATION:
+        return content
+    fields = list(schema.model_fields)
+    if isinstance(content, list):
+        data = [{field: getattr(item, field) for field in fields} for item in content]
+    else:
+        data = {field: getattr(content, field) for field in fields}
+    fast = ORJSONResponse(data)
+    # Headers the route set on ``response`` (cursor links, ETag), as FastAPI would copy them
+    fast.headers.raw.extend(response.headers.raw)
+    return fast
+
+
+def row_etag(*values) -> str:
+    # Weak: the same row may be sent gzip- or brotli-encoded
+    digest = hashlib.sha1(orjson.dumps(values, default=str)).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    candidates = request.headers.get("if-none-match", "")
+    if candidates.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return opaque in [c.strip().removeprefix("W/") for c in candidates.split(",")]
+
+
+def check_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    # A 304 if the client has this version already; otherwise tags ``response`` and returns None
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,85 @@
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Float, Integer, String, column, text
+from sqlalchemy.orm import Session
+
+from app.core.pagination import decode_cursor, split_page
+from app.db.search_index import SEARCH_LANGUAGE
+
+SEARCH_KINDS = {"report": ("reports", "content"), "analysis": ("analyses", "findings")}
+# Results are ordered by (rank, kind, id), best match first
+SEARCH_KEY = [column("rank", Float), column("kind", String), column("id", Integer)]
+HIGHLIGHT = ("<mark>", "</mark>")
+
+FTS5_TOKEN = re.compile(r"(\w+)(\*?)")
+
+
+def fts5_query(q: str) -> str:
+    # Free text to an FTS5 query: every word must match, "word*" matches a
+    # prefix. Quoting each token keeps FTS5 operators out of user input.
+    return " ".join(f'"{word}"{star}' for word, star in FTS5_TOKEN.findall(q))
+
+
+def postgresql_branch(kind: str, patient_filter: bool) -> str:
+    table, body = SEARCH_KINDS[kind]
+    return (
+        f"SELECT '{kind}' AS kind, t.id, t.patient_id, t.created_at, "
+        f"ts_rank_cd(t.search_vector, q.query)::float8 AS rank, t.{body} AS body "
+        f"FROM {table} t, websearch_to_tsquery('{SEARCH_LANGUAGE}', :q) AS q(query) "
+        f"WHERE t.search_vector @@ q.query" + (" AND t.patient_id = :patient_id" if patient_filter else "")
+    )
+
+
+def sqlite_branch(kind: str, patient_filter: bool) -> str:
+    table, _ = SEARCH_KINDS[kind]
+    fts = f"{table}_fts"
+    start, stop = HIGHLIGHT
+    return (
+        f"SELECT '{kind}' AS kind, t.id AS id, t.patient_id AS patient_id, t.created_at AS created_at, "
+        f"-bm25({fts}) AS rank, snippet({fts}, 0, '{start}', '{stop}', '…', 16) AS headline "
+        f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+        f"WHERE {fts} MATCH :q" + (" AND t.patient_id = :patient_id" if patient_filter else "")
+    )
+
+
+def search_statement(dialect: str, kinds: Sequence[str], patient_filter: bool, after_cursor: bool):
+    page = "ORDER BY rank DESC, kind DESC, id DESC LIMIT :limit"
+    where = "WHERE (rank, kind, id) < (:rank, :kind, :id)" if after_cursor else ""
+    if dialect == "postgresql":
+        hits = " UNION ALL ".join(postgresql_branch(kind, patient_filter) for kind in kinds)
+        start, stop = HIGHLIGHT
+        # Headlines are costly, so they are built for the page only
+        sql = (
+            f"SELECT kind, id, patient_id, created_at, rank, "
+            f"ts_headline('{SEARCH_LANGUAGE}', coalesce(body, ''), websearch_to_tsquery('{SEARCH_LANGUAGE}', :q), "
+            f"'StartSel={start}, StopSel={stop}, MaxFragments=2, MaxWords=30, MinWords=10') AS headline "
+            f"FROM (SELECT * FROM ({hits}) AS hits {where} {page}) AS page "
+            f"ORDER BY rank DESC, kind DESC, id DESC"
+        )
+    elif dialect == "sqlite":
+        hits = " UNION ALL ".join(sqlite_branch(kind, patient_filter) for kind in kinds)
+        sql = f"SELECT * FROM ({hits}) AS hits {where} {page}"
+    else:
+        raise HTTPException(status_code=501, detail=f"Full-text search is not available on {dialect}")
+    return text(sql).columns(
+        column("kind", String), column("id", Integer), column("patient_id", Integer),
+        column("created_at", DateTime), column("rank", Float), column("headline", String),
+    )
+
+
+def search(db: Session, q: str, kinds: Sequence[str], patient_id: Optional[int],
+           cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """Ranked full-text matches over report content and analysis findings."""
+    dialect = db.get_bind().dialect.name
+    params = {"q": fts5_query(q) if dialect == "sqlite" else q, "limit": limit + 1}
+    if not params["q"].strip():
+        return [], None
+    if patient_id is not None:
+        params["patient_id"] = patient_id
+    if cursor:
+        params["rank"], params["kind"], params["id"] = decode_cursor(cursor, SEARCH_KEY)
+    statement = search_statement(dialect, kinds, patient_id is not None, bool(cursor))
+    rows = db.execute(statement, params).all()
+    return split_page(rows, SEARCH_KEY, limit)
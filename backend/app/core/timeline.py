@@ -0,0 +1,50 @@
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, String, column, select, tuple_
+from sqlalchemy.orm import joinedload
+
+from app.core.pagination import decode_cursor, encode_cursor
+from app.models.analysis import Analysis
+from app.models.report import Report
+
+# Timeline order is (created_at, kind, id), newest first; "report" sorts above
+# "analysis" when both share a timestamp.
+TIMELINE_KEY = [column("created_at", DateTime), column("kind", String), column("id", Integer)]
+
+
+def timeline_statements(patient_id: int, cursor: Optional[str], limit: int):
+    """One page of a patient's analyses and reports, as two index range scans.
+
+    Each statement fetches up to ``limit + 1`` rows past the cursor; report
+    authors are joined into the same statement.
+    """
+    analyses = select(Analysis).where(Analysis.patient_id == patient_id)
+    reports = select(Report).options(joinedload(Report.author)).where(Report.patient_id == patient_id)
+    if cursor:
+        created_at, kind, last_id = decode_cursor(cursor, TIMELINE_KEY)
+        if kind == "report":
+            analyses = analyses.where(Analysis.created_at <= created_at)
+            reports = reports.where(tuple_(Report.created_at, Report.id) < (created_at, last_id))
+        elif kind == "analysis":
+            analyses = analyses.where(tuple_(Analysis.created_at, Analysis.id) < (created_at, last_id))
+            reports = reports.where(Report.created_at < created_at)
+        else:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    analyses = analyses.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(limit + 1)
+    reports = reports.order_by(Report.created_at.desc(), Report.id.desc()).limit(limit + 1)
+    return analyses, reports
+
+
+def merge_timeline(analyses: List[Analysis], reports: List[Report], limit: int) -> Tuple[List[dict], Optional[str]]:
+    events = [{"kind": "analysis", "created_at": a.created_at, "id": a.id, "analysis": a} for a in analyses]
+    for report in reports:
+        report.author_name = report.author.full_name if report.author else None
+        events.append({"kind": "report", "created_at": report.created_at, "id": report.id, "report": report})
+    events.sort(key=lambda e: (e["created_at"], e["kind"], e["id"]), reverse=True)
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        last = events[-1]
+        next_cursor = encode_cursor([last["created_at"], last["kind"], last["id"]])
+    return events, next_cursor
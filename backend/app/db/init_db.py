@@ -1,8 +1,11 @@
 from app.db.session import engine, Base
+from app.db.search_index import create_search_index
 import app.models  # Ensure models are imported
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,65 @@
+"""Full-text index over report content and analysis findings.
+
+PostgreSQL keeps a generated ``search_vector`` tsvector column with a GIN
+index on each table; SQLite keeps external-content FTS5 tables in step with
+triggers. Either way the index follows every insert, update and delete
+without application code. The structures live outside the ORM metadata, so
+``create_search_index`` runs after ``create_all`` and Alembic's autogenerate
+is told to ignore them (``is_search_object``).
+"""
+from sqlalchemy.engine import Connection
+
+SEARCH_LANGUAGE = "english"
+
+# (table, text column) pairs covered by the index
+SEARCH_SOURCES = [("reports", "content"), ("analyses", "findings")]
+
+FTS_SUFFIXES = ("_fts", "_fts_data", "_fts_idx", "_fts_docsize", "_fts_config", "_fts_content")
+
+
+def postgresql_ddl(table: str, column: str) -> list:
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_LANGUAGE}', coalesce({column}, ''))) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin (search_vector)",
+    ]
+
+
+def sqlite_ddl(table: str, column: str) -> list:
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content='{table}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column}); END",
+        # Index rows that existed before the triggers
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_index(connection: Connection):
+    dialect = connection.dialect.name
+    for table, column in SEARCH_SOURCES:
+        if dialect == "postgresql":
+            statements = postgresql_ddl(table, column)
+        elif dialect == "sqlite":
+            statements = sqlite_ddl(table, column)
+        else:
+            raise NotImplementedError(f"Full-text search is not available on {dialect}")
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+
+
+def is_search_object(name: str, type_: str) -> bool:
+    if type_ == "table":
+        return name.endswith(FTS_SUFFIXES)
+    if type_ == "column":
+        return name == "search_vector"
+    if type_ == "index":
+        return name in {f"ix_{table}_search" for table, _ in SEARCH_SOURCES}
+    return False
@@ -0,0 +1 @@
+from .batching import MicroBatcher
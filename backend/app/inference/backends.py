@@ -0,0 +1,126 @@
+import json
+import os
+from typing import Callable, List
+
+import numpy as np
+
+AI_MODEL_DIR = os.getenv("AI_MODEL_DIR", "model_artifacts")  # where exported backends are stored
+AI_CLASSIFIER_BACKEND = os.getenv("AI_CLASSIFIER_BACKEND", "eager")
+AI_DETECTOR_BACKEND = os.getenv("AI_DETECTOR_BACKEND", "eager")
+
+BACKENDS = ("eager", "torchscript", "onnx", "int8-dynamic", "int8-static")
+SUPPORTED_BACKENDS = {
+    "classifier": BACKENDS,
+    # Faster R-CNN has data-dependent control flow that ONNX export and FX static
+    # quantization do not handle; its gains come from scripting and int8 Linear layers.
+    "detector": ("eager", "torchscript", "int8-dynamic"),
+}
+ARTIFACT_SUFFIXES = {
+    "torchscript": ".torchscript.pt",
+    "onnx": ".onnx",
+    "int8-dynamic": ".int8-dynamic.pt",
+    "int8-static": ".int8-static.pt",
+}
+
+
+def active_backend(name: str) -> str:
+    backend = {"classifier": AI_CLASSIFIER_BACKEND, "detector": AI_DETECTOR_BACKEND}[name]
+    if backend not in SUPPORTED_BACKENDS[name]:
+        raise ValueError(f"Backend {backend!r} is not supported for the {name}; "
+                         f"choose one of {', '.join(SUPPORTED_BACKENDS[name])}")
+    return backend
+
+
+def artifact_path(name: str, backend: str, model_dir: str = AI_MODEL_DIR) -> str:
+    return os.path.join(model_dir, f"{name}{ARTIFACT_SUFFIXES[backend]}")
+
+
+def metadata_path(name: str, model_dir: str = AI_MODEL_DIR) -> str:
+    return os.path.join(model_dir, f"{name}.json")
+
+
+class ClassifierRunner:
+    # Numpy in (Nx1x224x224 float32), numpy out (N x len(pathologies))
+    def __init__(self, forward: Callable[[np.ndarray], np.ndarray], pathologies: List[str], backend: str):
+        self.forward = forward
+        self.pathologies = list(pathologies)
+        self.backend = backend
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.forward(batch)
+
+
+class DetectorRunner:
+    # List of CxHxW float tensors in, list of {"boxes", "scores", "labels"} tensor dicts out
+    def __init__(self, module, backend: str):
+        self.module = module
+        self.backend = backend
+
+    def __call__(self, tensors):
+        import torch
+
+        with torch.no_grad():
+            outputs = self.module(tensors)
+        if isinstance(outputs, tuple):
+            # Scripted detection models return (losses, detections)
+            outputs = outputs[1]
+        return outputs
+
+
+def torch_forward(module) -> Callable[[np.ndarray], np.ndarray]:
+    import torch
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return module(torch.from_numpy(batch)).cpu().numpy()
+    return forward
+
+
+def onnx_forward(path: str) -> Callable[[np.ndarray], np.ndarray]:
+    try:
+        import onnxruntime as ort
+    except ImportError as error:
+        raise ImportError("The onnx backend needs onnxruntime; "
+                          "install it with: pip install -r requirements-onnx.txt") from error
+    import torch
+
+    options = ort.SessionOptions()
+    # Respect the per-worker thread budget the pool gave torch
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        return session.run(None, {input_name: batch})[0]
+    return forward
+
+
+def _require_artifact(name: str, backend: str, model_dir: str) -> str:
+    path = artifact_path(name, backend, model_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {backend} artifact for the {name} at {path}; "
+                                f"run: python -m app.inference.export --model {name} --backend {backend}")
+    return path
+
+
+def load_classifier_runner(backend: str, build_eager: Callable, model_dir: str = AI_MODEL_DIR) -> ClassifierRunner:
+    if backend == "eager":
+        model = build_eager()
+        return ClassifierRunner(torch_forward(model), model.pathologies, backend)
+    path = _require_artifact("classifier", backend, model_dir)
+    with open(metadata_path("classifier", model_dir)) as f:
+        pathologies = json.load(f)["pathologies"]
+    if backend == "onnx":
+        return ClassifierRunner(onnx_forward(path), pathologies, backend)
+    import torch
+
+    return ClassifierRunner(torch_forward(torch.jit.load(path, map_location="cpu")), pathologies, backend)
+
+
+def load_detector_runner(backend: str, build_eager: Callable, model_dir: str = AI_MODEL_DIR) -> DetectorRunner:
+    if backend == "eager":
+        return DetectorRunner(build_eager(), backend)
+    import torch
+
+    path = _require_artifact("detector", backend, model_dir)
+    return DetectorRunner(torch.jit.load(path, map_location="cpu"), backend)
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+from app.core.metrics import stage_duration
+
+AI_MAX_BATCH_SIZE = int(os.getenv("AI_MAX_BATCH_SIZE", 16))
+AI_MAX_BATCH_WAIT_MS = float(os.getenv("AI_MAX_BATCH_WAIT_MS", 10))
+AI_DETECTOR_MAX_BATCH_SIZE = int(os.getenv("AI_DETECTOR_MAX_BATCH_SIZE", 4))
+AI_STUDY_CONCURRENCY = int(os.getenv("AI_STUDY_CONCURRENCY", 16))  # images of one study in flight at once
+
+
+class MicroBatcher:
+    """Collects concurrent submissions into batches for a single batched call.
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` items or the
+    oldest waiting item has waited ``max_wait_ms``. ``run_batch`` receives the
+    list of items and must return one result per item, in order (any other
+    count fails the whole batch); it runs on ``executor`` so the event loop
+    keeps serving other requests meanwhile.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = AI_MAX_BATCH_SIZE,
+        max_wait_ms: float = AI_MAX_BATCH_WAIT_MS,
+        executor: Optional[Executor] = None,
+        concurrency: int = 1,
+        name: str = "batcher",
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.name = name
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._has_items: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        # The loop only holds tasks weakly; this keeps running batches alive
+        self._dispatches: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.running = 0
+        self.size_histogram: Counter = Counter()
+        self.queue_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        # Submissions waiting to be collected into a batch
+        return len(self._pending)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._collector is not None and not self._collector.done():
+            return
+        # (Re)bind to the running loop, e.g. after a test client restarted it.
+        self._loop = loop
+        self._pending = []
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._collector = loop.create_task(self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _collect(self):
+        while True:
+            await self._slots.acquire()
+            await self._has_items.wait()
+            if len(self._pending) < self.max_batch_size:
+                oldest = self._pending[0][2]
+                remaining = self.max_wait - (time.perf_counter() - oldest)
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+
+            batch = [entry for entry in self._pending[:self.max_batch_size] if not entry[1].cancelled()]
+            del self._pending[:self.max_batch_size]
+            if len(self._pending) < self.max_batch_size:
+                self._full.clear()
+            if not self._pending:
+                self._has_items.clear()
+
+            if not batch:
+                self._slots.release()
+                continue
+            task = self._loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.run_batch, [entry[0] for entry in batch])
+            results = list(results)
+            if len(results) != len(batch):
+                # Which result belongs to which caller is unknown, so none of them gets one
+                raise RuntimeError(f"{self.name} returned {len(results)} results for a batch of {len(batch)}")
+        except Exception as exc:
+            self.errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            finished = time.perf_counter()
+            self.running -= 1
+            self.batches += 1
+            self.items += len(batch)
+            self.size_histogram[len(batch)] += 1
+            self.queue_wait_seconds += sum(started - enqueued for _, _, enqueued in batch)
+            self.run_seconds += finished - started
+            for _, _, enqueued in batch:
+                stage_duration.observe(started - enqueued, stage=f"{self.name}_queue_wait")
+            # Includes the hop to a worker process in process mode
+            stage_duration.observe(finished - started, stage=f"{self.name}_forward")
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "pending": self.pending,
+            "running_batches": self.running,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_batch_fill": self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+            "mean_queue_wait_ms": 1000.0 * self.queue_wait_seconds / self.items if self.items else 0.0,
+            "mean_batch_run_ms": 1000.0 * self.run_seconds / self.batches if self.batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.size_histogram.items())},
+        }
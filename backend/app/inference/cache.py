@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", 1024))  # entries kept in memory, 0 disables the cache
+AI_CACHE_DIR = os.getenv("AI_CACHE_DIR")  # optional on-disk tier that survives restarts
+
+
+def cache_key(digest: str, model_version: str, params: dict) -> str:
+    # The model version embeds a fingerprint of the weights file, so replacing
+    # the weights changes every key and old entries are simply never hit again.
+    payload = json.dumps([digest, model_version, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Two-tier inference result cache: a bounded in-memory LRU in front of an
+    optional directory of JSON files."""
+
+    def __init__(self, max_entries: int = AI_CACHE_SIZE, directory: Optional[str] = AI_CACHE_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_errors = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+        value = self._read_disk(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def _remember(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.disk_errors += 1
+            return None
+
+    def _write_disk(self, key: str, value: Any):
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            self.disk_errors += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "disk_tier": self.directory,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_errors": self.disk_errors,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+result_cache = ResultCache()
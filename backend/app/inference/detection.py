@@ -0,0 +1,73 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+AI_DETECT_MAX_SIDE = int(os.getenv("AI_DETECT_MAX_SIDE", 1333))  # longest side sent to the detector
+AI_DETECT_TILED_MAX_SIDE = int(os.getenv("AI_DETECT_TILED_MAX_SIDE", 4096))  # longest side kept in tiling mode
+AI_DETECT_TILE_SIZE = int(os.getenv("AI_DETECT_TILE_SIZE", 800))
+AI_DETECT_TILE_OVERLAP = float(os.getenv("AI_DETECT_TILE_OVERLAP", 0.2))
+AI_DETECT_NMS_IOU = float(os.getenv("AI_DETECT_NMS_IOU", 0.5))
+
+
+def tile_origins(length: int, tile: int, overlap: float = AI_DETECT_TILE_OVERLAP) -> List[int]:
+    # Start offsets covering [0, length); the last tile is pushed flush with the edge
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def make_tiles(image: np.ndarray, tile: int = AI_DETECT_TILE_SIZE,
+               overlap: float = AI_DETECT_TILE_OVERLAP) -> List[Tuple[Tuple[int, int], np.ndarray]]:
+    height, width = image.shape[:2]
+    return [
+        ((x, y), image[y:y + tile, x:x + tile])
+        for y in tile_origins(height, tile, overlap)
+        for x in tile_origins(width, tile, overlap)
+    ]
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray, iou_threshold: float) -> np.ndarray:
+    # Class-aware NMS: offsetting each label's boxes into a disjoint region
+    # (the trick torchvision.ops.batched_nms uses) lets one pass handle all labels.
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = labels.astype(boxes.dtype) * (boxes.max() + 1)
+    shifted = boxes + offsets[:, None]
+    x1, y1, x2, y2 = shifted.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def merge_tiles(outputs: List[Dict[str, np.ndarray]], origins: List[Tuple[int, int]], top_k: int,
+                iou_threshold: float = AI_DETECT_NMS_IOU) -> Dict[str, np.ndarray]:
+    # Shift each tile's boxes into image coordinates, then let NMS drop the
+    # duplicates produced where tiles overlap.
+    boxes = np.concatenate([out["boxes"] + np.array([x, y, x, y], dtype=out["boxes"].dtype)
+                            for out, (x, y) in zip(outputs, origins)]) if outputs else np.zeros((0, 4), np.float32)
+    scores = np.concatenate([out["scores"] for out in outputs]) if outputs else np.zeros(0, np.float32)
+    labels = np.concatenate([out["labels"] for out in outputs]) if outputs else np.zeros(0, np.int64)
+    keep = nms(boxes, scores, labels, iou_threshold)[:top_k]
+    return {"boxes": boxes[keep], "scores": scores[keep], "labels": labels[keep]}
+
+
+def to_annotations(outputs: Dict[str, np.ndarray], scale: float = 1.0) -> List[dict]:
+    boxes = (outputs["boxes"] * scale).tolist()
+    return [
+        {"label": str(label), "bbox": box, "score": score}
+        for box, score, label in zip(boxes, outputs["scores"].tolist(), outputs["labels"].tolist())
+    ]
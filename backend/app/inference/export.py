@@ -0,0 +1,256 @@
+"""Offline export, calibration and accuracy check for the inference backends.
+
+    python -m app.inference.export export --model classifier --backend onnx
+    python -m app.inference.export export --model classifier --backend int8-static --images calibration/
+    python -m app.inference.export check --images reference/ --backends torchscript onnx int8-dynamic int8-static
+    python -m app.inference.export check --model detector --images reference/ --box-tolerance 2
+
+Artifacts are written to AI_MODEL_DIR (or --model-dir); select one at runtime
+with AI_CLASSIFIER_BACKEND / AI_DETECTOR_BACKEND.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+from app.inference import backends, models
+from app.inference.detection import AI_DETECT_MAX_SIDE
+from app.inference.preprocess import CLASSIFIER_SIZE, classifier_batch, decode_for_classifier, decode_for_detector, detector_batch
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def image_paths(directory: str, count: int) -> List[str]:
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:count]
+    if not paths:
+        sys.exit(f"No images found in {directory}")
+    return paths
+
+
+def synthetic_bodies(count: int, size: int) -> List[np.ndarray]:
+    # Smooth chest-like blobs with noise, as uint8-range floats
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[-1:1:size * 1j, -1:1:size * 1j]
+    bodies = []
+    for _ in range(count):
+        body = np.exp(-((xx / rng.uniform(0.5, 0.8)) ** 2 + (yy / rng.uniform(0.6, 0.9)) ** 2))
+        bodies.append(np.clip(body * 200 + rng.normal(0, 12, body.shape), 0, 255))
+    return bodies
+
+
+def load_images(directory: Optional[str], count: int) -> List[np.ndarray]:
+    # Preprocessed 1x224x224 classifier inputs from a directory of images, or
+    # smooth synthetic stand-ins when no directory is given.
+    if directory:
+        paths = image_paths(directory, count)
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                images.append(decode_for_classifier(f))
+        # A dedicated array, since the shared batch buffer is reused by the next batch
+        out = np.empty((len(images), 1, CLASSIFIER_SIZE, CLASSIFIER_SIZE), dtype=np.float32)
+        return list(classifier_batch(images, out))
+    return [((2 * img / 255 - 1) * 1024).astype(np.float32)[None, ...] for img in synthetic_bodies(count, CLASSIFIER_SIZE)]
+
+
+def load_detector_images(directory: Optional[str], count: int) -> List[np.ndarray]:
+    # HxWx3 uint8 detector inputs, decoded and capped like uploads are
+    if directory:
+        images = []
+        for path in image_paths(directory, count):
+            with open(path, "rb") as f:
+                images.append(decode_for_detector(f, AI_DETECT_MAX_SIDE)[0])
+        return images
+    return [np.repeat(img.astype(np.uint8)[..., None], 3, axis=2) for img in synthetic_bodies(count, 512)]
+
+
+def export_classifier(backend: str, model_dir: str, calibration: List[np.ndarray]) -> str:
+    import torch
+
+    model = models.build_classifier()
+    example = torch.from_numpy(np.stack(calibration[:1]))
+    path = backends.artifact_path("classifier", backend, model_dir)
+
+    if backend == "onnx":
+        torch.onnx.export(
+            model, (example,), path, input_names=["image"], output_names=["scores"],
+            dynamic_axes={"image": {0: "batch"}, "scores": {0: "batch"}}, opset_version=17, dynamo=False,
+        )
+    else:
+        if backend == "int8-dynamic":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "int8-static":
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+            # The convolutional trunk is quantized; the small classifier head
+            # and torchxrayvision's output calibration stay in float.
+            qconfig = get_default_qconfig_mapping(torch.backends.quantized.engine)
+            prepared = prepare_fx(model.features, qconfig, (example,))
+            with torch.no_grad():
+                for start in range(0, len(calibration), 16):
+                    prepared(torch.from_numpy(np.stack(calibration[start:start + 16])))
+            model.features = convert_fx(prepared)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+        traced.save(path)
+
+    with open(backends.metadata_path("classifier", model_dir), "w") as f:
+        json.dump({"model": models.MODEL_IDS["classifier"], "pathologies": list(model.pathologies)}, f)
+    return path
+
+
+def export_detector(backend: str, model_dir: str) -> str:
+    import torch
+
+    model = models.build_detector()
+    if backend == "int8-dynamic":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    path = backends.artifact_path("detector", backend, model_dir)
+    torch.jit.script(model).save(path)
+    return path
+
+
+def check(backend_names: List[str], images: List[np.ndarray], model_dir: str, tolerance: float) -> bool:
+    batch = np.stack(images)
+    reference = backends.load_classifier_runner("eager", models.build_classifier, model_dir)
+    expected = reference(batch)
+    ok = True
+    for backend in backend_names:
+        runner = backends.load_classifier_runner(backend, models.build_classifier, model_dir)
+        actual = runner(batch)
+        diff = np.abs(actual - expected)
+        top1 = float(np.mean(actual.argmax(axis=1) == expected.argmax(axis=1)))
+        passed = float(diff.max()) <= tolerance
+        ok = ok and passed
+        print(f"\n{backend}: max abs diff {diff.max():.5f}, mean {diff.mean():.5f}, "
+              f"top-1 agreement {top1:.1%} -> {'PASS' if passed else 'FAIL'}")
+        for i, pathology in enumerate(reference.pathologies):
+            print(f"  {pathology:<28} max {diff[:, i].max():.5f}  mean {diff[:, i].mean():.5f}")
+    return ok
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = w * h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def detect(runner, image: np.ndarray, score_threshold: float) -> dict:
+    import torch
+
+    output = runner([torch.from_numpy(detector_batch([image])[0])])[0]
+    keep = output["scores"] > score_threshold
+    return {key: output[key][keep].cpu().numpy() for key in ("boxes", "scores", "labels")}
+
+
+def match_detections(expected: dict, actual: dict, iou_threshold: float = 0.5) -> List[tuple]:
+    # Pairs each expected detection, best score first, with the unused actual
+    # detection of the same label that overlaps it most; None when there is none.
+    used = np.zeros(len(actual["boxes"]), dtype=bool)
+    pairs = []
+    for i in np.argsort(-expected["scores"], kind="stable"):
+        candidates = ~used & (actual["labels"] == expected["labels"][i])
+        iou = np.where(candidates, box_iou(expected["boxes"][i], actual["boxes"]), 0.0) if candidates.any() else np.zeros(0)
+        j = int(iou.argmax()) if iou.size and iou.max() >= iou_threshold else None
+        if j is not None:
+            used[j] = True
+        pairs.append((i, j))
+    return pairs
+
+
+def check_detector(backend_names: List[str], images: List[np.ndarray], model_dir: str, score_tolerance: float,
+                   box_tolerance: float, score_threshold: float) -> bool:
+    # Detections near the threshold may fall on either side of it between
+    # backends, so only those clearly above it must be found by both.
+    reference = backends.load_detector_runner("eager", models.build_detector, model_dir)
+    # Found with a lower threshold, so that a score just under it still matches
+    expected = [detect(reference, image, max(0.0, score_threshold - score_tolerance)) for image in images]
+    ok = True
+    for backend in backend_names:
+        runner = backends.load_detector_runner(backend, models.build_detector, model_dir)
+        box_diffs, score_diffs, missing, extra, total = [], [], 0, 0, 0
+        for image, want in zip(images, expected):
+            got = detect(runner, image, max(0.0, score_threshold - score_tolerance))
+            pairs = match_detections(want, got)
+            matched = {j for _, j in pairs if j is not None}
+            for i, j in pairs:
+                clear = want["scores"][i] > score_threshold + score_tolerance
+                total += bool(want["scores"][i] > score_threshold)
+                if j is None:
+                    missing += clear
+                    continue
+                box_diffs.append(float(np.abs(got["boxes"][j] - want["boxes"][i]).max()))
+                score_diffs.append(float(abs(got["scores"][j] - want["scores"][i])))
+            extra += sum(
+                1 for j, score in enumerate(got["scores"])
+                if j not in matched and score > score_threshold + score_tolerance
+            )
+        max_box = max(box_diffs, default=0.0)
+        max_score = max(score_diffs, default=0.0)
+        passed = missing == 0 and extra == 0 and max_box <= box_tolerance and max_score <= score_tolerance
+        ok = ok and passed
+        print(f"\n{backend}: {total} detections above {score_threshold} in {len(images)} images -> {'PASS' if passed else 'FAIL'}")
+        print(f"  box   max abs diff {max_box:.2f} px, mean {np.mean(box_diffs) if box_diffs else 0.0:.2f} px")
+        print(f"  score max abs diff {max_score:.5f}, mean {np.mean(score_diffs) if score_diffs else 0.0:.5f}")
+        print(f"  missing {missing}, extra {extra} (clearly above the threshold in only one backend)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=backends.AI_MODEL_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="export (and calibrate) a backend artifact")
+    export.add_argument("--model", choices=sorted(backends.SUPPORTED_BACKENDS), default="classifier")
+    export.add_argument("--backend", choices=[b for b in backends.BACKENDS if b != "eager"], required=True)
+    export.add_argument("--images", help="calibration images for int8-static (synthetic if omitted)")
+    export.add_argument("--count", type=int, default=64, help="number of calibration images")
+
+    accuracy = sub.add_parser("check", help="compare backends with eager on reference images")
+    accuracy.add_argument("--model", choices=sorted(backends.SUPPORTED_BACKENDS), default="classifier")
+    accuracy.add_argument("--backends", nargs="+", help="default: every exportable backend of the model")
+    accuracy.add_argument("--images", help="reference images (synthetic if omitted)")
+    accuracy.add_argument("--count", type=int, default=32)
+    accuracy.add_argument("--tolerance", type=float, default=0.05,
+                          help="largest allowed score difference, per pathology or per matched detection")
+    accuracy.add_argument("--box-tolerance", type=float, default=2.0,
+                          help="largest allowed difference of a matched box coordinate, in pixels (detector)")
+    accuracy.add_argument("--score-threshold", type=float, default=0.5, help="detections compared (detector)")
+
+    args = parser.parse_args()
+    os.makedirs(args.model_dir, exist_ok=True)
+
+    if args.command == "export":
+        if args.backend not in backends.SUPPORTED_BACKENDS[args.model]:
+            sys.exit(f"{args.backend} is not supported for the {args.model}")
+        if args.model == "classifier":
+            path = export_classifier(args.backend, args.model_dir, load_images(args.images, args.count))
+        else:
+            path = export_detector(args.backend, args.model_dir)
+        print(f"Wrote {path}")
+    else:
+        names = args.backends or [b for b in backends.SUPPORTED_BACKENDS[args.model] if b != "eager"]
+        unsupported = [b for b in names if b not in backends.SUPPORTED_BACKENDS[args.model]]
+        if unsupported:
+            sys.exit(f"{', '.join(unsupported)} not supported for the {args.model}")
+        if args.model == "classifier":
+            passed = check(names, load_images(args.images, args.count), args.model_dir, args.tolerance)
+        else:
+            images = load_detector_images(args.images, args.count)
+            passed = check_detector(names, images, args.model_dir, args.tolerance, args.box_tolerance, args.score_threshold)
+        sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
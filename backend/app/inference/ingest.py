@@ -0,0 +1,219 @@
+import hashlib
+import os
+import threading
+import zipfile
+from tempfile import SpooledTemporaryFile
+from typing import IO, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+
+from app.core.metrics import stage
+
+AI_MAX_UPLOAD_BYTES = int(os.getenv("AI_MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+AI_MAX_IMAGE_PIXELS = int(os.getenv("AI_MAX_IMAGE_PIXELS", 64_000_000))
+AI_SPOOL_THRESHOLD = int(os.getenv("AI_SPOOL_THRESHOLD", 1024 * 1024))  # bytes kept in memory before spooling to disk
+AI_MAX_STUDY_FILES = int(os.getenv("AI_MAX_STUDY_FILES", 256))
+
+CHUNK_SIZE = 256 * 1024
+
+# Modes Image.reduce() handles directly; anything else is converted first
+_REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA", "I", "F")
+
+
+class SpooledUpload:
+    def __init__(self, file: IO[bytes], size: int, digest: str, filename: Optional[str] = None):
+        self.file = file
+        self.size = size
+        self.digest = digest
+        self.filename = filename
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self.file, "_rolled", False))
+
+    def close(self):
+        self.file.close()
+
+
+class IngestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.spooled_to_disk = 0
+        self.rejected_size = 0
+        self.rejected_pixels = 0
+        self.rejected_format = 0
+        self.reduced_decodes = 0
+        self.decoded = 0
+        self.decode_bytes_total = 0
+        self.decode_bytes_max = 0
+
+    def record_upload(self, upload: SpooledUpload):
+        with self._lock:
+            self.uploads += 1
+            self.spooled_to_disk += upload.on_disk
+
+    def record_decode(self, peak_bytes: int, reduced: bool):
+        with self._lock:
+            self.decoded += 1
+            self.reduced_decodes += reduced
+            self.decode_bytes_total += peak_bytes
+            self.decode_bytes_max = max(self.decode_bytes_max, peak_bytes)
+
+    def stats(self) -> dict:
+        return {
+            "max_upload_bytes": AI_MAX_UPLOAD_BYTES,
+            "max_image_pixels": AI_MAX_IMAGE_PIXELS,
+            "spool_threshold_bytes": AI_SPOOL_THRESHOLD,
+            "uploads": self.uploads,
+            "spooled_to_disk": self.spooled_to_disk,
+            "rejected_size": self.rejected_size,
+            "rejected_pixels": self.rejected_pixels,
+            "rejected_format": self.rejected_format,
+            "decoded": self.decoded,
+            "reduced_decodes": self.reduced_decodes,
+            "mean_decode_bytes": self.decode_bytes_total / self.decoded if self.decoded else 0.0,
+            "max_decode_bytes": self.decode_bytes_max,
+        }
+
+
+ingest_stats = IngestStats()
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=detail)
+
+
+class _Spooler:
+    # Copies chunks into a file that stays in memory up to ``threshold`` bytes
+    # and rolls over to disk past it, hashing and enforcing ``max_bytes`` as it goes.
+
+    def __init__(self, max_bytes: int, threshold: int):
+        self.max_bytes = max_bytes
+        self.file = SpooledTemporaryFile(max_size=threshold)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            ingest_stats.rejected_size += 1
+            raise _too_large(f"Upload exceeds {self.max_bytes} bytes")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self, filename: Optional[str]) -> SpooledUpload:
+        self.file.seek(0)
+        spooled = SpooledUpload(self.file, self.size, self.digest.hexdigest(), filename)
+        ingest_stats.record_upload(spooled)
+        return spooled
+
+
+async def spool_upload(upload: UploadFile, max_bytes: int = AI_MAX_UPLOAD_BYTES,
+                       threshold: int = AI_SPOOL_THRESHOLD) -> SpooledUpload:
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > max_bytes:
+        ingest_stats.rejected_size += 1
+        raise _too_large(f"Upload exceeds {max_bytes} bytes")
+    spooler = _Spooler(max_bytes, threshold)
+    try:
+        with stage("upload_read"):
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                spooler.write(chunk)
+    except BaseException:
+        spooler.file.close()
+        raise
+    return spooler.finish(upload.filename)
+
+
+def spool_archive(fp: IO[bytes], max_files: int = AI_MAX_STUDY_FILES, max_bytes: int = AI_MAX_UPLOAD_BYTES,
+                  threshold: int = AI_SPOOL_THRESHOLD) -> List[SpooledUpload]:
+    # Each zip member gets its own spool; the size limit applies per member and
+    # is enforced on the decompressed stream, not just the declared size.
+    fp.seek(0)
+    try:
+        archive = zipfile.ZipFile(fp)
+    except zipfile.BadZipFile:
+        ingest_stats.rejected_format += 1
+        raise HTTPException(status_code=400, detail="Archive is not a valid zip file")
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and not os.path.basename(info.filename).startswith(".")
+        and not info.filename.startswith("__MACOSX/")
+    ]
+    if len(members) > max_files:
+        raise _too_large(f"Archive holds {len(members)} files, the limit is {max_files}")
+    spooled: List[SpooledUpload] = []
+    try:
+        for info in members:
+            if info.file_size > max_bytes:
+                ingest_stats.rejected_size += 1
+                raise _too_large(f"{info.filename} exceeds {max_bytes} bytes")
+            spooler = _Spooler(max_bytes, threshold)
+            try:
+                with archive.open(info) as member:
+                    while True:
+                        chunk = member.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        spooler.write(chunk)
+            except BaseException:
+                spooler.file.close()
+                raise
+            spooled.append(spooler.finish(info.filename))
+    except BaseException:
+        for upload in spooled:
+            upload.close()
+        raise
+    return spooled
+
+
+def open_image(fp: IO[bytes], max_pixels: int = AI_MAX_IMAGE_PIXELS) -> Image.Image:
+    # Image.open only parses the header, so the pixel limit is checked before
+    # any pixel data is decoded.
+    fp.seek(0)
+    try:
+        img = Image.open(fp)
+    except (UnidentifiedImageError, OSError):
+        ingest_stats.rejected_format += 1
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    width, height = img.size
+    if width * height > max_pixels:
+        ingest_stats.rejected_pixels += 1
+        raise _too_large(f"Image has {width * height} pixels, the limit is {max_pixels}")
+    return img
+
+
+def load_reduced(img: Image.Image, mode: str, target: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """Decode ``img`` into ``mode``, at no less than ``target`` resolution when
+    one is given.
+
+    JPEGs are decoded straight at a reduced scale via draft mode; other formats
+    are decoded in full and then shrunk by an integer factor with
+    Image.reduce() before any further conversion.
+    """
+    reduced = False
+    if target is not None:
+        reduced = img.draft(mode, target) is not None
+    try:
+        img.load()
+    except OSError:
+        ingest_stats.rejected_format += 1
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    peak_bytes = img.width * img.height * len(img.getbands())
+
+    if target is not None:
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            if img.mode not in _REDUCIBLE_MODES:
+                img = img.convert(mode)
+            img = img.reduce(factor)
+            reduced = True
+    if img.mode != mode:
+        img = img.convert(mode)
+    ingest_stats.record_decode(peak_bytes, reduced)
+    return img
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional, Sequence
+
+from fastapi import HTTPException
+
+AI_JOB_QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", 64))  # queued jobs before submissions get 429
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", 8))  # jobs running at once
+AI_JOB_TIMEOUT = float(os.getenv("AI_JOB_TIMEOUT", 300))  # seconds a job may run before it fails
+AI_JOB_HISTORY = int(os.getenv("AI_JOB_HISTORY", 1000))  # finished jobs kept for status lookups
+# Start anyway when the server runs several worker processes; see check_single_worker
+AI_JOBS_ALLOW_MULTI_WORKER = os.getenv("AI_JOBS_ALLOW_MULTI_WORKER", "false").lower() in ("1", "true", "yes")
+
+FINISHED = ("succeeded", "failed")
+
+
+def server_workers(argv: Sequence[str] = sys.argv, environ: Mapping[str, str] = os.environ) -> int:
+    # Worker processes the server was started with. Spawned uvicorn workers and
+    # forked gunicorn workers both see the server's command line; both servers
+    # also take their default from WEB_CONCURRENCY.
+    for i, arg in enumerate(argv):
+        for flag in ("--workers", "-w"):
+            value = None
+            if arg == flag and i + 1 < len(argv):
+                value = argv[i + 1]
+            elif arg.startswith(flag + "="):
+                value = arg[len(flag) + 1:]
+            if value is not None and value.isdigit():
+                return int(value)
+    value = environ.get("WEB_CONCURRENCY", "")
+    return int(value) if value.isdigit() else 1
+
+
+def check_single_worker(queue_name: str, allow: bool = AI_JOBS_ALLOW_MULTI_WORKER, workers: Optional[int] = None):
+    """Refuses to start a job queue in one of several server worker processes.
+
+    Jobs live in the memory of the process that accepted them, so with more
+    than one worker a status poll or WebSocket that lands on another worker
+    answers 404 for a job that exists.
+    """
+    workers = server_workers() if workers is None else workers
+    if workers > 1 and not allow:
+        raise RuntimeError(
+            f"The {queue_name} job queue is in-memory and per process, but the server runs {workers} workers. "
+            "Run /api/ai on a single worker (AI_ROUTES_ENABLED=false on the others), "
+            "or set AI_JOBS_ALLOW_MULTI_WORKER=true if every client is pinned to one worker."
+        )
+
+
+class Job:
+    def __init__(self, kind: str, payload: Any, params: Optional[dict] = None, owner_id: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.params = params or {}
+        self.owner_id = owner_id  # id of the user who submitted it; only they can look it up
+        self.status = "queued"
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.timings: Dict[str, float] = {}
+        self._enqueued = time.perf_counter()
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def _notify(self):
+        # Wake current waiters; later waiters get a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def watch(self, keepalive: float = 30.0) -> AsyncIterator[dict]:
+        # Yields the job's state now and after every change until it finishes;
+        # an unchanged state is repeated every ``keepalive`` seconds.
+        while True:
+            changed = self._changed
+            yield self.to_dict()
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                pass
+
+    @contextmanager
+    def stage(self, name: str):
+        # Records how long one step of the job took, in ms
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_ms"] = 1000.0 * (time.perf_counter() - started)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "submitted_at": self.submitted_at,
+            "timings": self.timings,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded in-process job queue drained by a fixed number of worker tasks.
+
+    Jobs are held only in this process, and do not survive it.
+
+    ``handler(job)`` is awaited for each job and returns its result dict.
+    Submissions beyond ``max_queued`` waiting jobs are refused with 429, and
+    finished jobs stay queryable until ``history`` newer ones have finished.
+    """
+
+    def __init__(self, handler: Callable[[Job], Awaitable[dict]], max_queued: int = AI_JOB_QUEUE_SIZE,
+                 workers: int = AI_JOB_WORKERS, timeout: float = AI_JOB_TIMEOUT, history: int = AI_JOB_HISTORY,
+                 on_discard: Optional[Callable[[Job], None]] = None, name: str = "jobs"):
+        self.handler = handler
+        self.max_queued = max(1, max_queued)
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.history = max(0, history)
+        self.on_discard = on_discard
+        self.name = name
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.running = 0
+        self.queue_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        # (Re)bind to the running loop; jobs queued on a previous loop are gone
+        self._loop = loop
+        self._queue = asyncio.Queue(self.max_queued)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    def submit(self, job: Job) -> Job:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Job queue is full, try again later",
+                                headers={"Retry-After": "5"})
+        self.submitted += 1
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            started = time.perf_counter()
+            job.timings["queue_wait_ms"] = 1000.0 * (started - job._enqueued)
+            self.queue_wait_seconds += started - job._enqueued
+            job.status = "running"
+            job._notify()
+            self.running += 1
+            try:
+                job.result = await asyncio.wait_for(self.handler(job), self.timeout)
+                job.status = "succeeded"
+                self.succeeded += 1
+            except asyncio.TimeoutError:
+                job.status, job.error = "failed", f"Timed out after {self.timeout:g}s"
+                self.failed += 1
+                self.timed_out += 1
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "Server shut down while the job was running"
+                self.failed += 1
+                raise
+            except HTTPException as exc:
+                job.status, job.error = "failed", str(exc.detail)
+                self.failed += 1
+            except Exception as exc:
+                job.status, job.error = "failed", str(exc) or type(exc).__name__
+                self.failed += 1
+            finally:
+                self.running -= 1
+                elapsed = time.perf_counter() - started
+                job.timings["run_ms"] = 1000.0 * elapsed
+                self.run_seconds += elapsed
+                job.payload = None
+                self._retire(job)
+                job._notify()
+                self._queue.task_done()
+
+    def _retire(self, job: Job):
+        self._finished[job.id] = None
+        while len(self._finished) > self.history:
+            old_id, _ = self._finished.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                job.status, job.error = "failed", "Server shut down before the job ran"
+                if self.on_discard is not None:
+                    self.on_discard(job)
+                job._notify()
+
+    def stats(self) -> dict:
+        finished = self.succeeded + self.failed
+        return {
+            "name": self.name,
+            "pid": os.getpid(),
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "mean_queue_wait_ms": 1000.0 * self.queue_wait_seconds / finished if finished else 0.0,
+            "mean_run_ms": 1000.0 * self.run_seconds / finished if finished else 0.0,
+        }
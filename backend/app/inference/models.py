@@ -0,0 +1,111 @@
+import os
+
+from app.inference import backends
+from app.inference.preprocess import classifier_batch, detector_batch
+from app.inference.registry import registry
+
+# torch, torchvision and torchxrayvision are imported inside the functions below
+# so that importing this module (and the API routers) stays cheap; they are
+# only paid for by processes that actually run a model.
+
+CLASSIFIER_WEIGHTS = "densenet121-res224-all"
+
+# Public identifiers used in cache keys and responses
+MODEL_IDS = {
+    "classifier": CLASSIFIER_WEIGHTS,
+    "detector": "fasterrcnn_resnet50_fpn",
+}
+
+
+def build_classifier():
+    import torchxrayvision as xrv
+
+    model = xrv.models.DenseNet(weights=CLASSIFIER_WEIGHTS)
+    model.eval()
+    return model
+
+
+def build_detector():
+    import torchvision
+
+    model = torchvision.models.detection.fasterrcnn_resnet50_fpn(pretrained=True)
+    model.eval()
+    return model
+
+
+def load_classifier():
+    return backends.load_classifier_runner(backends.active_backend("classifier"), build_classifier)
+
+
+def load_detector():
+    return backends.load_detector_runner(backends.active_backend("detector"), build_detector)
+
+
+registry.register("classifier", load_classifier)
+registry.register("detector", load_detector)
+
+
+def _torch_cache_dir() -> str:
+    # Same resolution as torch.hub.get_dir(), without importing torch
+    torch_home = os.getenv("TORCH_HOME") or os.path.join(os.getenv("XDG_CACHE_HOME", "~/.cache"), "torch")
+    return os.path.join(os.path.expanduser(torch_home), "hub")
+
+
+# Weights files as cached by torchxrayvision and torch.hub
+WEIGHTS_FILES = {
+    "classifier": os.path.expanduser(os.path.join(
+        "~", ".torchxrayvision", "models_data",
+        "nih-pc-chex-mimic_ch-google-openi-kaggle-densenet121-d121-tw-lr001-rot45-tr15-sc15-seed0-best.pt")),
+    "detector": os.path.join(_torch_cache_dir(), "checkpoints", "fasterrcnn_resnet50_fpn_coco-258fb6c6.pth"),
+}
+
+
+def _fingerprint(path: str) -> str:
+    try:
+        st = os.stat(path)
+        return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    except OSError:
+        return "missing"
+
+
+def model_version(name: str) -> str:
+    # Identifier plus a fingerprint of the weights file on disk (and of the
+    # exported artifact for non-eager backends); cheap enough to compute per
+    # request, so swapping weights or re-exporting takes effect immediately.
+    version = f"{MODEL_IDS[name]}@{_fingerprint(WEIGHTS_FILES[name])}"
+    backend = backends.active_backend(name)
+    if backend != "eager":
+        version += f"+{backend}@{_fingerprint(backends.artifact_path(name, backend))}"
+    return version
+
+
+def warm_up(names=None):
+    return registry.warm_up(names)
+
+
+def classify_batch(images):
+    # images: list of 224x224 uint8 arrays from decode_for_classifier
+    runner = registry.get("classifier")
+    outputs = runner(classifier_batch(images))
+    return [{k: float(row[i]) for i, k in enumerate(runner.pathologies)} for row in outputs]
+
+
+def detect_batch(items):
+    # items: list of (HxWx3 uint8 RGB array, score_threshold, top_k); sizes may differ
+    import torch
+
+    runner = registry.get("detector")
+    tensors = [torch.from_numpy(array) for array in detector_batch([image for image, _, _ in items])]
+    outputs = runner(tensors)
+    results = []
+    for (_, score_threshold, top_k), output in zip(items, outputs):
+        # Filter on the tensors so only the kept detections are converted and sent back
+        scores = output["scores"]
+        keep = torch.nonzero(scores > score_threshold).squeeze(1)
+        keep = keep[torch.argsort(scores[keep], descending=True)[:top_k]]
+        results.append({
+            "boxes": output["boxes"][keep].cpu().numpy(),
+            "scores": scores[keep].cpu().numpy(),
+            "labels": output["labels"][keep].cpu().numpy(),
+        })
+    return results
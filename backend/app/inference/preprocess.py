@@ -0,0 +1,106 @@
+"""Decoding and batch preparation shared by the classifier and the detector.
+
+Decoding (``decode_for_*``) runs per request and produces uint8 arrays, which
+are what travels through the batchers (and to worker processes in process
+mode, at a quarter of the float32 size). The ``*_batch`` functions run on the
+inference worker. They convert a whole batch into one reusable float32 buffer
+per thread and normalize it there in place, so a steady stream of batches
+allocates no new input arrays.
+"""
+import math
+import threading
+from typing import IO, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.core.metrics import stage
+from app.inference.ingest import load_reduced, open_image
+
+CLASSIFIER_SIZE = 224
+
+# xrv.datasets.normalize maps [0, maxval] to [-1024, 1024]: x * 2048 / maxval - 1024
+CLASSIFIER_SCALE = np.float32(2048.0 / 255.0)
+CLASSIFIER_OFFSET = np.float32(1024.0)
+DETECTOR_SCALE = np.float32(1.0 / 255.0)
+
+
+class BatchBuffer:
+    """A grow-only float32 scratch array per thread, reused across batches.
+
+    Arrays handed out stay valid until the same thread asks for the next
+    batch, which is after the model has consumed the previous one.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, size: int) -> np.ndarray:
+        flat = getattr(self._local, "array", None)
+        if flat is None or flat.size < size:
+            flat = self._local.array = np.empty(size, dtype=np.float32)
+        return flat[:size]
+
+    def allocated_bytes(self) -> int:
+        flat = getattr(self._local, "array", None)
+        return 0 if flat is None else flat.nbytes
+
+
+classifier_buffer = BatchBuffer()
+detector_buffer = BatchBuffer()
+
+
+def decode_for_classifier(fp: IO[bytes]) -> np.ndarray:
+    # 224x224 uint8 grayscale; classifier_batch() turns a list of these into model input
+    size = (CLASSIFIER_SIZE, CLASSIFIER_SIZE)
+    with stage("classifier_decode"):
+        img = load_reduced(open_image(fp), "L", size)  # Grayscale
+        if img.size != size:
+            img = img.resize(size)
+        return np.asarray(img)
+
+
+def classifier_batch(images: List[np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Nx1x224x224 float32 classifier input, normalized like xrv.datasets.normalize.
+
+    Without ``out`` the result lives in this thread's reusable buffer.
+    """
+    if out is None:
+        out = classifier_buffer.get(len(images) * CLASSIFIER_SIZE * CLASSIFIER_SIZE)
+    batch = out.reshape(len(images), 1, CLASSIFIER_SIZE, CLASSIFIER_SIZE)
+    for slot, image in zip(batch, images):
+        np.copyto(slot[0], image)  # uint8 -> float32, no temporary
+    batch *= CLASSIFIER_SCALE
+    batch -= CLASSIFIER_OFFSET
+    return batch
+
+
+def decode_for_detector(fp: IO[bytes], max_side: int) -> Tuple[np.ndarray, float]:
+    # Returns the RGB array with its longest side capped at ``max_side`` and
+    # the factor that maps its coordinates back to the original image.
+    with stage("detector_decode"):
+        img = open_image(fp)
+        width, height = img.size
+        ratio = min(1.0, max_side / max(width, height))
+        target = (max(1, math.ceil(width * ratio)), max(1, math.ceil(height * ratio)))
+        img = load_reduced(img, "RGB", target if ratio < 1.0 else None)
+        if img.size != target:
+            img = img.resize(target, Image.BILINEAR)
+        return np.asarray(img), width / target[0]  # HxWx3 uint8
+
+
+def detector_batch(images: List[np.ndarray]) -> List[np.ndarray]:
+    """3xHxW float32 arrays in [0, 1], one per HxWx3 uint8 image, sizes may differ.
+
+    All of them are views into this thread's reusable buffer; the transpose
+    to channels-first and the scaling happen in a single pass per image.
+    """
+    buffer = detector_buffer.get(sum(image.size for image in images))
+    arrays, offset = [], 0
+    for image in images:
+        height, width, channels = image.shape
+        chw = buffer[offset:offset + image.size].reshape(channels, height, width)
+        np.multiply(image.transpose(2, 0, 1), DETECTOR_SCALE, out=chw)
+        arrays.append(chw)
+        offset += image.size
+    return arrays
@@ -0,0 +1,173 @@
+import io
+import math
+import os
+import threading
+from typing import Tuple
+
+from fastapi import HTTPException
+from PIL import Image
+
+from app.core.blobstore import BlobStore, blob_store
+from app.inference.ingest import load_reduced, open_image
+
+IMAGE_TILE_SIZE = int(os.getenv("IMAGE_TILE_SIZE", 256))
+IMAGE_TILE_FORMAT = os.getenv("IMAGE_TILE_FORMAT", "jpeg").lower()  # jpeg or png
+IMAGE_TILE_QUALITY = int(os.getenv("IMAGE_TILE_QUALITY", 90))
+IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", 256))
+IMAGE_RENDER_LOCKS = int(os.getenv("IMAGE_RENDER_LOCKS", 64))  # striped locks serializing renders of the same tile
+
+# format name -> (PIL format, media type, file extension)
+FORMATS = {"jpeg": ("JPEG", "image/jpeg", "jpg"), "png": ("PNG", "image/png", "png")}
+# Part of every ETag; bump it when rendering changes so cached tiles are not reused
+PYRAMID_VERSION = 1
+
+_COLOR_MODES = ("RGB", "RGBA", "P", "CMYK", "YCbCr")
+
+
+def level_count(width: int, height: int, tile_size: int = IMAGE_TILE_SIZE) -> int:
+    # Level 0 is full resolution; each level halves it, down to one tile
+    return max(0, math.ceil(math.log2(max(width, height) / tile_size))) + 1
+
+
+def level_size(width: int, height: int, level: int) -> Tuple[int, int]:
+    factor = 2 ** level
+    return max(1, math.ceil(width / factor)), max(1, math.ceil(height / factor))
+
+
+def display_mode(img: Image.Image) -> str:
+    return "RGB" if img.mode in _COLOR_MODES else "L"
+
+
+class Pyramid:
+    """Thumbnails and a tile pyramid for images in a BlobStore, built on demand.
+
+    The first request for a tile renders just that tile from the original
+    (JPEGs are decoded at reduced scale, and only the tile's region is
+    resampled) and writes it, so later requests for it, from any worker, are
+    plain file reads. Tiles nobody looks at are never rendered.
+    """
+
+    def __init__(self, store: BlobStore = blob_store, tile_size: int = IMAGE_TILE_SIZE,
+                 tile_format: str = IMAGE_TILE_FORMAT, thumbnail_size: int = IMAGE_THUMBNAIL_SIZE):
+        if tile_format not in FORMATS:
+            raise ValueError(f"Unknown tile format {tile_format!r}, expected one of {sorted(FORMATS)}")
+        self.store = store
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+        self.thumbnail_size = thumbnail_size
+        # A fixed set: unrelated renders that hash to the same stripe just take turns
+        self._locks = [threading.Lock() for _ in range(max(1, IMAGE_RENDER_LOCKS))]
+
+        self.tiles_written = 0
+        self.thumbnails_built = 0
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.tile_format][1]
+
+    def _lock(self, digest: str, name: str) -> threading.Lock:
+        return self._locks[hash((digest, name)) % len(self._locks)]
+
+    def _original(self, digest: str) -> str:
+        path = self.store.path(digest)
+        if not self.store.exists(digest):
+            raise HTTPException(status_code=404, detail="Image not found")
+        return path
+
+    def _save(self, img: Image.Image, path: str):
+        pil_format = FORMATS[self.tile_format][0]
+        buf = io.BytesIO()
+        if pil_format == "JPEG":
+            img.save(buf, pil_format, quality=IMAGE_TILE_QUALITY)
+        else:
+            img.save(buf, pil_format)
+        buf.seek(0)
+        self.store.write_atomic(path, buf)
+
+    def info(self, digest: str) -> dict:
+        with open(self._original(digest), "rb") as fp:
+            img = open_image(fp)
+            width, height = img.size
+            source_format = img.format
+        return {
+            "sha256": digest,
+            "width": width,
+            "height": height,
+            "format": source_format,
+            "media_type": Image.MIME.get(source_format, "application/octet-stream"),
+            "tile_size": self.tile_size,
+            "tile_format": self.tile_format,
+            "levels": [
+                dict(zip(("level", "width", "height"), (level,) + level_size(width, height, level)))
+                for level in range(level_count(width, height, self.tile_size))
+            ],
+        }
+
+    def etag(self, digest: str, *parts) -> str:
+        # Strong: the bytes are a pure function of the blob and these settings
+        key = "-".join(str(p) for p in (digest, PYRAMID_VERSION, self.tile_format, self.tile_size) + parts)
+        return f'"{key}"'
+
+    def thumbnail(self, digest: str) -> str:
+        ext = FORMATS[self.tile_format][2]
+        path = self.store.derived_path(digest, f"thumbnail-{self.thumbnail_size}.{ext}")
+        if os.path.exists(path):
+            return path
+        with self._lock(digest, "thumbnail"):
+            if not os.path.exists(path):
+                with open(self._original(digest), "rb") as fp:
+                    img = open_image(fp)
+                    size = (self.thumbnail_size, self.thumbnail_size)
+                    img = load_reduced(img, display_mode(img), size)
+                    img.thumbnail(size, Image.LANCZOS)
+                    self._save(img, path)
+                self.thumbnails_built += 1
+        return path
+
+    def tile_path(self, digest: str, level: int, x: int, y: int) -> str:
+        ext = FORMATS[self.tile_format][2]
+        return self.store.derived_path(digest, f"tiles-{self.tile_size}", str(level), f"{x}_{y}.{ext}")
+
+    def tile(self, digest: str, level: int, x: int, y: int) -> str:
+        path = self.tile_path(digest, level, x, y)
+        if os.path.exists(path):
+            return path
+        with self._lock(digest, f"tile-{level}-{x}-{y}"):
+            # Another request may have rendered the tile while we waited
+            if not os.path.exists(path):
+                self._render_tile(digest, level, x, y, path)
+        return path
+
+    def _render_tile(self, digest: str, level: int, x: int, y: int, path: str):
+        with open(self._original(digest), "rb") as fp:
+            img = open_image(fp)
+            width, height = img.size
+            if not 0 <= level < level_count(width, height, self.tile_size):
+                raise HTTPException(status_code=404, detail="No such level")
+            size = level_size(width, height, level)
+            columns, rows = math.ceil(size[0] / self.tile_size), math.ceil(size[1] / self.tile_size)
+            if not (0 <= x < columns and 0 <= y < rows):
+                raise HTTPException(status_code=404, detail="No such tile")
+            img = load_reduced(img, display_mode(img), size if level else None)
+        left, top = x * self.tile_size, y * self.tile_size
+        right, bottom = min(left + self.tile_size, size[0]), min(top + self.tile_size, size[1])
+        if img.size == size:
+            tile = img.crop((left, top, right, bottom))
+        else:
+            # Resample only this tile's region of the decoded image down to the level's scale
+            scale_x, scale_y = img.width / size[0], img.height / size[1]
+            box = (left * scale_x, top * scale_y, right * scale_x, bottom * scale_y)
+            tile = img.resize((right - left, bottom - top), Image.LANCZOS, box=box)
+        self._save(tile, path)
+        self.tiles_written += 1
+
+    def stats(self) -> dict:
+        return {
+            "tile_size": self.tile_size,
+            "tile_format": self.tile_format,
+            "tiles_written": self.tiles_written,
+            "thumbnails_built": self.thumbnails_built,
+        }
+
+
+pyramid = Pyramid()
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+# Models to load at startup instead of on first use: "all", or a comma separated list of names
+AI_WARMUP = os.getenv("AI_WARMUP", "")
+
+
+class ModelRegistry:
+    """Loads each registered model on first use (or on an explicit warm-up)
+    and keeps it for the lifetime of the process."""
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable] = {}
+        self._models: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self.load_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, loader: Callable):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    @property
+    def names(self):
+        return list(self._loaders)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model {name!r}")
+        # One lock per model, so loading the detector does not hold up the classifier
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = self._loaders[name]()
+                self.load_seconds[name] = time.perf_counter() - started
+                self._models[name] = model
+        return model
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        for name in names if names is not None else self.names:
+            self.get(name)
+        return dict(self.load_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "registered": self.names,
+            "loaded": [name for name in self.names if self.is_loaded(name)],
+            "load_seconds": dict(self.load_seconds),
+        }
+
+
+def warmup_names(setting: str = AI_WARMUP, available: Iterable[str] = ("classifier", "detector")) -> tuple:
+    setting = setting.strip().lower()
+    if setting in ("", "0", "false", "no", "none"):
+        return ()
+    if setting in ("1", "true", "yes", "all"):
+        return tuple(available)
+    return tuple(name.strip() for name in setting.split(",") if name.strip())
+
+
+registry = ModelRegistry()
@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from app.inference.registry import registry, warmup_names
+
+AI_EXECUTION_MODE = os.getenv("AI_EXECUTION_MODE", "thread")  # "thread" or "process"
+AI_WORKERS = int(os.getenv("AI_WORKERS", 1))
+AI_TORCH_THREADS = int(os.getenv("AI_TORCH_THREADS", 0))  # 0 = share the cores between workers
+
+
+def _init_worker(torch_threads: int, preload: tuple):
+    import torch
+    from app.inference import models
+
+    torch.set_num_threads(torch_threads)
+    models.warm_up(preload)
+
+
+def _run_and_report(fn, args, kwargs):
+    # Runs in a worker process: the result, plus that process's model load times
+    return fn(*args, **kwargs), os.getpid(), dict(registry.load_seconds)
+
+
+class InferencePool(Executor):
+    """Executor that runs model calls either on in-process threads or on a
+    pool of worker processes, each holding its own copy of the models.
+    Worker processes load the models named in ``preload`` when they start and
+    any others on first use.
+
+    In process mode a crashed worker breaks the underlying pool; the next
+    submission transparently starts a fresh one. Models live in the workers
+    there, so each result comes back with its worker's model load times.
+    """
+
+    def __init__(self, mode: str = AI_EXECUTION_MODE, workers: int = AI_WORKERS,
+                 torch_threads: int = AI_TORCH_THREADS, preload: tuple = warmup_names()):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown AI_EXECUTION_MODE {mode!r}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.preload = preload
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+        self._worker_load_seconds: Dict[int, Dict[str, float]] = {}
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.torch_threads, self.preload),
+                    )
+                else:
+                    import torch
+
+                    torch.set_num_threads(self.torch_threads)
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            return self._executor
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if self.mode == "process":
+            return self._unwrap_report(self._submit(_run_and_report, fn, args, kwargs))
+        return self._submit(fn, *args, **kwargs)
+
+    def _submit(self, fn, *args) -> Future:
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+                    self.restarts += 1
+                    # Those workers, and the models they had loaded, are gone
+                    self._worker_load_seconds.clear()
+            executor.shutdown(wait=False)
+            return self._get_executor().submit(fn, *args)
+
+    def _unwrap_report(self, inner: Future) -> Future:
+        # The caller's future gets just the result of fn; cancelling it cancels the work
+        outer: Future = Future()
+        outer.add_done_callback(lambda _: outer.cancelled() and inner.cancel())
+
+        def finish(_):
+            try:
+                if inner.cancelled():
+                    outer.cancel()
+                elif inner.exception() is not None:
+                    outer.set_exception(inner.exception())
+                else:
+                    result, pid, load_seconds = inner.result()
+                    self._worker_load_seconds[pid] = load_seconds
+                    outer.set_result(result)
+            except InvalidStateError:
+                pass  # the caller cancelled in the meantime
+
+        inner.add_done_callback(finish)
+        return outer
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def load_seconds(self) -> Dict[str, Dict[str, float]]:
+        # {worker: {model: seconds}}, where worker is "main" in thread mode and a pid in process mode.
+        # A worker process shows up once it has returned its first result.
+        if self.mode == "thread":
+            return {"main": dict(registry.load_seconds)}
+        return {str(pid): dict(seconds) for pid, seconds in list(self._worker_load_seconds.items())}
+
+    def model_stats(self) -> dict:
+        # registry.stats() for wherever the models actually run; load_seconds is the slowest worker's
+        workers = self.load_seconds()
+        load_seconds: Dict[str, float] = {}
+        for seconds in workers.values():
+            for name, value in seconds.items():
+                load_seconds[name] = max(value, load_seconds.get(name, 0.0))
+        return {
+            "registered": registry.names,
+            "loaded": [name for name in registry.names if name in load_seconds],
+            "load_seconds": load_seconds,
+            "workers": workers,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "started": self._executor is not None,
+            "restarts": self.restarts,
+        }
+
+
+inference_pool = InferencePool()
@@ -1,13 +1,31 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.auth import router as auth_router
-from app.api.patient import router as patient_router
-from app.api.report import router as report_router
 from app.api.ai import router as ai_router
-from app.api.analysis import router as analysis_router
+from app.api.bulk import router as bulk_router
+from app.api.images import router as images_router
+from app.api.metrics import router as metrics_router
+from app.api.search import router as search_router
+from app.core.compression import COMPRESSION_ENABLED, CompressionMiddleware
+from app.core.metrics import METRICS_ENABLED, MetricsMiddleware, instrument_engine, metrics
 from app.core.oauth import oauth
+from app.core.profiler import PROFILER_ENABLED, profiler
+from app.db.session import DB_ASYNC, async_engine, engine
 from starlette.middleware.sessions import SessionMiddleware
 
+if DB_ASYNC:
+    from app.api.patient_async import router as patient_router
+    from app.api.report_async import router as report_router
+    from app.api.analysis_async import router as analysis_router
+else:
+    from app.api.patient import router as patient_router
+    from app.api.report import router as report_router
+    from app.api.analysis import router as analysis_router
+
+# Set to false on CRUD-only workers when /api/ai is served by a separate deployment
+AI_ROUTES_ENABLED = os.getenv("AI_ROUTES_ENABLED", "true").lower() not in ("0", "false", "no")
+
 app = FastAPI()
 app.add_middleware(SessionMiddleware, secret_key="YOUR_SECRET_KEY")
 
@@ -19,12 +37,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if METRICS_ENABLED:
+    # Added last so it is outermost and times the whole request
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    metrics.gauge(
+        "db_pool_checked_out", "Database connections currently checked out of the pool.", ["engine"],
+        lambda: {
+            (name,): pool.checkedout()
+            for name, pool in (("sync", engine.pool), ("async", async_engine and async_engine.pool))
+            if hasattr(pool, "checkedout")
+        },
+    )
 
 app.include_router(auth_router)
 app.include_router(patient_router)
 app.include_router(report_router)
-app.include_router(ai_router)
+if AI_ROUTES_ENABLED:
+    app.include_router(ai_router)
 app.include_router(analysis_router)
+app.include_router(search_router)
+app.include_router(images_router)
+app.include_router(bulk_router)
+if METRICS_ENABLED:
+    app.include_router(metrics_router)
+
+
+@app.on_event("startup")
+def start_profiler():
+    if PROFILER_ENABLED:
+        profiler.start()
+
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    profiler.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 @app.get("/")
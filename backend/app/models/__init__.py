@@ -1,4 +1,5 @@
 from .user import User
 from .patient import Patient
 from .report import Report 
-from .analysis import Analysis 
\ No newline at end of file
+from .analysis import Analysis
+from .pathology import Pathology, AnalysisScore
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Index, Integer, String, ForeignKey, Text, DateTime, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.session import Base
@@ -10,6 +11,13 @@ class Analysis(Base):
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     findings = Column(Text, nullable=True)
     annotation = Column(Text, nullable=True)  # Store as JSON string
+    scores = Column(JSON().with_variant(JSONB, "postgresql"), nullable=True)  # {pathology: score}
+    image_sha256 = Column(String(64), nullable=True, index=True)  # blob store key of the analysed image
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_analyses_patient_created", "patient_id", "created_at", "id"),
+    )
+
     patient = relationship("Patient")
+    score_rows = relationship("AnalysisScore", cascade="all, delete-orphan", passive_deletes=True)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
+from app.db.session import Base
+
+class Pathology(Base):
+    __tablename__ = "pathologies"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+
+class AnalysisScore(Base):
+    __tablename__ = "analysis_scores"
+
+    analysis_id = Column(Integer, ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    pathology_id = Column(Integer, ForeignKey("pathologies.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    # Threshold queries ("Effusion >= 0.7, highest first") are a range scan on this index
+    __table_args__ = (
+        Index("ix_analysis_scores_pathology_score", "pathology_id", "score", "analysis_id"),
+    )
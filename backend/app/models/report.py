@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Index, Integer, String, ForeignKey, DateTime, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.session import Base
@@ -13,5 +13,10 @@ class Report(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_reports_patient_created", "patient_id", "created_at", "id"),
+        Index("ix_reports_created", "created_at", "id"),
+    )
+
     patient = relationship("Patient")
     author = relationship("User") 
\ No newline at end of file
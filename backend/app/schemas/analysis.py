@@ -1,10 +1,12 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 class AnalysisBase(BaseModel):
     findings: Optional[str] = None
     annotation: Optional[str] = None  # JSON string
+    scores: Optional[Dict[str, float]] = None  # parsed from findings when omitted
+    image_sha256: Optional[str] = None  # served from /api/images/{image_sha256}
 
 class AnalysisCreate(AnalysisBase):
     patient_id: int
@@ -16,3 +18,6 @@ class AnalysisRead(AnalysisBase):
 
     class Config:
         orm_mode = True
+
+class AnalysisScoreHit(AnalysisRead):
+    score: float
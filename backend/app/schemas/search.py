@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+class SearchHit(BaseModel):
+    kind: str  # "report" or "analysis"
+    id: int
+    patient_id: int
+    created_at: datetime
+    rank: float
+    headline: str  # matched text with terms wrapped in <mark></mark>
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from app.schemas.analysis import AnalysisRead
+from app.schemas.patient import PatientRead
+from app.schemas.report import ReportRead
+
+class TimelineReport(ReportRead):
+    author_name: Optional[str] = None
+
+class TimelineEvent(BaseModel):
+    kind: str  # "analysis" or "report"
+    created_at: datetime
+    id: int
+    analysis: Optional[AnalysisRead] = None
+    report: Optional[TimelineReport] = None
+
+class PatientTimeline(BaseModel):
+    patient: PatientRead
+    events: List[TimelineEvent]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,68 @@
+"""Throughput of the classifier micro-batcher at a fixed client concurrency.
+
+    python -m benchmarks.batching --concurrency 32 --batch-sizes 1 4 8 16 32
+
+Pass ``--weights none`` to run with randomly initialised weights when the
+torchxrayvision checkpoint cannot be downloaded.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import torch
+import torchxrayvision as xrv
+
+from app.inference.batching import MicroBatcher
+
+
+def build_runner(model):
+    pathologies = getattr(model, "pathologies", xrv.datasets.default_pathologies)
+
+    def run(images):
+        batch = torch.from_numpy(np.stack(images)).float()
+        with torch.no_grad():
+            outputs = model(batch).cpu().numpy()
+        return [dict(zip(pathologies, map(float, row))) for row in outputs]
+    return run
+
+
+async def drive(batcher, concurrency, requests_total):
+    image = np.random.default_rng(0).uniform(-1024, 1024, (1, 224, 224)).astype(np.float32)
+    remaining = requests_total
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await batcher.submit(image)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--weights", default="densenet121-res224-all")
+    args = parser.parse_args()
+
+    model = xrv.models.DenseNet(weights=None if args.weights == "none" else args.weights)
+    model.eval()
+    runner = build_runner(model)
+
+    print(f"{'batch':>6} {'img/s':>8} {'mean fill':>10} {'mean size':>10} {'queue ms':>9}")
+    for size in args.batch_sizes:
+        batcher = MicroBatcher(runner, max_batch_size=size, max_wait_ms=args.max_wait_ms, name=f"bench-{size}")
+        elapsed = asyncio.run(drive(batcher, args.concurrency, args.requests))
+        stats = batcher.stats()
+        print(f"{size:>6} {args.requests / elapsed:>8.1f} {stats['mean_batch_fill']:>10.2f} "
+              f"{stats['mean_batch_size']:>10.1f} {stats['mean_queue_wait_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
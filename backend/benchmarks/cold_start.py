@@ -0,0 +1,62 @@
+"""Cold start time and resident memory of a freshly started API worker.
+
+    python -m benchmarks.cold_start
+
+Each scenario imports ``app.main`` in a clean interpreter, runs the startup
+hooks and serves one request, then reports wall time and peak RSS.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+from fastapi.testclient import TestClient
+import app.main
+with TestClient(app.main.app) as client:
+    client.get("/")
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_imported": "torch" in sys.modules,
+}))
+"""
+
+SCENARIOS = {
+    "crud-only (AI_ROUTES_ENABLED=false)": {"AI_ROUTES_ENABLED": "false"},
+    "ai routes, lazy models": {"AI_ROUTES_ENABLED": "true", "AI_WARMUP": ""},
+    "ai routes, warm-up classifier": {"AI_ROUTES_ENABLED": "true", "AI_WARMUP": "classifier"},
+    "ai routes, warm-up all": {"AI_ROUTES_ENABLED": "true", "AI_WARMUP": "all"},
+}
+
+
+def run(env_overrides, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, **env_overrides)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, cwd=backend_dir,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///./cold_start_bench.db")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(f"{'scenario':<34} {'seconds':>8} {'rss MB':>8} {'torch':>6}")
+    for name in args.scenarios:
+        result = run(SCENARIOS[name], args.database_url)
+        if "error" in result:
+            print(f"{name:<34} error: {result['error']}")
+            continue
+        print(f"{name:<34} {result['seconds']:>8.2f} {result['max_rss_mb']:>8.0f} {str(result['torch_imported']):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""CRUD throughput and latency of the sync (threadpool) and async (AsyncSession) DB modes.
+
+    python -m benchmarks.db_modes --clients 200 --seconds 20
+
+Each mode starts its own uvicorn server against the same seeded database and
+is driven by ``--clients`` concurrent keep-alive clients issuing a mix of
+patient lookups, patient listings and per-patient report listings. Pass
+``--database-url`` to benchmark PostgreSQL instead of a local SQLite file;
+pool settings (DB_POOL_SIZE, DB_MAX_OVERFLOW, ...) are taken from the
+environment.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED = r"""
+import sys
+from app.db.session import Base, SessionLocal, engine
+import app.models
+from app.models.patient import Patient
+from app.models.report import Report
+from app.models.user import User
+Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+user = db.query(User).filter(User.email == "bench@example.com").first()
+if user is None:
+    user = User(email="bench@example.com", hashed_password="-", full_name="Benchmark")
+    db.add(user)
+    db.commit()
+if db.query(Patient).count() < int(sys.argv[1]):
+    patients = [Patient(name=f"Patient {i}") for i in range(int(sys.argv[1]))]
+    db.add_all(patients)
+    db.flush()
+    db.add_all(Report(patient_id=p.id, author_id=user.id, content="Lungs are clear.") for p in patients for _ in range(3))
+    db.commit()
+print(",".join(str(pid) for (pid,) in db.query(Patient.id)))
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def wait_ready(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url + "/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def drive(url, token, patient_ids, clients, seconds):
+    latencies, errors = [], Counter()
+    stop = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as http:
+        async def client(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < stop:
+                roll = rng.random()
+                patient_id = rng.choice(patient_ids)
+                if roll < 0.6:
+                    path = f"/api/patients/{patient_id}"
+                elif roll < 0.8:
+                    path = "/api/patients/?limit=20"
+                else:
+                    path = f"/api/reports/patient/{patient_id}"
+                started = time.perf_counter()
+                try:
+                    response = await http.get(path)
+                    if response.status_code != 200:
+                        errors[str(response.status_code)] += 1
+                except httpx.HTTPError as exc:
+                    errors[type(exc).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+    }
+
+
+def run_mode(mode, args, patient_ids, token):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=args.database_url, DB_ASYNC="true" if mode == "async" else "false",
+               AI_ROUTES_ENABLED="false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        asyncio.run(wait_ready(url))
+        return asyncio.run(drive(url, token, patient_ids, args.clients, args.seconds))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///./db_modes_bench.db")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE_URL=args.database_url)
+    seeded = subprocess.run([sys.executable, "-c", SEED, str(args.patients)], env=env, cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    patient_ids = [int(pid) for pid in seeded.stdout.strip().splitlines()[-1].split(",")]
+
+    sys.path.insert(0, BACKEND_DIR)
+    from app.core.security import create_access_token
+    token = create_access_token({"sub": "bench@example.com"})
+
+    results = {mode: run_mode(mode, args, patient_ids, token) for mode in args.modes}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.clients} clients, {args.seconds:.0f}s per mode")
+    print(f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['requests_per_second']:>8.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7}"
+              + (f"  {r['error_kinds']}" if r["errors"] else ""))
+
+
+if __name__ == "__main__":
+    main()
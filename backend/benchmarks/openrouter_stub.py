@@ -0,0 +1,82 @@
+"""Local OpenAI-compatible chat completions server for offline testing.
+
+    python -m benchmarks.openrouter_stub --port 9000 --first-token-ms 300 --token-ms 20
+    OPENROUTER_URL=http://127.0.0.1:9000/v1/chat/completions uvicorn app.main:app
+
+Answers every request with a canned draft report, either as one JSON body or
+as a server-sent event stream when the request sets "stream": true.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPORT = (
+    "FINDINGS: The lungs are clear without focal consolidation, effusion or pneumothorax. "
+    "The cardiomediastinal silhouette is within normal limits. No acute osseous abnormality. "
+    "IMPRESSION: No acute cardiopulmonary process."
+)
+
+
+def create_app(first_token_ms: float = 300, token_ms: float = 20, fail_every: int = 0, fail_first: int = 0,
+               fail_status: int = 503, retry_after: str = "") -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        if app.state.calls <= fail_first or (fail_every and app.state.calls % fail_every == 0):
+            headers = {"Retry-After": retry_after} if retry_after else None
+            return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=fail_status, headers=headers)
+        tokens = [word + " " for word in REPORT.split()][: body.get("max_tokens", 512)]
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep((first_token_ms + token_ms * len(tokens)) / 1000)
+            return {
+                "id": f"stub-{app.state.calls}", "object": "chat.completion", "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+            }
+
+        async def events():
+            yield ": STUB PROCESSING\n\n"
+            await asyncio.sleep(first_token_ms / 1000)
+            for token in tokens:
+                chunk = {"id": f"stub-{app.state.calls}", "object": "chat.completion.chunk", "created": created,
+                         "model": body.get("model"), "choices": [{"index": 0, "delta": {"content": token}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_ms / 1000)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth call with an error")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N calls with an error")
+    parser.add_argument("--fail-status", type=int, default=503, help="status code of those errors")
+    parser.add_argument("--retry-after", default="", help="Retry-After header sent with those errors")
+    args = parser.parse_args()
+    app = create_app(args.first_token_ms, args.token_ms, args.fail_every, args.fail_first, args.fail_status,
+                     args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
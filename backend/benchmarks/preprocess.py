@@ -0,0 +1,85 @@
+"""Time and memory allocated per image to turn decoded uploads into model input.
+
+    python -m benchmarks.preprocess --batch-size 16 --batches 50
+
+Compares the current batch preparation (``classifier_batch`` /
+``detector_batch``: one reused float32 buffer, normalized in place) with the
+per-image pipeline it replaced (float copies per image, element-wise ops that
+each allocate, then ``np.stack``). Decoding is done once up front and is not
+timed, since it is the same for both. "alloc KB/img" is the peak memory newly
+allocated while preparing one steady-state batch, per image, as seen by
+tracemalloc (which tracks NumPy's array buffers).
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.inference.preprocess import classifier_batch, detector_batch
+from benchmarks.synthetic import radiograph
+
+
+def previous_classifier_batch(images):
+    def normalize(img, maxval=255):
+        if img.max() > maxval:
+            raise ValueError("value out of range")
+        return (2 * (img.astype(np.float32) / maxval) - 1.0) * 1024
+    return np.stack([normalize(image)[None, ...] for image in images])
+
+
+def previous_detector_batch(images):
+    # NumPy equivalent of torch.from_numpy(image).permute(2, 0, 1).float().div_(255)
+    arrays = []
+    for image in images:
+        chw = image.transpose(2, 0, 1).astype(np.float32)
+        chw /= 255
+        arrays.append(chw)
+    return arrays
+
+
+def measure(prepare, images, batches):
+    prepare(images)  # warm-up; allocates the reusable buffer, if any
+    started = time.perf_counter()
+    for _ in range(batches):
+        prepare(images)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    result = prepare(images)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return 1e6 * elapsed / (batches * len(images)), peak / 1024 / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--detector-side", type=int, default=1333, help="longest side of the detector inputs")
+    args = parser.parse_args()
+
+    classifier_images = [
+        (radiograph(224, 224, seed) * 255).astype(np.uint8) for seed in range(args.batch_size)
+    ]
+    side = args.detector_side
+    detector_images = [
+        np.repeat((radiograph(side, side * 4 // 5, seed) * 255).astype(np.uint8)[..., None], 3, axis=2)
+        for seed in range(min(args.batch_size, 4))
+    ]
+
+    cases = [
+        ("classifier", "previous", previous_classifier_batch, classifier_images),
+        ("classifier", "current", classifier_batch, classifier_images),
+        ("detector", "previous", previous_detector_batch, detector_images),
+        ("detector", "current", detector_batch, detector_images),
+    ]
+    print(f"{'model':<11} {'pipeline':<9} {'us/img':>9} {'alloc KB/img':>13}")
+    for model, pipeline, prepare, images in cases:
+        us_per_image, kb_per_image = measure(prepare, images, args.batches)
+        print(f"{model:<11} {pipeline:<9} {us_per_image:>9.1f} {kb_per_image:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
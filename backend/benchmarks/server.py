@@ -0,0 +1,51 @@
+"""Runs the API for benchmarks.
+
+    python -m benchmarks.server --port 8001 --weights random
+
+With ``--weights random`` the classifier and detector are built with randomly
+initialised weights, so nothing is downloaded and the suite runs offline.
+Inference cost is the same as with the real weights; the scores are
+meaningless. Only ``AI_EXECUTION_MODE=thread`` picks this up, since worker
+processes build their own models.
+"""
+import argparse
+
+import uvicorn
+
+
+def use_random_weights():
+    from app.inference import models
+
+    def build_classifier():
+        import torchxrayvision as xrv
+
+        model = xrv.models.DenseNet(weights=None)
+        model.pathologies = xrv.datasets.default_pathologies
+        model.eval()
+        return model
+
+    def build_detector():
+        import torchvision
+
+        model = torchvision.models.detection.fasterrcnn_resnet50_fpn(weights=None, weights_backbone=None)
+        model.eval()
+        return model
+
+    models.build_classifier = build_classifier
+    models.build_detector = build_detector
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--weights", choices=["random", "pretrained"], default="random")
+    args = parser.parse_args()
+    if args.weights == "random":
+        use_random_weights()
+    from app.main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
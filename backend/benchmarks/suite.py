@@ -0,0 +1,324 @@
+"""Offline throughput and tail-latency suite for the API.
+
+    python -m benchmarks.suite --concurrency 1 8 32 --seconds 10 --output results.json
+    python -m benchmarks.suite --baseline
+    python -m benchmarks.suite --scenarios login list_patients --baseline other-run.json
+
+Everything runs locally and nothing is downloaded:
+- a fresh SQLite database seeded with ``--patients`` patients, each with reports
+  and scored analyses;
+- the API (``benchmarks.server``) with randomly initialised model weights;
+- ``benchmarks.openrouter_stub`` in place of OpenRouter;
+- synthetic radiographs at several resolutions (``benchmarks.synthetic``).
+
+Every scenario gets a few warm-up requests, which also load the models. Then,
+at each concurrency level, that many closed-loop clients send requests for
+``--seconds``. The result cache and the report cache are disabled, so every
+request does the full work. Results go to ``--output`` as JSON. With
+``--baseline``, each scenario and concurrency is compared with the stored run,
+and the exit status is 1 if throughput dropped or p95 latency grew by more
+than ``--tolerance``. ``--baseline`` on its own uses the committed
+``benchmarks/results/baseline.json``.
+
+The numbers only mean something on the machine and settings they were taken
+with; both are recorded in the file (``cpu_count``, ``platform``,
+``settings``), and differing settings are pointed out before the comparison.
+After a deliberate performance change, or to compare on other hardware,
+regenerate the baseline with the default settings and commit it:
+
+    python -m benchmarks.suite --save-baseline benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.db_modes import BACKEND_DIR, free_port, percentile, wait_ready
+from benchmarks.synthetic import RESOLUTIONS, image_set
+
+BASELINE = os.path.join("benchmarks", "results", "baseline.json")
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "benchmark-password"
+PATHOLOGIES = ["Atelectasis", "Cardiomegaly", "Effusion", "Edema", "Pneumonia", "Pneumothorax"]
+FINDINGS = [
+    "Small left pleural effusion.", "Cardiomegaly without edema.", "Right lower lobe consolidation.",
+    "No acute cardiopulmonary process.", "Apical pneumothorax on the right.", "Bibasilar atelectasis.",
+]
+
+
+def seed_database(patients: int, reports_per_patient: int, analyses_per_patient: int, seed: int = 0):
+    # Runs in this process against DATABASE_URL, which main() sets before importing the app
+    from sqlalchemy import insert, select
+    from app.core.security import get_password_hash
+    from app.db.init_db import init_db
+    from app.db.session import SessionLocal
+    from app.models.analysis import Analysis
+    from app.models.pathology import AnalysisScore, Pathology
+    from app.models.patient import Patient
+    from app.models.report import Report
+    from app.models.user import User
+
+    rng = random.Random(seed)
+    init_db()
+    db = SessionLocal()
+    try:
+        user = User(email=BENCH_EMAIL, hashed_password=get_password_hash(BENCH_PASSWORD), full_name="Benchmark")
+        db.add(user)
+        db.add_all(Pathology(name=name) for name in PATHOLOGIES)
+        db.commit()
+        pathology_ids = dict(db.execute(select(Pathology.name, Pathology.id)).all())
+
+        db.execute(insert(Patient), [
+            {"name": f"Patient {i}", "gender": rng.choice(["F", "M"]), "medical_record_number": f"MRN{i:07d}"}
+            for i in range(patients)
+        ])
+        patient_ids = list(db.scalars(select(Patient.id)))
+        db.execute(insert(Report), [
+            {"patient_id": pid, "author_id": user.id,
+             "content": " ".join(rng.sample(FINDINGS, 3)) + " Clinical correlation recommended."}
+            for pid in patient_ids for _ in range(reports_per_patient)
+        ])
+        analyses = []
+        for pid in patient_ids:
+            for _ in range(analyses_per_patient):
+                scores = {name: round(rng.random(), 3) for name in PATHOLOGIES}
+                analyses.append({"patient_id": pid, "findings": str(scores), "annotation": "[]", "scores": scores})
+        db.execute(insert(Analysis), analyses)
+        rows = db.execute(select(Analysis.id, Analysis.scores)).all()
+        db.execute(insert(AnalysisScore), [
+            {"analysis_id": analysis_id, "pathology_id": pathology_ids[name], "score": score}
+            for analysis_id, scores in rows for name, score in scores.items()
+        ])
+        db.commit()
+        return patient_ids
+    finally:
+        db.close()
+
+
+class Context:
+    def __init__(self, token: str, patient_ids: list, images: dict):
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.patient_ids = patient_ids
+        self.images = images
+
+
+def login(http, rng, ctx):
+    return http.post("/api/auth/token", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+
+
+def list_patients(http, rng, ctx):
+    return http.get("/api/patients/", params={"limit": 20}, headers=ctx.headers)
+
+
+def list_reports(http, rng, ctx):
+    return http.get(f"/api/reports/patient/{rng.choice(ctx.patient_ids)}", headers=ctx.headers)
+
+
+def list_analyses(http, rng, ctx):
+    return http.get(f"/api/analyses/patient/{rng.choice(ctx.patient_ids)}", headers=ctx.headers)
+
+
+def generate_report(http, rng, ctx):
+    findings = " ".join(rng.sample(FINDINGS, 2))
+    return http.post("/api/ai/generate-report", params={"findings": findings, "cache": False})
+
+
+def upload(path, resolution, **params):
+    def request(http, rng, ctx):
+        image = rng.choice(ctx.images[resolution])
+        return http.post(path, params=params, files={"file": ("film.png", image, "image/png")})
+    return request
+
+
+SCENARIOS = {
+    "login": login,
+    "list_patients": list_patients,
+    "list_reports": list_reports,
+    "list_analyses": list_analyses,
+    "generate_report": generate_report,
+}
+for _resolution in RESOLUTIONS:
+    SCENARIOS[f"analyze_image_{_resolution}"] = upload("/api/ai/analyze-image", _resolution)
+    SCENARIOS[f"detect_objects_{_resolution}"] = upload("/api/ai/detect-objects", _resolution)
+
+
+async def run_scenario(url, name, ctx, concurrency, seconds, warmup, seed):
+    request = SCENARIOS[name]
+    latencies, errors = [], Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=300) as http:
+        rng = random.Random(seed)
+        for _ in range(warmup):
+            await request(http, rng, ctx)
+
+        stop = time.perf_counter() + seconds
+
+        async def client(client_seed):
+            rng = random.Random(client_seed)
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                try:
+                    response = await request(http, rng, ctx)
+                    if response.status_code != 200:
+                        errors[str(response.status_code)] += 1
+                except httpx.HTTPError as exc:
+                    errors[type(exc).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(seed * 1000 + i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "mean_ms": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Returns (rows, regressed) with one row per scenario/concurrency present in both runs
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    rows, regressed = [], False
+    for r in results:
+        b = previous.get((r["scenario"], r["concurrency"]))
+        if b is None:
+            continue
+        throughput = r["requests_per_second"] / b["requests_per_second"] - 1 if b["requests_per_second"] else 0.0
+        p95 = r["p95_ms"] / b["p95_ms"] - 1 if b["p95_ms"] else 0.0
+        worse = throughput < -tolerance or p95 > tolerance or r["errors"] > b["errors"]
+        regressed = regressed or worse
+        rows.append((r["scenario"], r["concurrency"], throughput, p95, worse))
+    return rows, regressed
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def start(module_args, env):
+    return subprocess.Popen([sys.executable, "-m"] + module_args, cwd=BACKEND_DIR, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=int, default=3, help="requests per scenario before measuring")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--reports-per-patient", type=int, default=4)
+    parser.add_argument("--analyses-per-patient", type=int, default=3)
+    parser.add_argument("--images-per-resolution", type=int, default=8)
+    parser.add_argument("--weights", choices=["random", "pretrained"], default="random")
+    parser.add_argument("--llm-first-token-ms", type=float, default=200)
+    parser.add_argument("--llm-token-ms", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep the database and blob store here instead of a temporary directory")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "latest.json"))
+    parser.add_argument("--baseline", nargs="?", const=BASELINE,
+                        help=f"results file to compare against (default when given without a value: {BASELINE})")
+    parser.add_argument("--save-baseline", help="also write this run to the given baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative drop in req/s or rise in p95")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-suite-")
+    os.makedirs(workdir, exist_ok=True)
+    database_url = f"sqlite:///{os.path.join(workdir, 'suite.db')}"
+    if os.path.exists(os.path.join(workdir, "suite.db")):
+        os.unlink(os.path.join(workdir, "suite.db"))
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, BACKEND_DIR)
+
+    print(f"seeding {args.patients} patients into {database_url}", file=sys.stderr)
+    patient_ids = seed_database(args.patients, args.reports_per_patient, args.analyses_per_patient, args.seed)
+    from app.core.security import create_access_token
+    token = create_access_token({"sub": BENCH_EMAIL})
+
+    resolutions = {name.rsplit("_", 1)[1] for name in args.scenarios if name.rsplit("_", 1)[-1] in RESOLUTIONS}
+    images = {resolution: image_set(resolution, args.images_per_resolution) for resolution in sorted(resolutions)}
+    ctx = Context(token, patient_ids, images)
+
+    stub_port, api_port = free_port(), free_port()
+    env = dict(
+        os.environ, DATABASE_URL=database_url, BLOB_DIR=os.path.join(workdir, "blobs"),
+        AI_CACHE_SIZE="0", AI_CACHE_DIR="", AI_WARMUP="", AI_EXECUTION_MODE="thread", LLM_CACHE_TTL="0",
+        OPENROUTER_URL=f"http://127.0.0.1:{stub_port}/v1/chat/completions", OPENROUTER_API_KEY="offline",
+    )
+    stub = start(["benchmarks.openrouter_stub", "--port", str(stub_port), "--first-token-ms",
+                  str(args.llm_first_token_ms), "--token-ms", str(args.llm_token_ms)], env)
+    server = start(["benchmarks.server", "--port", str(api_port), "--weights", args.weights], env)
+    results = []
+    try:
+        url = f"http://127.0.0.1:{api_port}"
+        asyncio.run(wait_ready(url, timeout=60))
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_scenario(url, name, ctx, concurrency, args.seconds, args.warmup, args.seed))
+                results.append(result)
+                print(f"{name:<22} c={concurrency:<4} {result['requests_per_second']:>8.1f} req/s  "
+                      f"p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms"
+                      + (f"  errors {result['error_kinds']}" if result["errors"] else ""), file=sys.stderr)
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    run = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "baseline", "save_baseline", "workdir")},
+        "results": results,
+    }
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(results, baseline, args.tolerance)
+        for key, value in run["settings"].items():
+            if key in baseline.get("settings", {}) and baseline["settings"][key] != value:
+                print(f"note: {key} is {value!r} here but {baseline['settings'][key]!r} in the baseline", file=sys.stderr)
+        print(f"\ncompared with {args.baseline} ({baseline.get('git_commit') or 'unknown commit'})")
+        print(f"{'scenario':<22} {'conc':>5} {'req/s':>8} {'p95':>8}")
+        for scenario, concurrency, throughput, p95, worse in rows:
+            print(f"{scenario:<22} {concurrency:>5} {throughput:>+8.1%} {p95:>+8.1%}" + ("  REGRESSION" if worse else ""))
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
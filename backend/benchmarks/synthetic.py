@@ -0,0 +1,58 @@
+"""Synthetic chest radiographs for offline benchmarks.
+
+The images are not anatomically meaningful, but they have what matters for
+decode and inference cost: a realistic size and bit depth, a smooth body
+outline with dark lung fields, a bright spine, heart and ribs, and
+low-frequency shading plus sensor noise, so they compress like real films
+rather than like flat or purely random images.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+# Name -> (width, height) of a typical film at that size
+RESOLUTIONS = {
+    "512": (512, 512),
+    "1024": (1024, 1024),
+    "2048": (2048, 2500),
+}
+
+
+def radiograph(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Returns a float32 image in [0, 1], bright where tissue is dense."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1:1:complex(0, height), -1:1:complex(0, width)].astype(np.float32)
+
+    body = np.exp(-(x / 0.85) ** 8 - (y / 0.98) ** 8)
+    image = 0.55 * body
+    for side in (-1, 1):
+        cx, cy = side * (0.36 + rng.uniform(-0.03, 0.03)), -0.05 + rng.uniform(-0.03, 0.03)
+        lung = np.exp(-((x - cx) / 0.26) ** 4 - ((y - cy) / 0.55) ** 4)
+        image -= 0.35 * lung
+        ribs = 0.5 + 0.5 * np.sin(18 * (y + 0.35 * (x - cx) ** 2) + rng.uniform(0, np.pi))
+        image += 0.12 * lung * ribs ** 6
+    image += 0.35 * np.exp(-(x / 0.07) ** 2) * body  # spine
+    image += 0.25 * np.exp(-((x - 0.1) / 0.22) ** 2 - ((y - 0.3) / 0.25) ** 2)  # heart
+
+    coarse = rng.normal(0, 0.04, (8, 8)).astype(np.float32)
+    shading = np.asarray(Image.fromarray(coarse, "F").resize((width, height), Image.BICUBIC))
+    image += shading + rng.normal(0, 0.015, (height, width)).astype(np.float32)
+    return np.clip(image, 0.0, 1.0)
+
+
+def encode(image: np.ndarray, fmt: str = "PNG", bits: int = 8, quality: int = 90) -> bytes:
+    # 16-bit output (PNG only) mimics films exported from DICOM
+    if bits == 16:
+        img = Image.fromarray((image * 65535).astype(np.uint16), "I;16")
+    else:
+        img = Image.fromarray((image * 255).astype(np.uint8), "L")
+    buf = io.BytesIO()
+    img.save(buf, fmt, **({"quality": quality} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def image_set(resolution: str, count: int = 8, fmt: str = "PNG", bits: int = 8) -> list:
+    # Distinct images, so repeated requests are not served from the result cache
+    width, height = RESOLUTIONS[resolution]
+    return [encode(radiograph(width, height, seed), fmt, bits) for seed in range(count)]
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+
+# Settings are read when the app modules are imported, so they go first
+_tmp = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/test.db",
+    DB_ASYNC="false",
+    BLOB_DIR=os.path.join(_tmp, "blobs"),
+    BLOB_GC_INTERVAL="0",
+    AI_CACHE_DIR="",
+    AI_WARMUP="",
+    METRICS_ENABLED="false",
+    COMPRESSION_ENABLED="false",
+)
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.ai as ai
+from app.db.init_db import init_db
+from app.inference import models
+from app.main import app
+
+init_db()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def auth(client):
+    # Bearer header of a registered user, shared by the whole session
+    credentials = {"email": "tester@example.com", "password": "s3cret-pass"}
+    client.post("/api/auth/register", json=dict(credentials, full_name="Test User"))
+    token = client.post(
+        "/api/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+    ).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def patient(client, auth):
+    response = client.post("/api/patients/", json={"name": "Jane Roe", "dob": "1980-05-17"}, headers=auth)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def fake_classifier(tmp_path, monkeypatch):
+    # Scores every image {"Effusion": 0.25} without loading a model; returns
+    # the weights file (its content is the model version) and the batch sizes seen
+    weights = tmp_path / "classifier.pt"
+    weights.write_bytes(b"weights v1")
+    monkeypatch.setitem(models.WEIGHTS_FILES, "classifier", str(weights))
+    calls = []
+
+    def classify(images):
+        calls.append(len(images))
+        return [{"Effusion": 0.25} for _ in images]
+
+    monkeypatch.setattr(ai.classifier_batcher, "run_batch", classify)
+    return weights, calls
@@ -0,0 +1,70 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from app.inference import backends, export, models
+
+torch = pytest.importorskip("torch")
+
+PATHOLOGIES = ["Atelectasis", "Effusion", "Mass"]
+
+
+def build_tiny():
+    # Random weights in the classifier's shape: Nx1x224x224 in, N x len(PATHOLOGIES) out
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(1, 4, kernel_size=8, stride=8), torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(), torch.nn.Linear(4, len(PATHOLOGIES)),
+    )
+    model.pathologies = PATHOLOGIES
+    return model.eval()
+
+
+@pytest.fixture
+def tiny_classifier(monkeypatch):
+    monkeypatch.setattr(models, "build_classifier", build_tiny)
+    return np.random.default_rng(0).normal(0, 500, (3, 1, 224, 224)).astype(np.float32)
+
+
+# Tolerances are relative to the largest output
+@pytest.mark.parametrize("backend, tolerance", [("torchscript", 1e-6), ("int8-dynamic", 0.02), ("onnx", 1e-5)])
+def test_exported_classifier_round_trips(tmp_path, tiny_classifier, backend, tolerance):
+    if backend == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+    batch = tiny_classifier
+    path = export.export_classifier(backend, str(tmp_path), list(batch))
+    assert path == backends.artifact_path("classifier", backend, str(tmp_path))
+    with open(backends.metadata_path("classifier", str(tmp_path))) as f:
+        assert json.load(f)["pathologies"] == PATHOLOGIES
+
+    expected = backends.load_classifier_runner("eager", build_tiny, str(tmp_path))(batch)
+    runner = backends.load_classifier_runner(backend, build_tiny, str(tmp_path))
+    assert (runner.backend, runner.pathologies) == (backend, PATHOLOGIES)
+    actual = runner(batch)
+    assert actual.shape == (3, len(PATHOLOGIES))
+    assert np.abs(actual - expected).max() <= tolerance * np.abs(expected).max()
+
+
+def test_onnx_without_onnxruntime_is_a_clear_error(tmp_path, monkeypatch):
+    for path in (backends.artifact_path("classifier", "onnx", str(tmp_path)),
+                 backends.metadata_path("classifier", str(tmp_path))):
+        with open(path, "w") as f:
+            f.write(json.dumps({"pathologies": PATHOLOGIES}))
+    # Makes "import onnxruntime" fail as if it were not installed
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="requirements-onnx.txt"):
+        backends.load_classifier_runner("onnx", build_tiny, str(tmp_path))
+
+
+def test_missing_artifact_names_the_export_command(tmp_path):
+    with pytest.raises(FileNotFoundError, match="--model classifier --backend torchscript"):
+        backends.load_classifier_runner("torchscript", build_tiny, str(tmp_path))
+
+
+def test_unsupported_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(backends, "AI_DETECTOR_BACKEND", "onnx")
+    with pytest.raises(ValueError, match="not supported for the detector"):
+        backends.active_backend("detector")
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.inference.batching import MicroBatcher
+
+
+def doubled(items):
+    return [item * 2 for item in items]
+
+
+def run(batcher, items):
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(item) for item in items))
+    return asyncio.run(submit_all())
+
+
+def test_full_batch_is_dispatched_without_waiting():
+    batcher = MicroBatcher(doubled, max_batch_size=4, max_wait_ms=5000)
+    started = time.perf_counter()
+    assert run(batcher, [1, 2, 3, 4]) == [2, 4, 6, 8]
+    assert time.perf_counter() - started < 2
+    assert batcher.stats()["batch_size_histogram"] == {"4": 1}
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    batcher = MicroBatcher(doubled, max_batch_size=8, max_wait_ms=100)
+    started = time.perf_counter()
+    assert run(batcher, [1, 2, 3]) == [2, 4, 6]
+    assert time.perf_counter() - started >= 0.09
+    assert batcher.stats()["batch_size_histogram"] == {"3": 1}
+
+
+def test_items_beyond_max_batch_size_go_to_the_next_batch():
+    batcher = MicroBatcher(doubled, max_batch_size=4, max_wait_ms=20)
+    assert run(batcher, list(range(10))) == [item * 2 for item in range(10)]
+    stats = batcher.stats()
+    assert stats["items"] == 10
+    assert max(int(size) for size in stats["batch_size_histogram"]) <= 4
+
+
+def test_batch_error_reaches_every_caller():
+    def fail(items):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(fail, max_batch_size=2, max_wait_ms=10)
+
+    async def submit_all():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(submit_all())
+    assert [str(result) for result in results] == ["model crashed", "model crashed"]
+    assert batcher.errors == 1
+
+
+def test_cancelled_submission_is_left_out_of_the_batch():
+    seen = []
+
+    def record(items):
+        seen.append(list(items))
+        return items
+
+    batcher = MicroBatcher(record, max_batch_size=8, max_wait_ms=50)
+
+    async def main():
+        cancelled = asyncio.ensure_future(batcher.submit("gone"))
+        kept = asyncio.ensure_future(batcher.submit("kept"))
+        await asyncio.sleep(0)
+        assert batcher.pending == batcher.stats()["pending"] == 2
+        cancelled.cancel()
+        assert await kept == "kept"
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(main())
+    assert seen == [["kept"]]
+
+
+@pytest.mark.parametrize("returned", [1, 3])
+def test_wrong_number_of_results_fails_every_caller(returned):
+    batcher = MicroBatcher(lambda items: [0] * returned, max_batch_size=2, max_wait_ms=10, name="classifier")
+
+    async def submit_all():
+        calls = asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        return await asyncio.wait_for(calls, timeout=5)
+
+    results = asyncio.run(submit_all())
+    assert [str(result) for result in results] == [f"classifier returned {returned} results for a batch of 2"] * 2
+    assert batcher.errors == 1
+
+
+def test_dispatched_batches_are_referenced_until_done():
+    release = threading.Event()
+    batcher = MicroBatcher(lambda items: release.wait() and items, max_batch_size=1, max_wait_ms=0)
+
+    async def main():
+        call = asyncio.ensure_future(batcher.submit("x"))
+        while not batcher._dispatches:
+            await asyncio.sleep(0.01)
+        running = len(batcher._dispatches)
+        release.set()
+        result = await call
+        await asyncio.sleep(0)
+        return running, result, len(batcher._dispatches)
+
+    assert asyncio.run(main()) == (1, "x", 0)
@@ -0,0 +1,155 @@
+import csv
+import io
+import json
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import bulk as bulk_api
+from app.core.bulk import import_patients
+from app.core.deps import db_session
+from app.db.session import SessionLocal
+from app.models.patient import Patient
+
+
+@pytest.fixture
+def mrn():
+    # Record numbers unique to one test, since the database is shared
+    prefix = uuid.uuid4().hex[:8]
+    return lambda n: f"{prefix}-{n}"
+
+
+def ndjson(rows) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def upload(client, auth, data: bytes, filename: str, **params):
+    response = client.post("/api/bulk/patients", params=params, headers=auth,
+                           files={"file": (filename, data, "application/octet-stream")})
+    return response.status_code, response.json()
+
+
+def patients_by_mrn(numbers):
+    db = SessionLocal()
+    try:
+        rows = db.query(Patient).filter(Patient.medical_record_number.in_(numbers)).all()
+        return {row.medical_record_number: row for row in rows}
+    finally:
+        db.close()
+
+
+def test_import_inserts_then_updates_by_record_number(client, auth, mrn):
+    rows = [{"name": f"P{i}", "dob": "1970-01-0%d" % (i + 1), "medical_record_number": mrn(i)} for i in range(3)]
+    assert upload(client, auth, ndjson(rows), "p.ndjson")[1] == {
+        "rows": 3, "inserted": 3, "updated": 0, "invalid": 0, "errors": []}
+
+    csv_data = f"name,dob,gender,medical_record_number\nRenamed,,F,{mrn(0)}\nNew,1999-09-09,,{mrn(3)}\n"
+    status, summary = upload(client, auth, csv_data.encode(), "p.csv")
+    assert status == 200
+    assert (summary["inserted"], summary["updated"]) == (1, 1)
+
+    stored = patients_by_mrn([mrn(i) for i in range(4)])
+    assert len(stored) == 4
+    assert (stored[mrn(0)].name, stored[mrn(0)].gender) == ("Renamed", "F")
+    # The row replaces the patient, so an empty cell clears the stored value
+    assert stored[mrn(0)].dob is None
+    assert str(stored[mrn(1)].dob) == "1970-01-02"
+
+
+def test_invalid_rows_are_skipped_and_reported(client, auth, mrn):
+    data = ndjson([{"name": "Ok", "medical_record_number": mrn(0)}, {"dob": "not a date"}])
+    data += b"{broken json\n"
+    status, summary = upload(client, auth, data, "p.ndjson")
+    assert status == 200
+    assert (summary["rows"], summary["inserted"], summary["invalid"]) == (3, 1, 2)
+    assert [error["line"] for error in summary["errors"]] == [2, 3]
+    assert "Invalid JSON" in summary["errors"][1]["error"]
+    assert mrn(0) in patients_by_mrn([mrn(0)])
+
+
+def test_atomic_import_writes_nothing_when_a_row_is_invalid(client, auth, mrn):
+    data = ndjson([{"name": "A", "medical_record_number": mrn(0)}, {"name": "", "dob": "bad"}])
+    status, body = upload(client, auth, data, "p.ndjson", atomic="true")
+    assert status == 422
+    assert body["detail"]["invalid"] == 1
+    assert body["detail"]["inserted"] == 0
+    assert patients_by_mrn([mrn(0)]) == {}
+
+
+def test_atomic_import_rolls_back_earlier_chunks(mrn):
+    # The first chunk is already upserted when the second one turns out invalid
+    existing = SessionLocal()
+    existing.add(Patient(name="Before", medical_record_number=mrn(0)))
+    existing.commit()
+    existing.close()
+
+    rows = [{"name": "After", "medical_record_number": mrn(0)}, {"name": "B", "medical_record_number": mrn(1)},
+            {"name": "C", "dob": "bad", "medical_record_number": mrn(2)}]
+    db = SessionLocal()
+    try:
+        with pytest.raises(HTTPException) as error:
+            import_patients(db, io.BytesIO(ndjson(rows)), "ndjson", atomic=True, chunk_size=2)
+    finally:
+        db.close()
+    assert error.value.status_code == 422
+    stored = patients_by_mrn([mrn(0), mrn(1), mrn(2)])
+    assert list(stored) == [mrn(0)]
+    assert stored[mrn(0)].name == "Before"
+
+
+def test_malformed_csv_row_is_a_row_error(client, auth, mrn):
+    data = f"name,medical_record_number\nA,{mrn(0)}\n{'x' * 200000},{mrn(1)}\nC,{mrn(2)}\n".encode()
+    status, summary = upload(client, auth, data, "p.csv")
+    assert status == 200
+    assert (summary["inserted"], summary["invalid"]) == (2, 1)
+    assert summary["errors"][0]["line"] == 3
+    assert summary["errors"][0]["error"].startswith("Malformed CSV row")
+
+
+def test_malformed_csv_header_is_a_400(client, auth):
+    status, body = upload(client, auth, b"x" * 200000 + b",name\n", "p.csv")
+    assert status == 400
+    assert body["detail"].startswith("Malformed CSV header")
+
+
+def test_export_streams_every_row(client, auth, mrn):
+    upload(client, auth, ndjson([{"name": f"E{i}", "medical_record_number": mrn(i)} for i in range(3)]), "p.ndjson")
+    with client.stream("GET", "/api/bulk/patients", params={"format": "csv"}, headers=auth) as response:
+        assert response.headers["Content-Disposition"] == "attachment; filename=patients.csv"
+        text = "".join(response.iter_text())
+    records = list(csv.DictReader(io.StringIO(text)))
+    assert {mrn(i) for i in range(3)} <= {record["medical_record_number"] for record in records}
+    ids = [int(record["id"]) for record in records]
+    assert ids == sorted(ids)
+
+    lines = client.get("/api/bulk/patients", headers=auth).text.splitlines()
+    assert len(lines) == len(records)
+
+
+def test_import_over_the_upload_limit_is_a_413(client, auth, mrn, monkeypatch):
+    data = ndjson([{"name": "Big", "medical_record_number": mrn(0)}])
+    monkeypatch.setattr(bulk_api, "AI_MAX_UPLOAD_BYTES", len(data) - 1)
+    status, body = upload(client, auth, data, "p.ndjson")
+    assert status == 413
+    assert body["detail"] == f"Upload exceeds {len(data) - 1} bytes"
+    assert patients_by_mrn([mrn(0)]) == {}
+
+
+def test_export_body_streams_on_its_own_session(client, auth, monkeypatch):
+    events = []
+
+    @asynccontextmanager
+    async def tracked():
+        async with db_session() as db:
+            events.append("open")
+            yield db
+        events.append("closed")
+
+    monkeypatch.setattr(bulk_api, "db_session", tracked)
+    response = client.get("/api/bulk/patients", headers=auth)
+    assert response.status_code == 200
+    assert all(json.loads(line)["id"] for line in response.text.splitlines())
+    # Opened by the body itself and closed once it was drained
+    assert events == ["open", "closed"]
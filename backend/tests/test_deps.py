@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import app.core.async_deps as async_deps
+import app.core.deps as deps
+
+
+class FakeAsyncSession:
+    # Counts sessions opened and closed, standing in for AsyncSessionLocal
+    opened = closed = 0
+
+    async def __aenter__(self):
+        FakeAsyncSession.opened += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        FakeAsyncSession.closed += 1
+
+
+@pytest.fixture
+def two_slots(monkeypatch):
+    monkeypatch.setattr(deps, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(deps, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(deps, "DB_POOL_TIMEOUT", 0.05)
+    # Fresh slots for this test's loop; the app's are put back afterwards
+    for name in ("_db_slots", "_db_slots_loop", "_close_limiter"):
+        monkeypatch.setattr(deps, name, None)
+    monkeypatch.setattr(async_deps, "AsyncSessionLocal", FakeAsyncSession)
+    FakeAsyncSession.opened = FakeAsyncSession.closed = 0
+
+
+@pytest.mark.parametrize("dependency", [deps.get_db, async_deps.get_async_db])
+def test_sessions_wait_for_a_slot_then_503(two_slots, dependency):
+    async def main():
+        held = [dependency() for _ in range(2)]
+        for session in held:
+            await session.__anext__()
+        with pytest.raises(HTTPException) as error:
+            await dependency().__anext__()
+        # Finishing a request frees its slot for the next one
+        await held[0].aclose()
+        late = dependency()
+        await late.__anext__()
+        for session in (held[1], late):
+            await session.aclose()
+        return error.value, deps.db_slots()._value
+
+    error, free = asyncio.run(main())
+    assert (error.status_code, error.detail) == (503, "Database busy, try again")
+    assert free == 2
+
+
+def test_async_session_is_closed_with_its_slot(two_slots):
+    async def main():
+        session = async_deps.get_async_db()
+        await session.__anext__()
+        await session.aclose()
+
+    asyncio.run(main())
+    assert (FakeAsyncSession.opened, FakeAsyncSession.closed) == (1, 1)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from app.inference.detection import make_tiles, merge_tiles, nms, tile_origins, to_annotations
+
+
+def detections(*rows):
+    # (x1, y1, x2, y2, score, label) rows to detector outputs
+    rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+    return {"boxes": rows[:, :4], "scores": rows[:, 4], "labels": rows[:, 5].astype(np.int64)}
+
+
+@pytest.mark.parametrize("length, tile, overlap, origins", [
+    (500, 800, 0.2, [0]),
+    (800, 800, 0.2, [0]),
+    (1000, 800, 0.2, [0, 200]),
+    (2000, 800, 0.2, [0, 640, 1200]),
+    (2000, 800, 0.0, [0, 800, 1200]),
+    (10, 4, 0.99, list(range(0, 6)) + [6]),
+])
+def test_tile_origins(length, tile, overlap, origins):
+    assert tile_origins(length, tile, overlap) == origins
+
+
+@pytest.mark.parametrize("length", [801, 1000, 1999, 4096])
+def test_tiles_cover_the_image_and_stay_inside_it(length):
+    origins = tile_origins(length, 800, 0.2)
+    assert origins[0] == 0 and origins[-1] + 800 == length
+    assert all(later - earlier <= 800 for earlier, later in zip(origins, origins[1:]))
+
+
+def test_edge_tiles_are_full_size_and_offsets_index_the_image():
+    image = np.arange(1000 * 900, dtype=np.int32).reshape(1000, 900)
+    tiles = make_tiles(image, tile=400, overlap=0.25)
+    assert [origin for origin, _ in tiles] == [
+        (x, y) for y in (0, 300, 600) for x in (0, 300, 500)]
+    for (x, y), pixels in tiles:
+        assert pixels.shape == (400, 400)
+        assert pixels[0, 0] == image[y, x]
+        # A view, not a copy
+        assert np.shares_memory(pixels, image)
+
+
+def test_small_image_is_one_tile():
+    image = np.zeros((300, 200, 3), dtype=np.uint8)
+    [(origin, pixels)] = make_tiles(image, tile=800)
+    assert origin == (0, 0) and pixels.shape == image.shape
+
+
+def test_nms_keeps_the_best_of_overlapping_boxes():
+    out = detections(
+        (0, 0, 10, 10, 0.6, 1),
+        (1, 1, 11, 11, 0.9, 1),  # IoU with the first is about 0.68
+        (20, 20, 30, 30, 0.5, 1),
+    )
+    assert nms(out["boxes"], out["scores"], out["labels"], 0.5).tolist() == [1, 2]
+    assert nms(out["boxes"], out["scores"], out["labels"], 0.7).tolist() == [1, 0, 2]
+
+
+def test_nms_never_suppresses_across_classes():
+    out = detections(
+        (0, 0, 10, 10, 0.9, 1),
+        (0, 0, 10, 10, 0.8, 2),
+        (0, 0, 10, 10, 0.7, 1),
+        (0, 0, 10, 10, 0.6, 0),
+    )
+    assert nms(out["boxes"], out["scores"], out["labels"], 0.5).tolist() == [0, 1, 3]
+
+
+def test_nms_of_nothing():
+    out = detections()
+    assert nms(out["boxes"], out["scores"], out["labels"], 0.5).tolist() == []
+
+
+def test_merge_shifts_tile_boxes_and_drops_duplicates_from_the_overlap():
+    # The same finding seen near the right edge of tile (0, 0) and the left edge of tile (300, 0)
+    left = detections((320, 50, 380, 110, 0.8, 3), (10, 10, 20, 20, 0.4, 3))
+    right = detections((22, 52, 82, 112, 0.9, 3), (22, 52, 82, 112, 0.7, 5))
+    merged = merge_tiles([left, right], [(0, 0), (300, 0)], top_k=10)
+    assert merged["boxes"].tolist() == [[322, 52, 382, 112], [322, 52, 382, 112], [10, 10, 20, 20]]
+    assert merged["scores"].tolist() == pytest.approx([0.9, 0.7, 0.4])
+    assert merged["labels"].tolist() == [3, 5, 3]
+
+
+def test_merge_keeps_top_k_best():
+    tiles = [detections((0, 0, 5, 5, 0.1 * i, i)) for i in range(1, 6)]
+    merged = merge_tiles(tiles, [(100 * i, 0) for i in range(5)], top_k=2)
+    assert merged["labels"].tolist() == [5, 4]
+
+
+def test_merge_of_no_tiles():
+    merged = merge_tiles([], [], top_k=5)
+    assert [len(merged[key]) for key in ("boxes", "scores", "labels")] == [0, 0, 0]
+
+
+def test_annotations_are_scaled_back():
+    annotations = to_annotations(detections((10, 20, 30, 40, 0.5, 7)), scale=2.0)
+    assert annotations == [{"label": "7", "bbox": [20, 40, 60, 80], "score": 0.5}]
@@ -0,0 +1,121 @@
+import uuid
+
+import pytest
+
+from app.core.findings import parse_scores, pathology_ids
+from app.db.session import SessionLocal
+from app.models.pathology import Pathology
+
+
+@pytest.mark.parametrize("findings, scores", [
+    ({"Edema": 0.4}, {"Edema": 0.4}),
+    ('{"Edema": 0.4, "Mass": 1}', {"Edema": 0.4, "Mass": 1.0}),
+    ("{'Edema': 0.4}", {"Edema": 0.4}),
+    ("Detected 3 objects.", None),
+    ("{}", None),
+    ("[0.4]", None),
+    ("{'Edema': 'high'}", None),
+    ("{'Edema': __import__('os')}", None),
+    (None, None),
+])
+def test_parse_scores(findings, scores):
+    assert parse_scores(findings) == scores
+
+
+def test_duplicate_names_get_one_row():
+    name = "Finding " + uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        ids = pathology_ids(db, [name, name])
+        db.commit()
+        assert pathology_ids(db, [name]) == ids
+        assert db.query(Pathology).filter(Pathology.name == name).count() == 1
+        assert pathology_ids(db, ["Never seen " + name], create=False) == {}
+    finally:
+        db.close()
+
+
+def test_name_inserted_concurrently_is_reused(monkeypatch):
+    # Another session commits the same name between the lookup and the insert
+    name = "Finding " + uuid.uuid4().hex[:8]
+    kept = "Kept " + name
+    db = SessionLocal()
+    begin_nested = db.begin_nested
+    winner = []
+
+    def race_then_begin():
+        if not winner:
+            other = SessionLocal()
+            other.add(Pathology(name=name))
+            other.commit()
+            winner.append(other.query(Pathology.id).filter(Pathology.name == name).scalar())
+            other.close()
+        return begin_nested()
+
+    monkeypatch.setattr(db, "begin_nested", race_then_begin)
+    try:
+        ids = pathology_ids(db, [name, kept])
+        db.commit()
+        assert ids[name] == winner[0]
+        # The lost insert only rolled back its own savepoint
+        assert db.query(Pathology.id).filter(Pathology.name == kept).scalar() == ids[kept]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def scored(client, auth, patient):
+    # Analyses of a new patient: three scored, one with detector findings only
+    pathology = "Edema " + uuid.uuid4().hex[:8]
+    ids = {}
+    for score, other in ((0.2, 0.9), (0.5, 0.1), (0.8, 0.6)):
+        findings = str({pathology: score, "Effusion": other})
+        ids[score] = client.post("/api/analyses/", json={"patient_id": patient["id"], "findings": findings},
+                                 headers=auth).json()["id"]
+    unscored = client.post("/api/analyses/", json={"patient_id": patient["id"], "findings": "Detected 2 objects."},
+                           headers=auth).json()
+    return pathology, ids, unscored
+
+
+def search(client, auth, patient, **params):
+    response = client.get("/api/analyses/search", params=dict(params, patient_id=patient["id"]), headers=auth)
+    assert response.status_code == 200
+    return [(hit["id"], hit["score"]) for hit in response.json()]
+
+
+def test_score_bounds_are_inclusive(client, auth, patient, scored):
+    pathology, ids, _ = scored
+    assert search(client, auth, patient, pathology=pathology) == [(ids[0.8], 0.8), (ids[0.5], 0.5)]
+    assert search(client, auth, patient, pathology=pathology, min_score=0.2, max_score=0.5) == [
+        (ids[0.5], 0.5), (ids[0.2], 0.2)]
+    assert search(client, auth, patient, pathology=pathology, min_score=0.81) == []
+    assert search(client, auth, patient, pathology=pathology, min_score=0, require="Effusion:0.5") == [
+        (ids[0.8], 0.8), (ids[0.2], 0.2)]
+
+
+def test_rows_without_scores(client, auth, patient, scored):
+    pathology, ids, unscored = scored
+    assert unscored["scores"] is None
+    hits = search(client, auth, patient, pathology=pathology, min_score=0)
+    assert unscored["id"] not in [hit_id for hit_id, _ in hits]
+    assert len(hits) == 3
+    assert search(client, auth, patient, pathology="No such pathology") == []
+
+
+def test_search_pages_by_score(client, auth, patient, scored):
+    pathology, ids, _ = scored
+    url, params, seen = "/api/analyses/search", {"pathology": pathology, "min_score": 0, "limit": 1,
+                                                 "patient_id": patient["id"]}, []
+    while True:
+        response = client.get(url, params=params, headers=auth)
+        seen += [hit["score"] for hit in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert seen == [0.8, 0.5, 0.2]
+
+
+@pytest.mark.parametrize("condition", ["Effusion", ":0.5", "Effusion:high"])
+def test_bad_condition_is_a_400(client, auth, condition):
+    response = client.get("/api/analyses/search", params={"pathology": "Edema", "require": condition}, headers=auth)
+    assert response.status_code == 400
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app.core.blobstore import BlobStore, blob_store
+from app.inference.pyramid import Pyramid
+
+
+def png(seed: int, size=(300, 200)) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, size[::-1], dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def put(store: BlobStore, data: bytes, age: float = 0) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    store.put(digest, io.BytesIO(data))
+    if age:
+        past = time.time() - age
+        os.utime(store.path(digest), (past, past))
+    return digest
+
+
+@pytest.fixture(scope="module")
+def digest():
+    return put(blob_store, png(7))
+
+
+ROUTES = ["/api/images/{d}", "/api/images/{d}/info", "/api/images/{d}/thumbnail", "/api/images/{d}/tiles/0/0/0"]
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_image_routes_need_a_token(client, digest, route):
+    response = client.get(route.format(d=digest))
+    assert response.status_code == 401
+    bad = client.get(route.format(d=digest), headers={"Authorization": "Bearer not-a-token"})
+    assert bad.status_code == 401
+
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_image_routes_with_a_token(client, auth, digest, route):
+    url = route.format(d=digest)
+    response = client.get(url, headers=auth)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, max-age=31536000, immutable"
+    again = client.get(url, headers=dict(auth, **{"If-None-Match": response.headers["ETag"]}))
+    assert again.status_code == 304
+
+
+def test_original_is_served_as_uploaded(client, auth, digest):
+    response = client.get(f"/api/images/{digest}", headers=auth)
+    assert response.headers["Content-Type"] == "image/png"
+    assert hashlib.sha256(response.content).hexdigest() == digest
+    info = client.get(f"/api/images/{digest}/info", headers=auth).json()
+    assert (info["width"], info["height"]) == (300, 200)
+
+
+def test_unknown_image_is_a_404(client, auth):
+    assert client.get("/api/images/" + "0" * 64, headers=auth).status_code == 404
+    assert client.get("/api/images/" + "Z" * 64, headers=auth).status_code == 404
+
+
+def test_identical_uploads_are_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    data = png(1)
+    put(store, data)
+    put(store, data)
+    assert (store.puts, store.deduplicated) == (1, 1)
+    assert len(list(store.digests())) == 1
+
+
+def test_sweep_keeps_referenced_and_recent_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    kept = put(store, png(1), age=7200)
+    swept = put(store, png(2), age=7200)
+    recent = put(store, png(3))
+    os.makedirs(store.derived_path(swept))
+    checked = []
+
+    def referenced(batch):
+        checked.extend(batch)
+        return {kept}
+
+    assert store.sweep(referenced, grace=3600) == 1
+    assert sorted(checked) == sorted([kept, swept])
+    assert store.exists(kept) and store.exists(recent)
+    assert not store.exists(swept)
+    assert not os.path.exists(store.derived_path(swept))
+
+
+def test_reupload_during_a_sweep_keeps_the_blob(tmp_path):
+    store = BlobStore(str(tmp_path))
+    data = png(4)
+    digest = put(store, data, age=7200)
+
+    def referenced(batch):
+        # The same image arrives again while references are being checked
+        put(store, data)
+        return set()
+
+    assert store.sweep(referenced, grace=3600) == 0
+    assert store.exists(digest)
+
+
+@pytest.fixture
+def png_pyramid(tmp_path):
+    # Lossless tiles, so rendered pixels can be compared exactly
+    store = BlobStore(str(tmp_path))
+    # Odd sides, so level 1 is no integer reduction of the original
+    pixels = np.random.default_rng(3).integers(0, 256, (701, 1001), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return Pyramid(store, tile_size=256, tile_format="png"), put(store, buffer.getvalue()), Image.fromarray(pixels)
+
+
+def tile_files(pyramid, digest):
+    root = pyramid.store.derived_path(digest)
+    return sorted(os.path.relpath(os.path.join(path, name), root)
+                  for path, _, names in os.walk(root) for name in names)
+
+
+def test_only_the_requested_tile_is_rendered(png_pyramid):
+    pyramid, digest, original = png_pyramid
+    path = pyramid.tile(digest, 0, 3, 2)
+    assert tile_files(pyramid, digest) == [os.path.join("tiles-256", "0", "3_2.png")]
+    # The edge tile holds what is left of the image
+    tile = Image.open(path)
+    assert tile.size == (1001 - 3 * 256, 701 - 2 * 256)
+    assert np.array_equal(np.asarray(tile), np.asarray(original.crop((768, 512, 1001, 701))))
+
+    assert pyramid.tile(digest, 0, 3, 2) == path
+    assert pyramid.stats()["tiles_written"] == 1
+
+
+def test_reduced_level_tile_matches_the_resized_level(png_pyramid):
+    # Resampling one tile's region gives the pixels of resizing the whole level and cropping
+    pyramid, digest, original = png_pyramid
+    level = original.resize((501, 351), Image.LANCZOS)
+    for x, y in ((0, 0), (1, 1)):
+        box = (x * 256, y * 256, min(x * 256 + 256, 501), min(y * 256 + 256, 351))
+        tile = np.asarray(Image.open(pyramid.tile(digest, 1, x, y)))
+        expected = np.asarray(level.crop(box))
+        assert tile.shape == expected.shape
+        assert np.abs(tile.astype(int) - expected.astype(int)).max() <= 1
+
+
+@pytest.mark.parametrize("level, x, y", [(3, 0, 0), (0, 4, 0), (0, 0, 3), (1, 2, 0)])
+def test_tile_outside_the_image_is_a_404(png_pyramid, level, x, y):
+    pyramid, digest, _ = png_pyramid
+    with pytest.raises(HTTPException) as error:
+        pyramid.tile(digest, level, x, y)
+    assert error.value.status_code == 404
+    assert tile_files(pyramid, digest) == []
@@ -0,0 +1,127 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from app.inference.ingest import (
+    AI_MAX_IMAGE_PIXELS, AI_MAX_UPLOAD_BYTES, AI_SPOOL_THRESHOLD, ingest_stats, load_reduced, open_image, spool_upload,
+)
+
+
+def encode(image: Image.Image, format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    return buffer.getvalue()
+
+
+def noise(width: int, height: int, seed: int = 0) -> Image.Image:
+    return Image.fromarray(np.random.default_rng(seed).integers(0, 256, (height, width), dtype=np.uint8))
+
+
+def analyze(client, data: bytes, filename: str = "x.png"):
+    return client.post("/api/ai/analyze-image", files={"file": (filename, data, "application/octet-stream")})
+
+
+def counters(*names):
+    stats = ingest_stats.stats()
+    return {name: stats[name] for name in names}
+
+
+def test_upload_over_the_byte_limit_is_a_413(client):
+    before = counters("rejected_size", "uploads")
+    response = analyze(client, b"\0" * (AI_MAX_UPLOAD_BYTES + 1))
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"Upload exceeds {AI_MAX_UPLOAD_BYTES} bytes"
+    assert counters("rejected_size", "uploads") == {"rejected_size": before["rejected_size"] + 1,
+                                                     "uploads": before["uploads"]}
+
+
+def test_decompression_bomb_is_a_413_before_decoding(client, fake_classifier):
+    # A small PNG whose header promises more pixels than the limit
+    side = int(AI_MAX_IMAGE_PIXELS ** 0.5) + 1000
+    bomb = encode(Image.new("L", (side, side)), "PNG")
+    assert len(bomb) < AI_SPOOL_THRESHOLD
+    before = counters("rejected_pixels", "decoded")
+    response = analyze(client, bomb)
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith(f"Image has {side * side} pixels")
+    assert counters("rejected_pixels", "decoded") == {"rejected_pixels": before["rejected_pixels"] + 1,
+                                                       "decoded": before["decoded"]}
+    assert fake_classifier[1] == []
+
+
+def test_corrupt_image_is_a_400(client, fake_classifier):
+    before = ingest_stats.rejected_format
+    response = analyze(client, b"\x89PNG\r\n\x1a\n not really")
+    assert response.status_code == 400
+    assert ingest_stats.rejected_format == before + 1
+
+
+def test_large_upload_spools_to_disk_and_is_decoded_reduced(client, fake_classifier):
+    data = encode(noise(1400, 1400, seed=11), "PNG")
+    assert len(data) > AI_SPOOL_THRESHOLD
+    before = counters("uploads", "spooled_to_disk", "reduced_decodes")
+    response = analyze(client, data)
+    assert response.status_code == 200
+    assert counters("uploads", "spooled_to_disk", "reduced_decodes") == {
+        name: value + 1 for name, value in before.items()}
+    assert client.get("/api/ai/stats").json()["ingest"]["spooled_to_disk"] == before["spooled_to_disk"] + 1
+
+
+def spool(data: bytes, **limits):
+    upload = UploadFile(io.BytesIO(data), filename="x.bin")
+    return asyncio.run(spool_upload(upload, **limits))
+
+
+def test_small_upload_stays_in_memory_and_is_hashed():
+    upload = spool(b"abc", threshold=10)
+    assert (upload.size, upload.on_disk) == (3, False)
+    assert upload.digest == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+    assert upload.file.read() == b"abc"
+    upload.close()
+
+
+def test_spool_limit_is_enforced_while_reading():
+    with pytest.raises(HTTPException) as error:
+        spool(b"x" * 101, max_bytes=100)
+    assert error.value.status_code == 413
+    upload = spool(b"x" * 100, max_bytes=100, threshold=10)
+    assert upload.on_disk
+    upload.close()
+
+
+def test_jpeg_is_decoded_in_draft_mode():
+    fp = io.BytesIO(encode(noise(2000, 1600).convert("RGB"), "JPEG"))
+    before = ingest_stats.reduced_decodes
+    img = load_reduced(open_image(fp), "L", (224, 224))
+    # Draft mode scales by a power of two and never below the target: 1/8 would make it 200 high
+    assert img.size == (500, 400)
+    assert img.mode == "L"
+    assert ingest_stats.reduced_decodes == before + 1
+
+
+def test_png_is_reduced_by_an_integer_factor():
+    fp = io.BytesIO(encode(noise(1000, 700).convert("P"), "PNG"))
+    before = ingest_stats.reduced_decodes
+    img = load_reduced(open_image(fp), "RGB", (224, 224))
+    assert img.size == (334, 234)
+    assert img.mode == "RGB"
+    assert ingest_stats.reduced_decodes == before + 1
+
+
+def test_small_image_is_not_reduced():
+    fp = io.BytesIO(encode(noise(300, 300), "PNG"))
+    before = ingest_stats.reduced_decodes
+    assert load_reduced(open_image(fp), "L", (224, 224)).size == (300, 300)
+    assert load_reduced(open_image(fp), "L").size == (300, 300)
+    assert ingest_stats.reduced_decodes == before
+
+
+def test_pixel_limit_applies_to_open_image():
+    fp = io.BytesIO(encode(noise(100, 100), "PNG"))
+    with pytest.raises(HTTPException) as error:
+        open_image(fp, max_pixels=9999)
+    assert error.value.status_code == 413
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.websockets import WebSocketDisconnect
+
+import app.api.ai as ai
+from app.inference.jobs import Job, JobQueue, check_single_worker, server_workers
+
+
+def login(client, email):
+    credentials = {"email": email, "password": "other-pass"}
+    client.post("/api/auth/register", json=dict(credentials, full_name="Other User"))
+    token = client.post("/api/auth/token", data={"username": email, "password": credentials["password"]}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+@pytest.fixture
+def queue(client, monkeypatch):
+    # Stands in for the analysis queue: jobs finish at once, or wait while ``hold`` is set
+    hold = {"seconds": 0}
+
+    async def handler(job):
+        try:
+            await asyncio.sleep(hold["seconds"])
+        finally:
+            job.payload.close()
+        return {"kind": job.kind}
+
+    queue = JobQueue(handler, max_queued=1, workers=1, on_discard=lambda job: job.payload.close(), name="test")
+    queue.hold = hold
+    monkeypatch.setattr(ai, "analysis_jobs", queue)
+    yield queue
+    client.portal.call(queue.shutdown)
+
+
+def submit(client, auth, patient):
+    return client.post("/api/ai/jobs", data={"patient_id": patient["id"]}, headers=auth,
+                       files={"file": ("x.png", b"not decoded by the stand-in", "image/png")})
+
+
+def test_full_queue_is_a_429(client, auth, patient, queue):
+    queue.hold["seconds"] = 3600
+    # One job runs, one waits, and the next finds the queue full
+    statuses = [submit(client, auth, patient).status_code for _ in range(2)]
+    rejected = submit(client, auth, patient)
+    assert statuses == [202, 202]
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "5"
+    assert queue.stats()["rejected"] == 1
+
+
+def test_job_status_and_watch(client, auth, patient, queue):
+    response = submit(client, auth, patient)
+    assert response.status_code == 202
+    assert response.headers["Location"] == response.json()["status_url"]
+    token = auth["Authorization"].split()[1]
+    with client.websocket_connect(f"{response.json()['websocket_url']}?token={token}") as websocket:
+        states = []
+        while not states or states[-1]["status"] not in ("succeeded", "failed"):
+            states.append(websocket.receive_json())
+    assert states[-1]["status"] == "succeeded"
+    assert states[-1]["result"] == {"kind": "classify"}
+    assert client.get(response.headers["Location"], headers=auth).json()["status"] == "succeeded"
+
+
+def test_unknown_or_other_users_job_is_a_404(client, auth, patient, queue):
+    assert client.get("/api/ai/jobs/" + "0" * 32, headers=auth).status_code == 404
+    job_url = submit(client, auth, patient).headers["Location"]
+    other = login(client, "other@example.com")
+    assert client.get(job_url, headers=auth).status_code == 200
+    response = client.get(job_url, headers=other)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Job not found"
+
+    job_id = job_url.rsplit("/", 1)[1]
+    token = other["Authorization"].split()[1]
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(f"/api/ai/jobs/{job_id}/ws?token={token}"):
+            pass
+    assert closed.value.code == 4404
+
+
+@pytest.mark.parametrize("query", ["", "?token=", "?token=not-a-jwt"])
+def test_websocket_needs_a_valid_token(client, auth, patient, queue, query):
+    job_id = submit(client, auth, patient).json()["job_id"]
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(f"/api/ai/jobs/{job_id}/ws{query}"):
+            pass
+    assert closed.value.code == 1008
+
+
+def test_queue_rejects_beyond_max_queued():
+    async def main():
+        queue = JobQueue(lambda job: asyncio.sleep(3600), max_queued=2, workers=1)
+        # Workers have not run yet, so every job is still waiting
+        jobs = [queue.submit(Job("classify", None)) for _ in range(2)]
+        with pytest.raises(HTTPException) as error:
+            queue.submit(Job("classify", None))
+        await queue.shutdown()
+        return jobs, error.value
+
+    jobs, error = asyncio.run(main())
+    assert error.status_code == 429
+    assert [job.status for job in jobs] == ["failed", "failed"]
+
+
+def test_slow_job_times_out_and_fails():
+    async def main():
+        queue = JobQueue(lambda job: asyncio.sleep(3600), workers=1, timeout=0.05)
+        job = queue.submit(Job("detect", None))
+        states = [state["status"] async for state in job.watch()]
+        await queue.shutdown()
+        return queue, job, states
+
+    queue, job, states = asyncio.run(main())
+    assert states[-1] == "failed"
+    assert job.error == "Timed out after 0.05s"
+    assert (queue.stats()["timed_out"], queue.stats()["failed"]) == (1, 1)
+
+
+@pytest.mark.parametrize("argv, environ, workers", [
+    (["uvicorn", "app.main:app"], {}, 1),
+    (["uvicorn", "app.main:app", "--workers", "4"], {}, 4),
+    (["gunicorn", "-w=3", "app.main:app"], {}, 3),
+    (["uvicorn", "app.main:app"], {"WEB_CONCURRENCY": "2"}, 2),
+    (["uvicorn", "app.main:app", "--workers", "1"], {"WEB_CONCURRENCY": "2"}, 1),
+])
+def test_server_workers(argv, environ, workers):
+    assert server_workers(argv, environ) == workers
+
+
+def test_several_workers_refuse_to_start():
+    workers = server_workers(["uvicorn", "app.main:app"], {"WEB_CONCURRENCY": "2"})
+    with pytest.raises(RuntimeError, match="2 workers"):
+        check_single_worker("analysis", allow=False, workers=workers)
+    check_single_worker("analysis", allow=True, workers=workers)
+    check_single_worker("analysis", allow=False, workers=1)
@@ -0,0 +1,331 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app.core.llm as llm
+from app.core.llm import CoalescingCompletions, LLMClient, prompt_key
+from benchmarks.openrouter_stub import REPORT, create_app
+
+
+class FakeClient:
+    # Stands in for LLMClient; every call waits on ``release`` so callers overlap
+    url = "http://llm.test/v1/chat/completions"
+
+    def __init__(self, tokens=("Normal ", "chest."), error=None):
+        self.tokens = tokens
+        self.error = error
+        self.calls = 0
+        self.release = None
+
+    async def complete(self, payload):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return "".join(self.tokens)
+
+    async def stream(self, payload):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        for token in self.tokens:
+            yield token
+
+
+def payload(prompt="Findings: none"):
+    return {"model": "m", "messages": [{"role": "user", "content": prompt}]}
+
+
+def run(main):
+    async def with_release(client):
+        client.release = asyncio.Event()
+        return await main(client)
+    return lambda client: asyncio.run(with_release(client))
+
+
+def test_prompt_key_ignores_stream_and_key_order():
+    assert prompt_key("u", dict(payload(), stream=True)) == prompt_key("u", {**payload(), "model": "m"})
+    assert prompt_key("u", payload("a")) != prompt_key("u", payload("b"))
+    assert prompt_key("u", payload()) != prompt_key("v", payload())
+
+
+def test_identical_concurrent_requests_share_one_call():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        calls = [asyncio.ensure_future(completions.complete(payload())) for _ in range(5)]
+        await asyncio.sleep(0)
+        client.release.set()
+        return await asyncio.gather(*calls)
+
+    results = main(client)
+    assert client.calls == 1
+    assert [status for _, status in results] == ["miss"] + ["coalesced"] * 4
+    assert {text for text, _ in results} == {"Normal chest."}
+    assert completions.stats()["coalesced"] == 4
+
+
+def test_streaming_followers_get_every_token():
+    client = FakeClient(tokens=("a", "b", "c"))
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        streams = [completions.stream(payload()) for _ in range(3)]
+
+        async def read(tokens):
+            return [token async for token in tokens]
+
+        readers = [asyncio.ensure_future(read(tokens)) for _, tokens in streams]
+        await asyncio.sleep(0)
+        client.release.set()
+        return [status for status, _ in streams], await asyncio.gather(*readers)
+
+    statuses, tokens = main(client)
+    assert statuses == ["miss", "coalesced", "coalesced"]
+    assert tokens == [["a", "b", "c"]] * 3
+    assert client.calls == 1
+
+
+def test_finished_report_is_cached_until_the_ttl(monkeypatch):
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(llm.time, "monotonic", lambda: now[0])
+
+    @run
+    async def main(client):
+        client.release.set()
+        first = await completions.complete(payload())
+        second = await completions.complete(payload())
+        _, tokens = completions.stream(payload())
+        streamed = "".join([token async for token in tokens])
+        now[0] += 61
+        expired = await completions.complete(payload())
+        return first, second, streamed, expired
+
+    first, second, streamed, expired = main(client)
+    assert (first[1], second[1], expired[1]) == ("miss", "hit", "miss")
+    assert second[0] == streamed == "Normal chest."
+    assert client.calls == 2
+    assert completions.stats()["expired"] == 1
+
+
+def test_cache_bypass_and_refresh():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        client.release.set()
+        await completions.complete(payload())
+        bypass = await completions.complete(payload(), cache=False)
+        refresh = await completions.complete(payload(), refresh=True)
+        return bypass[1], refresh[1]
+
+    assert main(client) == ("bypass", "miss")
+    assert client.calls == 3
+    assert completions.stats()["refreshed"] == 1
+
+
+def test_failure_reaches_every_follower_and_is_not_cached():
+    client = FakeClient(error=RuntimeError("upstream down"))
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        calls = [asyncio.ensure_future(completions.complete(payload())) for _ in range(3)]
+        await asyncio.sleep(0)
+        client.release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    assert [str(result) for result in main(client)] == ["upstream down"] * 3
+    assert completions.stats()["entries"] == 0
+
+    @run
+    async def retry(client):
+        client.error = None
+        client.release.set()
+        return (await completions.complete(payload()))[1]
+
+    assert retry(client) == "miss"
+    assert client.calls == 2
+
+
+def test_cache_is_bounded():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60, max_entries=2)
+
+    @run
+    async def main(client):
+        client.release.set()
+        for prompt in ("a", "b", "c"):
+            await completions.complete(payload(prompt))
+        return (await completions.complete(payload("a")))[1]
+
+    assert main(client) == "miss"
+    assert completions.stats()["entries"] == 2
+
+
+@pytest.mark.parametrize("ttl", [0, -1])
+def test_zero_ttl_disables_the_cache(ttl):
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=ttl)
+
+    @run
+    async def main(client):
+        client.release.set()
+        await completions.complete(payload())
+        return (await completions.complete(payload()))[1]
+
+    assert main(client) == "miss"
+    assert client.calls == 2
+
+
+def test_flight_tasks_are_kept_until_done():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        call = asyncio.ensure_future(completions.complete(payload()))
+        await asyncio.sleep(0)
+        running = len(completions._tasks)
+        client.release.set()
+        await call
+        await asyncio.sleep(0)
+        return running, len(completions._tasks)
+
+    assert main(client) == (1, 0)
+
+
+def test_abandoned_bypass_call_is_cancelled():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        call = asyncio.ensure_future(completions.complete(payload(), cache=False))
+        _, tokens = completions.stream(payload("other"), cache=False)
+        reader = asyncio.ensure_future(tokens.__anext__())
+        await asyncio.sleep(0)
+        tasks = set(completions._tasks)
+        call.cancel()
+        reader.cancel()
+        await asyncio.gather(call, reader, return_exceptions=True)
+        await tokens.aclose()
+        await asyncio.sleep(0)
+        return tasks
+
+    tasks = main(client)
+    assert len(tasks) == 2 and all(task.cancelled() for task in tasks)
+    assert completions.stats()["abandoned"] == 2
+
+
+def test_abandoned_shared_call_keeps_running():
+    client = FakeClient()
+    completions = CoalescingCompletions(client, ttl=60)
+
+    @run
+    async def main(client):
+        call = asyncio.ensure_future(completions.complete(payload()))
+        await asyncio.sleep(0)
+        call.cancel()
+        await asyncio.sleep(0)
+        client.release.set()
+        return await completions.complete(payload())
+
+    assert main(client) == ("Normal chest.", "coalesced")
+    assert client.calls == 1
+    assert completions.stats()["abandoned"] == 0
+
+
+def stub_client(max_retries=3, **stub_options):
+    # An LLMClient talking to the OpenRouter stub in-process, with no backoff
+    stub = create_app(first_token_ms=0, token_ms=0, **stub_options)
+    client = LLMClient(url="http://stub/v1/chat/completions", api_key="test", max_retries=max_retries, backoff=0,
+                       transport=httpx.ASGITransport(app=stub))
+    return client, stub
+
+
+def delays(client):
+    # Records every backoff delay the client picks
+    picked = []
+    pick = client._delay
+
+    def record(*args):
+        picked.append(pick(*args))
+        return picked[-1]
+
+    client._delay = record
+    return picked
+
+
+def collect(client, stream):
+    async def main():
+        try:
+            if stream:
+                return [token async for token in client.stream(payload())]
+            return await client.complete(payload())
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_transient_errors_are_retried(stream):
+    client, stub = stub_client(fail_first=2)
+    answer = collect(client, stream)
+    assert "".join(answer) == REPORT + " "
+    assert stub.state.calls == 3
+    assert (client.requests, client.retries, client.failures) == (3, 2, 0)
+
+
+def test_retry_after_is_honoured_on_429():
+    client, stub = stub_client(fail_first=1, fail_status=429, retry_after="0.01")
+    picked = delays(client)
+    assert collect(client, stream=False) == REPORT + " "
+    assert picked == [0.01]
+    assert stub.state.calls == 2
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_gives_up_after_max_retries(stream):
+    client, stub = stub_client(max_retries=2, fail_every=1)
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        collect(client, stream)
+    assert error.value.response.status_code == 503
+    assert stub.state.calls == 3
+    assert (client.retries, client.failures) == (2, 1)
+
+
+def test_client_errors_are_not_retried():
+    client, stub = stub_client(fail_first=1, fail_status=400)
+    with pytest.raises(httpx.HTTPStatusError):
+        collect(client, stream=False)
+    assert (stub.state.calls, client.retries) == (1, 0)
+
+
+def test_stream_yields_each_chunk_and_skips_comments():
+    client, _ = stub_client()
+    tokens = collect(client, stream=True)
+    assert tokens == [word + " " for word in REPORT.split()]
+    assert client.stats()["streams"] == 1
+
+
+def test_new_event_loop_closes_the_old_client():
+    client, _ = stub_client()
+
+    async def complete():
+        await client.complete(payload())
+        return client._client
+
+    first = asyncio.run(complete())
+    second = asyncio.run(complete())
+    assert first is not second
+    assert first.is_closed and not second.is_closed
+    asyncio.run(client.aclose())
@@ -0,0 +1,123 @@
+import base64
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.pagination import decode_cursor, encode_cursor
+from app.db.session import SessionLocal
+from app.models.analysis import Analysis
+from app.models.report import Report
+
+
+def test_cursor_round_trip_keeps_datetimes():
+    created_at = datetime(2024, 3, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor([created_at, 42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, [Report.created_at, Report.id]) == [created_at, 42]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+    encode_cursor([1]),
+    encode_cursor(["yesterday", 1]),
+])
+def test_bad_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, [Report.created_at, Report.id])
+    assert error.value.status_code == 400
+
+
+def pages(client, auth, path, limit):
+    # Every page of a listing, following X-Next-Cursor
+    seen, params = [], {"limit": limit}
+    while True:
+        response = client.get(path, params=params, headers=auth)
+        assert response.status_code == 200
+        seen.append([row["id"] for row in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            assert "Link" not in response.headers
+            return seen
+        assert f"cursor={cursor}" in response.headers["Link"]
+        params = {"limit": limit, "cursor": cursor}
+
+
+def test_reports_walk_newest_first_without_gaps(client, auth, patient):
+    ids = [
+        client.post("/api/reports/", json={"patient_id": patient["id"], "author_id": 1, "content": f"r{i}"},
+                    headers=auth).json()["id"]
+        for i in range(7)
+    ]
+    seen = pages(client, auth, f"/api/reports/patient/{patient['id']}", limit=3)
+    assert [len(page) for page in seen] == [3, 3, 1]
+    assert sum(seen, []) == ids[::-1]
+
+
+def test_patients_walk_in_id_order(client, auth):
+    for i in range(5):
+        client.post("/api/patients/", json={"name": f"P{i}"}, headers=auth)
+    ids = sum(pages(client, auth, "/api/patients/", limit=2), [])
+    assert ids == sorted(ids)
+    assert len(ids) == len(set(ids)) >= 5
+
+
+@pytest.mark.parametrize("path", ["/api/patients/", "/api/reports/", "/api/analyses/patient/1"])
+def test_bad_cursor_on_a_listing_is_a_400(client, auth, path):
+    response = client.get(path, params={"cursor": "garbage"}, headers=auth)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def timeline_pages(client, auth, patient_id, limit):
+    # Every page of a patient's timeline as (kind, id) pairs, following next_cursor
+    seen, params = [], {"limit": limit}
+    while True:
+        response = client.get(f"/api/patients/{patient_id}/timeline", params=params, headers=auth)
+        assert response.status_code == 200
+        body = response.json()
+        seen.append([(event["kind"], event["id"]) for event in body["events"]])
+        assert response.headers.get("X-Next-Cursor") == body["next_cursor"]
+        if body["next_cursor"] is None:
+            return seen
+        params = {"limit": limit, "cursor": body["next_cursor"]}
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 20])
+def test_timeline_merges_kinds_with_equal_timestamps(client, auth, patient, limit):
+    reports = [client.post("/api/reports/", json={"patient_id": patient["id"], "author_id": 1, "content": f"r{i}"},
+                           headers=auth).json()["id"] for i in range(3)]
+    analyses = [client.post("/api/analyses/", json={"patient_id": patient["id"], "findings": f"a{i}"},
+                            headers=auth).json()["id"] for i in range(4)]
+    # Two timestamps shared by both kinds, so the cursor has to break ties on kind and id
+    earlier, later = datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 9)
+    db = SessionLocal()
+    try:
+        for model, ids in ((Report, reports), (Analysis, analyses)):
+            for i, row_id in enumerate(ids):
+                db.get(model, row_id).created_at = later if i % 2 else earlier
+        db.commit()
+    finally:
+        db.close()
+
+    seen = timeline_pages(client, auth, patient["id"], limit)
+    assert all(len(page) == limit for page in seen[:-1])
+    expected = sorted(
+        [(later if i % 2 else earlier, "report", row_id) for i, row_id in enumerate(reports)]
+        + [(later if i % 2 else earlier, "analysis", row_id) for i, row_id in enumerate(analyses)],
+        reverse=True,
+    )
+    assert sum(seen, []) == [(kind, row_id) for _, kind, row_id in expected]
+
+
+def test_timeline_rejects_a_cursor_of_another_shape(client, auth, patient):
+    url = f"/api/patients/{patient['id']}/timeline"
+    for cursor in ("garbage", encode_cursor([datetime(2024, 1, 1), "patient", 1])):
+        response = client.get(url, params={"cursor": cursor}, headers=auth)
+        assert response.status_code == 400
+
+
+def test_limit_is_capped(client, auth):
+    assert client.get("/api/patients/", params={"limit": 100000}, headers=auth).status_code == 422
@@ -0,0 +1,140 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import app.core.compression as compression
+from app.core import responses
+from app.core.compression import CompressionMiddleware, choose_encoding
+
+
+def test_unchanged_patient_is_a_304(client, auth, patient):
+    url = f"/api/patients/{patient['id']}"
+    first = client.get(url, headers=auth)
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = client.get(url, headers=dict(auth, **{"If-None-Match": etag}))
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}", "{strong}", '"other", {etag}', "*",
+])
+def test_if_none_match_uses_weak_comparison(client, auth, patient, if_none_match):
+    url = f"/api/patients/{patient['id']}"
+    etag = client.get(url, headers=auth).headers["ETag"]
+    header = if_none_match.format(etag=etag, strong=etag.removeprefix("W/"))
+    assert client.get(url, headers=dict(auth, **{"If-None-Match": header})).status_code == 304
+
+
+def test_update_changes_the_etag(client, auth, patient):
+    url = f"/api/patients/{patient['id']}"
+    etag = client.get(url, headers=auth).headers["ETag"]
+    client.put(url, json={"name": "Jane Doe", "dob": "1980-05-17"}, headers=auth)
+    response = client.get(url, headers=dict(auth, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.json()["name"] == "Jane Doe"
+    assert response.headers["ETag"] != etag
+
+
+def test_report_etag_follows_updated_at(client, auth, patient):
+    report = client.post("/api/reports/", json={"patient_id": patient["id"], "author_id": 1, "content": "draft"},
+                         headers=auth).json()
+    url = f"/api/reports/{report['id']}"
+    etag = client.get(url, headers=auth).headers["ETag"]
+    assert client.get(url, headers=dict(auth, **{"If-None-Match": etag})).status_code == 304
+    client.put(url, json={"patient_id": patient["id"], "author_id": 1, "content": "final"}, headers=auth)
+    assert client.get(url, headers=dict(auth, **{"If-None-Match": etag})).status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/api/patients/{id}", "/api/reports/patient/{id}", "/api/analyses/patient/{id}"])
+def test_skipping_validation_gives_the_same_body(client, auth, patient, monkeypatch, path):
+    client.post("/api/reports/", json={"patient_id": patient["id"], "author_id": 1, "content": "x"}, headers=auth)
+    client.post("/api/analyses/", json={"patient_id": patient["id"], "findings": "{'Edema': 0.4}"}, headers=auth)
+    url = path.format(id=patient["id"])
+    validated = client.get(url, headers=auth)
+    monkeypatch.setattr(responses, "RESPONSE_VALIDATION", False)
+    fast = client.get(url, headers=auth)
+    assert fast.status_code == validated.status_code == 200
+    assert fast.json() == validated.json()
+    assert fast.headers.get("ETag") == validated.headers.get("ETag")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+    ("gzip;q=0", None),
+    ("", None),
+])
+def test_choose_encoding(accept, expected):
+    if compression.brotli is None:
+        pytest.skip("brotli is not installed")
+    assert choose_encoding(accept) == expected
+
+
+@pytest.fixture
+def compressed_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    def big():
+        return PlainTextResponse("row\n" * 1000, headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("tiny")
+
+    @app.get("/image")
+    def image():
+        return PlainTextResponse("x" * 1000, media_type="image/png")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((f"line {i}\n" * 50 for i in range(5)), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+def test_large_body_is_gzipped_with_a_weak_etag(compressed_client):
+    response = compressed_client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == 'W/"v1"'
+    assert response.text == "row\n" * 1000
+
+
+def test_small_and_precompressed_bodies_are_sent_as_they_are(compressed_client):
+    for path in ("/small", "/image"):
+        response = compressed_client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+
+def test_streamed_chunks_can_be_decoded_as_they_arrive(compressed_client):
+    with compressed_client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = [decoder.decompress(chunk) for chunk in response.iter_raw()]
+    # Every chunk was flushed, so none of them decodes to nothing
+    assert all(chunks[:-1])
+    assert b"".join(chunks).decode() == "".join(f"line {i}\n" * 50 for i in range(5))
+
+
+def test_brotli_when_accepted(compressed_client):
+    brotli = pytest.importorskip("brotli")
+    with compressed_client.stream("GET", "/big", headers={"Accept-Encoding": "br"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(raw) == b"row\n" * 1000
+    assert raw != gzip.compress(b"row\n" * 1000)
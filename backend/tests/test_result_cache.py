@@ -0,0 +1,103 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.inference import backends, models
+from app.inference.cache import ResultCache, cache_key
+
+
+def png(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (64, 64), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_key_ignores_param_order_but_not_values():
+    key = cache_key("abc", "model@1", {"size": 224, "mode": "L"})
+    assert key == cache_key("abc", "model@1", {"mode": "L", "size": 224})
+    assert key != cache_key("abd", "model@1", {"mode": "L", "size": 224})
+    assert key != cache_key("abc", "model@2", {"mode": "L", "size": 224})
+    assert key != cache_key("abc", "model@1", {"mode": "L", "size": 512})
+
+
+def test_model_version_follows_weights_file_and_backend(tmp_path, monkeypatch):
+    weights = tmp_path / "weights.pt"
+    weights.write_bytes(b"v1")
+    monkeypatch.setitem(models.WEIGHTS_FILES, "classifier", str(weights))
+    before = models.model_version("classifier")
+    weights.write_bytes(b"version 2")
+    assert models.model_version("classifier") != before
+
+    monkeypatch.setattr(backends, "AI_CLASSIFIER_BACKEND", "torchscript")
+    assert "+torchscript@" in models.model_version("classifier")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, directory=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    ResultCache(max_entries=4, directory=str(tmp_path)).put("k" * 64, {"Effusion": 0.5})
+    fresh = ResultCache(max_entries=4, directory=str(tmp_path))
+    assert fresh.get("k" * 64) == {"Effusion": 0.5}
+    assert fresh.stats()["disk_hits"] == 1
+
+
+def test_corrupt_disk_entry_is_a_miss(tmp_path):
+    cache = ResultCache(max_entries=4, directory=str(tmp_path))
+    key = "f" * 64
+    os.makedirs(tmp_path / key[:2])
+    (tmp_path / key[:2] / f"{key}.json").write_text("{not json")
+    assert cache.get(key) is None
+    assert cache.stats()["disk_errors"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(max_entries=0, directory=None)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_analyze_image_hits_the_cache_until_weights_change(client, fake_classifier):
+    weights, calls = fake_classifier
+    image = png(1)
+
+    def analyze():
+        response = client.post("/api/ai/analyze-image", files={"file": ("x.png", image, "image/png")})
+        assert response.status_code == 200
+        return response.headers["X-Inference-Cache"], response.json()["scores"]
+
+    assert analyze() == ("miss", {"Effusion": 0.25})
+    assert analyze() == ("hit", {"Effusion": 0.25})
+    assert calls == [1]
+
+    # New weights mean a new model version, so the old entry is never hit again
+    weights.write_bytes(b"weights version 2")
+    assert analyze()[0] == "miss"
+    assert calls == [1, 1]
+
+
+def test_same_pixels_in_another_file_are_a_different_entry(client, fake_classifier):
+    _, calls = fake_classifier
+    first = png(2)
+    pixels = np.asarray(Image.open(io.BytesIO(first)))
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=0)
+    for data in (first, buffer.getvalue()):
+        response = client.post("/api/ai/analyze-image", files={"file": ("x.png", data, "image/png")})
+        assert response.headers["X-Inference-Cache"] == "miss"
+    assert len(calls) == 2
+    assert json.loads(response.content)["scores"] == {"Effusion": 0.25}
@@ -0,0 +1,89 @@
+import uuid
+
+import pytest
+
+from app.core.search import fts5_query
+from app.db.session import SessionLocal
+from app.models.analysis import Analysis
+
+
+@pytest.fixture
+def word():
+    # A word no other test writes, since the database is shared
+    return "zq" + uuid.uuid4().hex[:10]
+
+
+def hits(client, auth, q, **params):
+    response = client.get("/api/search/", params=dict(params, q=q), headers=auth)
+    assert response.status_code == 200
+    return [(hit["kind"], hit["id"]) for hit in response.json()]
+
+
+def new_report(client, auth, patient, content):
+    return client.post("/api/reports/", json={"patient_id": patient["id"], "author_id": 1, "content": content},
+                       headers=auth).json()["id"]
+
+
+def test_fts5_query_quotes_every_word():
+    assert fts5_query('pleural effus* OR "x" -y') == '"pleural" "effus"* "OR" "x" "y"'
+    assert fts5_query("!!") == ""
+
+
+def test_report_index_follows_update_and_delete(client, auth, patient, word):
+    other = "zq" + uuid.uuid4().hex[:10]
+    report_id = new_report(client, auth, patient, f"small {word} noted")
+    assert hits(client, auth, word) == [("report", report_id)]
+
+    client.put(f"/api/reports/{report_id}", json={"patient_id": patient["id"], "author_id": 1,
+                                                  "content": f"now {other}"}, headers=auth)
+    assert hits(client, auth, word) == []
+    assert hits(client, auth, other) == [("report", report_id)]
+
+    assert client.delete(f"/api/reports/{report_id}", headers=auth).status_code == 200
+    assert hits(client, auth, other) == []
+
+
+def test_analysis_index_follows_update_and_delete(client, auth, patient, word):
+    analysis_id = client.post("/api/analyses/", json={"patient_id": patient["id"], "findings": f"{word} seen"},
+                              headers=auth).json()["id"]
+    assert hits(client, auth, word, kind="analysis") == [("analysis", analysis_id)]
+    assert hits(client, auth, word, kind="report") == []
+
+    db = SessionLocal()
+    try:
+        analysis = db.get(Analysis, analysis_id)
+        analysis.findings = "nothing"
+        db.commit()
+        assert hits(client, auth, word) == []
+
+        analysis.findings = f"{word} again"
+        db.commit()
+        assert hits(client, auth, word) == [("analysis", analysis_id)]
+
+        db.delete(analysis)
+        db.commit()
+    finally:
+        db.close()
+    assert hits(client, auth, word) == []
+
+
+def test_results_page_by_rank_and_filter_by_patient(client, auth, patient, word):
+    ids = {new_report(client, auth, patient, f"{word} " * (i + 1)) for i in range(5)}
+    seen, params = [], {"limit": 2}
+    while True:
+        response = client.get("/api/search/", params=dict(params, q=word), headers=auth)
+        seen += [hit["id"] for hit in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["cursor"] = cursor
+    assert set(seen) == ids and len(seen) == 5
+    assert hits(client, auth, word, patient_id=patient["id"] + 1000) == []
+
+
+def test_prefix_match_and_highlight(client, auth, patient, word):
+    report_id = new_report(client, auth, patient, f"the {word} is stable")
+    response = client.get("/api/search/", params={"q": word[:6] + "*"}, headers=auth).json()
+    assert report_id in [hit["id"] for hit in response]
+    hit = next(hit for hit in response if hit["id"] == report_id)
+    assert f"<mark>{word}</mark>" in hit["headline"]
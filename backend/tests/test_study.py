@@ -0,0 +1,85 @@
+import hashlib
+import io
+import json
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+from app.core.blobstore import blob_store
+from app.db.session import SessionLocal
+from app.models.analysis import Analysis
+
+
+def png(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (64, 64), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def archive(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def analyze_study(client, auth, patient, data: bytes, **form):
+    response = client.post("/api/ai/analyze-study", headers=auth,
+                           data=dict({"patient_id": patient["id"]}, **form),
+                           files={"archive": ("study.zip", data, "application/zip")})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    # Every line is a JSON document of its own
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_study_streams_results_and_persists_the_good_ones(client, auth, patient, fake_classifier):
+    images = {"a.png": png(101), "b.png": png(102), "broken.png": b"\x89PNG\r\n\x1a\n truncated"}
+    members = dict(images, **{"__MACOSX/._a.png": b"resource fork", ".DS_Store": b""})
+    lines = analyze_study(client, auth, patient, archive(members), persist="true")
+
+    *results, summary = lines
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
+    by_name = {result["filename"]: result for result in results}
+    assert set(by_name) == set(images)
+    assert by_name["broken.png"]["error"] == "Unsupported or corrupt image"
+    for name in ("a.png", "b.png"):
+        assert by_name[name]["findings"] == {"Effusion": 0.25}
+        assert by_name[name]["sha256"] == by_name[name]["image_sha256"] == hashlib.sha256(images[name]).hexdigest()
+
+    assert summary["done"] is True
+    assert (summary["images"], summary["errors"]) == (3, 1)
+    db = SessionLocal()
+    try:
+        rows = db.query(Analysis).filter(Analysis.id.in_(summary["analysis_ids"])).all()
+    finally:
+        db.close()
+    assert len(rows) == len(summary["analysis_ids"]) == 2
+    assert {row.patient_id for row in rows} == {patient["id"]}
+    assert {row.image_sha256 for row in rows} == {by_name[name]["sha256"] for name in ("a.png", "b.png")}
+    assert all(row.scores == {"Effusion": 0.25} for row in rows)
+    assert all(blob_store.exists(row.image_sha256) for row in rows)
+
+
+def test_study_without_persist_writes_nothing(client, auth, patient, fake_classifier):
+    lines = analyze_study(client, auth, patient, archive({"c.png": png(103)}))
+    result, summary = lines
+    assert "image_sha256" not in result
+    assert (summary["images"], summary["errors"]) == (1, 0)
+    assert "analysis_ids" not in summary
+
+
+def test_bad_archive_is_a_400(client, auth, patient):
+    response = client.post("/api/ai/analyze-study", headers=auth, data={"patient_id": patient["id"]},
+                           files={"archive": ("study.zip", b"not a zip", "application/zip")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Archive is not a valid zip file"
+
+
+def test_persist_needs_an_existing_patient(client, auth, fake_classifier):
+    response = client.post("/api/ai/analyze-study", headers=auth, data={"patient_id": 10 ** 9, "persist": "true"},
+                           files={"archive": ("study.zip", archive({"d.png": png(104)}), "application/zip")})
+    assert response.status_code == 404